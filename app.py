@@ -1,15 +1,48 @@
-from initdb import db
-from flask import Flask
+from initdb import db, configure_storage, apply_pragmas
+import commands
+from cache import BoardCache, board_cache
+from changes import ChangeFeed, change_feed
+from groupcommit import GroupCommit, group_commit
+from positions import PositionRebalancer, position_rebalancer
+from instrumentation import Instrumentation, timed_representation
+from serializers import output_json
+from flask import Flask, Response, request
 from sqlite3 import IntegrityError
+from sqlalchemy import delete, insert, update
 from flask_restful import Api, Resource
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///minimalboard.db'
-api = Api(app)
-db.init_app(app)
-
-with app.app_context():
-    from models import *
-    from utilities import *
+from models import *
+from utilities import *
+
+api = Api()
+api.representations['application/json'] = timed_representation(output_json)
+
+
+def create_app(config=None):
+    """
+    The create_app function builds the Flask application: it reads the config, sets up the database, the extensions
+    and the maintenance commands and registers the resources of api with the app. Every app gets extensions of its
+    own, so apps built in the same process share no settings or state. It does not connect to the
+    database, so a server can import the app and fork its workers before any connection is opened. The schema is
+    created and migrated by the init-db command, not on startup.
+    :param config: A dictionary of config values, applied over the MINIMALBOARD_* environment variables
+    :return: The Flask application
+    """
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///minimalboard.db'
+    app.config.from_prefixed_env('MINIMALBOARD')
+    app.config.update(config or {})
+    configure_storage(app)
+    db.init_app(app)
+    apply_pragmas(app)
+    cache = BoardCache()
+    cache.init_app(app)
+    ChangeFeed().init_app(app, cache)
+    PositionRebalancer().init_app(app, db)
+    GroupCommit().init_app(app, db)
+    Instrumentation().init_app(app, db)
+    commands.init_app(app)
+    api.init_app(app)
+    return app
 
 
 class UserResource(Resource):
@@ -50,38 +83,32 @@ class BoardResource(Resource):
             'url': board.url,
             'users_assigned' : [user_ids], # list of user ids assigned to this particular Board instance
 
+        The serialized board is kept in the board cache and served with an ETag, both keyed by the last change in the
+        change log of the board, which is read first. A request with a matching If-None-Match header gets a 304, and
+        no worker serves a board another worker or process has changed since.
         :param board_id: Get the board from the database
         :return: A dictionary with the board's id, name, privacy status (public or private), url and a list of users assigned to it
         """
-        board = get_board(board_id)
-        user_list = [user.id for user in board.users]
-        board_data = {
-            'id': board.id,
-            'name': board.name,
-            'privacy': board.privacy,
-            'url': board.url,
-            'users_assigned': user_list,
-            'board_lists' : []
-        }
-        board_lists = BoardList.query.filter_by(board_id=board.id).all()
-        for board_list in board_lists:
-            board_list_data = {
-                'board_list_id': board_list.id,
-                'board_list_name': board_list.name,
-                'cards': []
+        select_board_shard(board_id)
+        version = load_board_changes(board_id, -1)['seq']
+        snapshot = board_cache.get(board_id, version)
+        if snapshot is None:
+            board = get_board(board_id)
+            tree = load_board_trees([board.id])[board.id]
+            board_data = {
+                'id': board.id,
+                'name': board.name,
+                'privacy': board.privacy,
+                'url': board.url,
+                'users_assigned': tree['users'],
+                'board_lists': tree['board_lists']
             }
-            cards = Card.query.filter_by(board_list_id=board_list.id).all()
-            for card in cards:
-                user = card.user_id or None
-                card_data = {
-                    'card_id': card.id,
-                    'card_name': card.name,
-                    'card_description': card.description,
-                    'assigned_user': user
-                }
-                board_list_data['cards'].append(card_data)
-            board_data['board_lists'].append(board_list_data) 
-        return board_data
+            body = api.make_response(board_data, 200).get_data()
+            snapshot = board_cache.put(board_id, version, body)
+        etag, body = snapshot
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        return response.make_conditional(request)
     
     def post(self):
         """
@@ -89,13 +116,14 @@ class BoardResource(Resource):
         :return: a dictionary with success/failure message along with status
         """
         args = board_parser.parse_args()
-        existing_board = Board.query.filter_by(name=args['name']).first()
-        if existing_board:
+        if board_name_exists(args['name']):
             return {'message': f'Board with name {args["name"]} already exists. Please choose a different name.'}, 409
         board = Board(name=args['name'], privacy=args['privacy'])
+        board.id = place_board()
         db.session.add(board)
         db.session.flush()
         board.generate_url()
+        board_cache.bump(board.id)
         return {'message': 'Board created successfully'}, 201
 
     def patch(self, board_id):
@@ -107,16 +135,14 @@ class BoardResource(Resource):
         :return: a dictionary with success/failure message along with status
         """
         board = get_board(board_id)
-        parser = reqparse.RequestParser()
-        parser.add_argument('user_ids', type=int, action='append', required=True, help="User IDs are required.")
-        args = parser.parse_args()
+        args = board_users_parser.parse_args()
 
         for user_id in args['user_ids']:
             user = get_user(user_id)
-            if user not in board.users:
-                board.users.append(user)
+            add_board_member(board.id, user.id)
 
         db.session.commit()
+        board_cache.bump(board.id)
         return {'message': 'Board users updated successfully'}, 200
 
     def put(self, board_id):
@@ -132,6 +158,7 @@ class BoardResource(Resource):
         board.name = args['name']
         board.privacy = args['privacy']
         db.session.commit()
+        board_cache.bump(board.id)
         return {'message': 'Board updated successfully'}, 200
 
     def delete(self, board_id):
@@ -145,9 +172,90 @@ class BoardResource(Resource):
         board = get_board(board_id)
         db.session.delete(board)
         db.session.commit()
+        board_cache.bump(board_id)
         return {'message': 'Board deleted successfully'}, 200
 
 
+class BoardChangesResource(Resource):
+
+    def get(self, board_id):
+        """
+        The get function returns the changes made to a board, its members, lists and cards since the sequence number
+        given as ?since=, each with the current state of the row, so a client holding a board can apply them instead
+        of fetching the whole board again. The response carries the sequence number to pass as since next time.
+        With ?wait=<seconds> the request waits for a change when there is none yet (long polling), and ?since=-1
+        returns the current sequence number only, to be read before loading the board.
+        When the changes after since are no longer in the log the response is a 410 asking the client to reload the
+        board, with the current sequence number.
+        :param board_id: The id of the board
+        :return: A dictionary with the sequence number, whether more changes are waiting and the list of changes
+        """
+        args = changes_parser.parse_args()
+        if args['limit'] < 1:
+            abort(400, message="Limit must be a positive integer.")
+        limit = min(args['limit'], MAX_CHANGES_PAGE)
+        select_board_shard(board_id)
+        exists = db.session.get(Board, board_id) is not None
+        wait = args['wait'] if exists and args['since'] >= 0 else 0
+        page = change_feed.poll(lambda: load_board_changes(board_id, args['since'], limit), wait,
+                                release=db.session.rollback)
+        if page is None:
+            seq = load_board_changes(board_id, -1)['seq']
+            return {'message': 'Resync required. Reload the board and follow its changes from seq.', 'seq': seq}, 410
+        if not exists and not page['changes']:
+            abort(404, message="Board not found.")
+        return {'board_id': board_id, 'seq': page['seq'], 'more': page['more'], 'changes': page['changes']}
+
+
+class BoardStatsResource(Resource):
+
+    def get(self, board_id):
+        """
+        The get function returns the number of cards on a board, in each of its lists and assigned to each user.
+        The counts are maintained as cards are written, so this never counts cards.
+        :param board_id: The id of the board
+        :return: A dictionary of card counts
+        """
+        select_board_shard(board_id)
+        stats = load_board_stats(board_id)
+        if stats is None:
+            abort(404, message="Board not found.")
+        return stats
+
+
+class BoardExportResource(Resource):
+
+    def get(self, board_id):
+        """
+        The get function streams a board with its members, lists and cards as newline delimited JSON, one record per
+        line, in the format accepted by /boards/import. The records are read from the database as they are sent.
+        :param board_id: The id of the board
+        :return: A streaming application/x-ndjson response
+        """
+        board = get_board(board_id)
+        return ndjson_response(export_board_rows(board.id))
+
+
+class BoardImportResource(Resource):
+
+    def post(self):
+        """
+        The post function creates a new board from a board export sent as the request body, read and written in
+        chunks as it arrives. Users are matched by email, and created when they do not exist yet. The board keeps
+        its exported name unless ?name= gives another one.
+        :return: A dictionary with the id of the new board and the number of users created, board lists and cards
+        """
+        args = import_parser.parse_args()
+        try:
+            result = import_board_rows(request.stream, name=args['name'])
+        except ValueError as error:
+            db.session.rollback()
+            abort(400, message=str(error))
+        db.session.commit()
+        board_cache.bump(result['board_id'])
+        return dict(result, message='Board imported successfully'), 201
+
+
 class BoardListResource(Resource):
 
     def get(self, board_list_id):
@@ -161,18 +269,8 @@ class BoardListResource(Resource):
             'id': board_list.id,
             'name': board_list.name,
             'board_id': board_list.board_id,
-            'cards':[]
-            }
-        cards = Card.query.filter_by(board_list_id=board_list_id).all()
-        for card in cards:
-            user = card.user_id or None
-            card_data = {
-                'card_id': card.id,
-                'card_name': card.name,
-                'card_description': card.description,
-                'assigned_user': user
+            'cards': load_board_list_cards(board_list.id)
             }
-            board_list_data['cards'].append(card_data)
         return board_list_data
 
     def post(self):
@@ -184,18 +282,21 @@ class BoardListResource(Resource):
         :return: a dictionary with success/failure message along with status
         """
         args = board_list_parser.parse_args()
+        select_board_shard(args['board_id'])
         existing_board = Board.query.filter_by(id=args['board_id']).first()
         if not existing_board:
             return {'message': f'Board with board id {args["board_id"]} does not exist'}, 500
         if BoardList.query.filter_by(board_id=args['board_id'], name=args['name']).first():
             return {'message': 'A board list with the same name already exists within the board.'}, 409
-        board_list = BoardList(name=args['name'], board_id=args['board_id'])
+        board_list = BoardList(name=args['name'], board_id=args['board_id'],
+                               position=board_list_position(args['board_id']))
         db.session.add(board_list)
         try:
             db.session.commit()
         except IntegrityError:
             db.session.rollback()
             return {'message': 'An error occurred while creating the board list.'}, 500            
+        board_cache.bump(board_list.board_id)
         return {'message': 'Board list created successfully.', 'board_list_id': board_list.id}, 201
 
     def put(self,board_list_id):
@@ -206,14 +307,14 @@ class BoardListResource(Resource):
         :param board_list_id: Identify the board list that is being updated
         :return: A dictionary with the board list id and name that was updated
         """
-        parser = reqparse.RequestParser()
-        parser.add_argument('name', type=str, required=True)
-        args = parser.parse_args()
+        args = update_board_list_parser.parse_args()
+        select_row_shard(BoardList, board_list_id)
         board_list = BoardList.query.get(board_list_id)
         if not board_list:
             return {'message': 'Board list not found'}, 404
         board_list.name = args['name']
         db.session.commit()
+        board_cache.bump(board_list.board_id)
         return {
             'board_list_id': board_list.id,
             'board_list_name': board_list.name
@@ -230,6 +331,7 @@ class BoardListResource(Resource):
         board_list = get_board_list(board_list_id)
         db.session.delete(board_list)
         db.session.commit()
+        board_cache.bump(board_list.board_id)
         return {'message': 'Board list deleted successfully'}, 200
 
 
@@ -261,18 +363,36 @@ class CardResource(Resource):
         :return: A tuple of the message and a status code
         """
         args = card_parser.parse_args()
+        if group_commit.enabled:
+            response, board_id = group_commit.submit(self.create, args)
+        else:
+            response, board_id = self.create(args)
+            if board_id is not None:
+                db.session.commit()
+        if board_id is not None:
+            board_cache.bump(board_id)
+        return response
+
+    @staticmethod
+    def create(args):
+        """
+        The create function adds the card described by the parsed arguments to the session without committing it, so
+        it can run on its own or as part of a group commit.
+        :param args: The parsed card arguments
+        :return: A tuple of the response and the id of the changed board, which is None when nothing was added
+        """
         board_list = get_board_list(args['board_list_id'])
         board_id = board_list.board_id
-        board = get_board(board_id)
-        card = Card(name=args['name'], description=args['description'], board_list=board_list)
+        user = None
         if args['user_id']:
             user = get_user(args['user_id'])
-            if user not in board.users:
-                return {'message': f'Add user to {board.name} board to access within card'}, 500
-            card.user = user
+            if not is_board_member(board_id, user.id):
+                return ({'message': f'Add user to {get_board(board_id).name} board to access within card'}, 500), None
+        card = Card(name=args['name'], description=args['description'], board_list=board_list,
+                    position=card_position(board_list.id))
+        card.user = user
         db.session.add(card)
-        db.session.commit()
-        return {'message': 'Card created successfully'}, 201
+        return ({'message': 'Card created successfully'}, 201), board_id
 
     def put(self, card_id):
         """
@@ -281,41 +401,60 @@ class CardResource(Resource):
         - name (string): The new name of the card. If not provided, then it will remain unchanged.
         - description (string): The new description of the card. If not provided, then it will remain unchanged. 
         - board_list_id (int): The id of a board_list that is in this same board as this card's current list to move to that list instead.
+        - before / after (int): The id of a card to place this card right before or after, in the card's list or in
+          board_list_id. A card moved to another list without either is placed at the end of it.
         :param card_id: Get the card from the database
         :return: a dictionary with success/failure message along with status
         """
         card = get_card(card_id)
         if not card:
             return {'message': f'Card with card id {card_id} does not exist'}, 500
-        board_list_id = card.board_list_id
-        board_list = get_board_list(board_list_id)
-        board_id = board_list.board_id
-        board = get_board(board_id)
+        board_id = get_board_list(card.board_list_id).board_id
         args = update_card_parser.parse_args()
+        if args['before'] is not None and args['after'] is not None:
+            return {'message': 'Only one of before and after can be given.'}, 400
+        sibling_id = args['before'] if args['before'] is not None else args['after']
+        if sibling_id == card.id:
+            return {'message': 'Cannot place a card before or after itself.'}, 400
+
         if args['name']:
             card.name = args['name']
 
         if args['description']:
             card.description = args['description']
 
+        board_list_id = card.board_list_id
+        if sibling_id is not None:
+            board_list_id = get_card(sibling_id).board_list_id
         if args['board_list_id']:
             board_list = get_board_list(args['board_list_id'])
-            if board_list in board.board_lists:
-                card.board_list_id = board_list.id
-            else:
+            if board_list.board_id != board_id:
                 return {'message': f'Cannot assign card to board list that is not in the same board'}, 500 
+            if sibling_id is not None and board_list_id != board_list.id:
+                return {'message': 'The card to place it next to is not in that board list.'}, 400
+            board_list_id = board_list.id
+        elif board_list_id != card.board_list_id and get_board_list(board_list_id).board_id != board_id:
+            return {'message': f'Cannot assign card to board list that is not in the same board'}, 500
 
         if args['user_id']:
             if args['user_id'] != -1:
                 user = get_user(args['user_id'])
-                if user not in board.users:
-                    return {'message': f'Add user to {board.name} board to access within card'}, 500
+                if not is_board_member(board_id, user.id):
+                    return {'message': f'Add user to {get_board(board_id).name} board to access within card'}, 500
                 card.user = user
                 card.user_id = user.id
             else:
                 card.user = None
                 card.user_id = None
+
+        moved = sibling_id is not None or board_list_id != card.board_list_id
+        if moved:
+            card.position = card_position(board_list_id, card.id, args['before'], args['after'])
+            card.board_list_id = board_list_id
         db.session.commit()
+        board_cache.bump(board_id)
+        if moved:
+            position_rebalancer.check(card.position, rebalance_card_positions, board_list_id)
         return {'message': 'Card updated successfully'}, 200
 
     def delete(self, card_id):
@@ -326,45 +465,102 @@ class CardResource(Resource):
         :return: a dictionary with success/failure message along with status
         """
         card = get_card(card_id)
+        board_id = get_board_list(card.board_list_id).board_id
         db.session.delete(card)
         db.session.commit()
+        board_cache.bump(board_id)
         return {'message': 'Card deleted successfully'}, 200
     
+class CardBatchResource(Resource):
+
+    def post(self):
+        """
+        The post function applies a batch of card operations in a single transaction.
+        The request body holds a list of operations under the 'operations' key, each one of:
+        - {'op': 'create', 'name', 'description', 'board_list_id', 'user_id'}
+        - {'op': 'update', 'card_id', 'name', 'description', 'board_list_id', 'user_id'}
+        - {'op': 'move', 'card_id', 'board_list_id'}, which places the card at the end of the list
+        - {'op': 'delete', 'card_id'}
+        The same rules as the single card endpoints are checked for the whole batch with one query per table.
+        Operations that fail are reported and skipped, the rest are written with bulk statements and one commit.
+        :return: A dictionary with one result per operation, in request order
+        """
+        operations = parse_card_batch()
+        context = load_card_batch_context(operations)
+        results, creates, updates, deletes, board_ids = [], [], {}, set(), set()
+        for operation in operations:
+            values, board_id, error = validate_card_operation(operation, context)
+            if error:
+                message, status = error
+                results.append({'status': status, 'message': message})
+                continue
+            board_ids.add(board_id)
+            if operation['op'] == 'create':
+                results.append({'status': 201, 'message': 'Card created successfully'})
+                creates.append((results[-1], values))
+            elif operation['op'] == 'delete':
+                card_id = values['id']
+                updates.pop(card_id, None)
+                deletes.add(card_id)
+                results.append({'status': 200, 'message': 'Card deleted successfully', 'card_id': card_id})
+            else:
+                updates.setdefault(values['id'], {}).update(values)
+                results.append({'status': 200, 'message': 'Card updated successfully', 'card_id': values['id']})
+
+        if creates:
+            assign_ids(db.session.connection(), Card.__table__, [values for _, values in creates])
+            card_ids = db.session.scalars(
+                insert(Card).returning(Card.id, sort_by_parameter_order=True),
+                [values for _, values in creates]
+            ).all()
+            for (result, _), card_id in zip(creates, card_ids):
+                result['card_id'] = card_id
+        updates = [values for values in updates.values() if len(values) > 1]
+        if updates:
+            db.session.execute(update(Card), updates)
+        if deletes:
+            db.session.execute(delete(Card).where(Card.id.in_(deletes)))
+        db.session.commit()
+        board_cache.bump(*board_ids)
+        return {'results': results}, 200
+
 class AllBoardsDataResource(Resource):
     def get(self):
         """
         The get function returns a list of boards, each board containing a list of lists,
         each list containing a list of cards. Each card contains the following information:
         card_id, card_name, card_description and assigned user.
+        Boards are returned in id order. The listing can be paginated with ?after=<board_id>&limit=N, in which case a
+        Link header points at the next page, and streamed one board per line with ?format=ndjson.
+        :return: A list of dictionaries
+        """
+        args = parse_board_page_args()
+        batches = iter_board_batches(args['after'], args['limit'])
+        if args['stream']:
+            return ndjson_response(board_data for boards in batches for board_data in self.boards_data(boards))
+        result = []
+        for boards in batches:
+            result.extend(self.boards_data(boards))
+        cursor = result[-1]['board_id'] if result else None
+        return result, 200, next_page_link(result, args, cursor)
+
+    @staticmethod
+    def boards_data(boards):
+        """
+        The boards_data function builds the nested board dictionaries for a batch of board rows.
+        :param boards: A list of board rows
         :return: A list of dictionaries
         """
-        boards = Board.query.all()
+        trees = load_board_trees([board.id for board in boards])
         result = []
         for board in boards:
+            tree = trees[board.id]
             board_data = {
                 'board_id': board.id,
                 'board_name': board.name,
-                'users': [user.id for user in board.users],
-                'board_lists': []
+                'users': tree['users'],
+                'board_lists': tree['board_lists']
             }
-            board_lists = BoardList.query.filter_by(board_id=board.id).all()
-            for board_list in board_lists:
-                board_list_data = {
-                    'board_list_id': board_list.id,
-                    'board_list_name': board_list.name,
-                    'cards': []
-                }
-                cards = Card.query.filter_by(board_list_id=board_list.id).all()
-                for card in cards:
-                    user = card.user_id or None
-                    card_data = {
-                        'card_id': card.id,
-                        'card_name': card.name,
-                        'card_description': card.description,
-                        'assigned_user': user
-                    }
-                    board_list_data['cards'].append(card_data)
-                board_data['board_lists'].append(board_list_data)
             result.append(board_data)
         return result
 
@@ -375,28 +571,64 @@ class AllBoardsResource(Resource):
         The function queries the Board table and creates a list of dictionaries, each dictionary containing information about
         one board and its child board list and cards respectively.
         The function then returns this list as JSON data.
+        Boards are returned in id order. The listing can be paginated with ?after=<board_id>&limit=N, in which case a
+        Link header points at the next page, and streamed one board per line with ?format=ndjson.
         :return: A dictionary with the key 'boards' and a list of dictionaries as its value
         """
-        boards = Board.query.all()
-        boards_data = []
-        for board in boards:
-            board_data = {
-                'id': board.id,
-                'name': board.name,
-                'privacy': board.privacy,
-                'url': board.url
-            }
-            boards_data.append(board_data)
-        return {'boards': boards_data}
+        args = parse_board_page_args()
+        batches = iter_board_batches(args['after'], args['limit'])
+        boards_data = (self.board_data(board) for boards in batches for board in boards)
+        if args['stream']:
+            return ndjson_response(boards_data)
+        boards_data = list(boards_data)
+        cursor = boards_data[-1]['id'] if boards_data else None
+        return {'boards': boards_data}, 200, next_page_link(boards_data, args, cursor)
+
+    @staticmethod
+    def board_data(board):
+        """
+        The board_data function builds the summary dictionary of a single board row.
+        :param board: A board row
+        :return: A dictionary with the board's id, name, privacy and url
+        """
+        return {
+            'id': board.id,
+            'name': board.name,
+            'privacy': board.privacy,
+            'url': board.url
+        }
+
+class SearchResource(Resource):
+    def get(self):
+        """
+        The get function searches the name and description of the cards on the boards a user is a member of.
+        The query string takes the search text q, the searching user_id, an optional board_id to search a single
+        board, and limit and offset to page through the results, in which case a Link header points at the next page.
+        Results are ranked best match first, a match in the card name counting more than one in its description.
+        :return: A dictionary with the key 'results' and a list of card dictionaries as its value
+        """
+        args = parse_search_args()
+        user = get_user(args['user_id'])
+        if args['board_id'] is not None:
+            board = get_board(args['board_id'])
+            if not is_board_member(board.id, user.id):
+                return {'message': f'Add user to {board.name} board to search its cards'}, 403
+        results = search_cards(args['match'], user.id, args['board_id'], args['limit'], args['offset'])
+        return {'results': results}, 200, next_search_link(results, args)
 
 api.add_resource(AllBoardsResource, '/all_boards')
 api.add_resource(AllBoardsDataResource, '/all_boards_data')
 api.add_resource(UserResource, '/users/<int:user_id>', '/users')
 api.add_resource(BoardResource, '/boards/<int:board_id>', '/boards')
+api.add_resource(BoardChangesResource, '/boards/<int:board_id>/changes')
+api.add_resource(BoardStatsResource, '/boards/<int:board_id>/stats')
+api.add_resource(BoardExportResource, '/boards/<int:board_id>/export')
+api.add_resource(BoardImportResource, '/boards/import')
 api.add_resource(BoardListResource, '/boardlists/<int:board_list_id>', '/boardlists')
 api.add_resource(CardResource, '/cards/<int:card_id>', '/cards')
-
+api.add_resource(CardBatchResource, '/cards/batch')
+api.add_resource(SearchResource, '/search')
 
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
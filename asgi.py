@@ -0,0 +1,349 @@
+"""
+ASGI entry point for MinimalBoard.
+
+Serves the routes of app.py to ASGI servers on SQLAlchemy's asyncio extension: the databases are reached through async
+engines on the aiosqlite driver, and every request runs in an AsyncSession, whose run_sync calls the Flask app in a
+greenlet. The models, resources and serializers are those of app.py, so the responses are the same, but a request
+waiting for the database, for its body or for board changes (?wait=) is suspended on the event loop instead of holding
+a thread, so a single process keeps many slow or read-heavy requests in flight at once. No pool of threads caps them;
+the connection pools of the engines are the only limit, and change feed requests hand their connection back while
+they wait.
+
+The maintenance commands and the position rebalancer keep using the synchronous engines of the Flask app. Group commit
+is not available: its callers block until the writer thread has committed.
+
+Run it with any ASGI server, e.g. ``uvicorn asgi:app``. Create or migrate the schema with
+``flask --app app init-db`` first.
+"""
+import asyncio
+import itertools
+import sys
+
+from flask import has_request_context, request
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.util import await_only
+
+from app import create_app
+from changes import ChangeFeed
+from initdb import READ_ONLY_BIND, RoutingSession, db, set_pragmas_on_connect
+
+# Keys of the WSGI environ holding the session of an ASGI request and the event set once its client is gone.
+SESSION_KEY = 'minimalboard.session'
+DISCONNECTED_KEY = 'minimalboard.disconnected'
+# The number of body chunks received ahead of the application reading them.
+BODY_QUEUE_SIZE = 4
+
+
+class RequestBody(object):
+    """
+    The RequestBody class is the wsgi.input of an ASGI request. It hands out the chunks of the body as the application
+    reads them, and never holds more than BODY_QUEUE_SIZE chunks it has not read, so a large upload is not buffered
+    whole. It must be read in the greenlet of the request.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._buffer = b''
+        self._offset = 0
+        self._done = False
+
+    def _next(self):
+        """
+        The _next function waits for the next chunk of the body.
+        :return: The chunk, b'' at the end of the body
+        """
+        if self._done:
+            return b''
+        chunk = await_only(self._chunks.get())
+        self._done = not chunk
+        return chunk
+
+    def _fill(self):
+        """
+        The _fill function replaces the buffer, which must have been read, with the next chunk of the body.
+        :return: Whether there was a chunk left
+        """
+        self._buffer, self._offset = self._next(), 0
+        return bool(self._buffer)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            parts = [self._buffer[self._offset:]]
+            self._buffer, self._offset = b'', 0
+            while parts[-1] or len(parts) == 1:
+                parts.append(self._next())
+            return b''.join(parts)
+        if self._offset == len(self._buffer) and not self._fill():
+            return b''
+        data = self._buffer[self._offset:self._offset + size]
+        self._offset += len(data)
+        return data
+
+    def readline(self, size=-1):
+        parts, length = [], 0
+        while size is None or size < 0 or length < size:
+            if self._offset == len(self._buffer) and not self._fill():
+                break
+            end = self._buffer.find(b'\n', self._offset) + 1 or len(self._buffer)
+            if size is not None and size >= 0:
+                end = min(end, self._offset + size - length)
+            parts.append(self._buffer[self._offset:end])
+            length += end - self._offset
+            self._offset = end
+            if parts[-1].endswith(b'\n'):
+                break
+        return b''.join(parts)
+
+    def readlines(self, hint=-1):
+        return list(self)
+
+    def __iter__(self):
+        line = self.readline()
+        while line:
+            yield line
+            line = self.readline()
+
+
+async def receive_body(receive, chunks, disconnected):
+    """
+    The receive_body function puts the body chunks of an ASGI request in a queue, waiting while the queue is full,
+    and then keeps receiving until the client disconnects.
+    :param receive: The ASGI receive function
+    :param chunks: The queue, ended by b''
+    :param disconnected: The event to set when the client disconnects
+    """
+    more_body = True
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            disconnected.set()
+            if more_body:
+                await chunks.put(b'')
+            return
+        if more_body:
+            more_body = message.get('more_body', False)
+            if message.get('body'):
+                await chunks.put(message['body'])
+            if not more_body:
+                await chunks.put(b'')
+
+
+def wsgi_environ(scope, body):
+    """
+    The wsgi_environ function builds the WSGI environ of an ASGI HTTP request.
+    :param scope: The ASGI connection scope
+    :param body: The wsgi.input stream of the request body
+    :return: The environ dictionary
+    """
+    host, port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': host,
+        'SERVER_PORT': str(port or 80),
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        # The body stream ends with the body, whether or not the client sent its length.
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', ()):
+        name, value = name.decode('latin-1').upper().replace('-', '_'), value.decode('latin-1')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{name}'
+        if key in environ:
+            # Repeated headers are joined as one, but cookies are separated by semicolons rather than commas.
+            value = f'{environ[key]}{"; " if key == "HTTP_COOKIE" else ","}{value}'
+        environ[key] = value
+    return environ
+
+
+async def wait_for_change(changed, disconnected, timeout):
+    """
+    The wait_for_change function waits until one of two events is set or timeout seconds have passed.
+    :param changed: The event set by a bump
+    :param disconnected: The event set when the client disconnects
+    :param timeout: The number of seconds to wait for at most
+    :return: Whether the client is still connected
+    """
+    tasks = [asyncio.ensure_future(changed.wait()), asyncio.ensure_future(disconnected.wait())]
+    try:
+        await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return not disconnected.is_set()
+
+
+class AsyncChangeFeed(ChangeFeed):
+    """
+    The AsyncChangeFeed class is the change feed of the ASGI app: its requests wait for changes on the event loop and
+    stop waiting as soon as their client disconnects. Requests that do not come through the ASGI app wait as with
+    ChangeFeed.
+    """
+
+    def __init__(self):
+        super().__init__()
+        # The (event loop, event) pairs of the waiting requests, set by every bump.
+        self._events = set()
+
+    def notify(self, *board_ids):
+        super().notify(*board_ids)
+        for loop, event in list(self._events):
+            loop.call_soon_threadsafe(event.set)
+
+    def _wait(self, generation, timeout):
+        disconnected = request.environ.get(DISCONNECTED_KEY) if has_request_context() else None
+        if disconnected is None:
+            return super()._wait(generation, timeout)
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        self._events.add(waiter)
+        try:
+            if self._generation != generation:
+                return not disconnected.is_set()
+            return await_only(wait_for_change(waiter[1], disconnected, timeout))
+        finally:
+            self._events.discard(waiter)
+
+
+class SessionBinds(object):
+    """
+    The SessionBinds class stands in for the SQLAlchemy extension in the sessions of the ASGI app: it gives the async
+    engines as the engines to route to, and the rest of the extension as is.
+    """
+
+    def __init__(self, engines):
+        self.engines = engines
+
+    def __getattr__(self, name):
+        return getattr(db, name)
+
+
+def create_async_engines(app):
+    """
+    The create_async_engines function creates an aiosqlite engine on the database of every engine of the app, with
+    the same pool options and connection pragmas.
+    :param app: The Flask application
+    :return: A dictionary of async engines by bind key
+    :raises ValueError: If a database is not an SQLite database
+    """
+    with app.app_context():
+        urls = {key: engine.url for key, engine in db.engines.items()}
+    binds = app.config.get('SQLALCHEMY_BINDS', {})
+    engines = {}
+    for key, url in urls.items():
+        if url.get_backend_name() != 'sqlite':
+            raise ValueError('The ASGI app only serves SQLite databases.')
+        options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+        if isinstance(binds.get(key), dict):
+            options.update(binds[key])
+            options.pop('url')
+        # aiosqlite opens a connection per checkout by default; pool them like the synchronous engines do.
+        options.setdefault('poolclass', AsyncAdaptedQueuePool)
+        engine = create_async_engine(url.set(drivername='sqlite+aiosqlite'), **options)
+        set_pragmas_on_connect(engine.sync_engine, app.config.get('STORAGE_PRAGMAS', {}),
+                               read_only=key is not None and key.endswith(READ_ONLY_BIND))
+        engines[key] = engine
+    return engines
+
+
+class AsgiApp(object):
+    """
+    The AsgiApp class serves a Flask app to ASGI servers. Every request runs the WSGI application of the app in
+    AsyncSession.run_sync, with db.session the sync session of its AsyncSession, so every statement of the request
+    runs on the async engines, and sends its response chunk by chunk as it is produced.
+    """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.engines = create_async_engines(flask_app)
+        self.binds = SessionBinds({key: engine.sync_engine for key, engine in self.engines.items()})
+        instrumentation = flask_app.extensions.get('instrumentation')
+        if instrumentation is not None:
+            for engine in self.engines.values():
+                instrumentation.instrument_engine(engine.sync_engine)
+        AsyncChangeFeed().init_app(flask_app, flask_app.extensions['board_cache'])
+        flask_app.extensions['group_commit'].enabled = False
+        flask_app.before_request(self._use_session)
+
+    def _use_session(self):
+        session = request.environ.get(SESSION_KEY)
+        if session is not None:
+            db.session.registry.set(session)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    for engine in self.engines.values():
+                        await engine.dispose()
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            return
+
+        chunks, disconnected = asyncio.Queue(BODY_QUEUE_SIZE), asyncio.Event()
+        receiver = asyncio.ensure_future(receive_body(receive, chunks, disconnected))
+        session = AsyncSession(sync_session_class=RoutingSession, db=self.binds, query_cls=db.Query)
+        environ = wsgi_environ(scope, RequestBody(chunks))
+        environ[SESSION_KEY] = session.sync_session
+        environ[DISCONNECTED_KEY] = disconnected
+        try:
+            await session.run_sync(self.run, environ, send)
+        finally:
+            receiver.cancel()
+            await session.close()
+
+    def run(self, session, environ, send):
+        """
+        The run function calls the WSGI application in the greenlet of the request and sends its response as ASGI
+        messages. A streamed response stops being produced once the client has disconnected.
+        :param session: The sync session of the request
+        :param environ: The WSGI environ of the request
+        :param send: The ASGI send function
+        """
+        response, written = {}, []
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                   for name, value in headers]
+            return written.append
+
+        chunks = self.flask_app(environ, start_response)
+        try:
+            await_only(send({'type': 'http.response.start', 'status': response['status'],
+                             'headers': response['headers']}))
+            for chunk in itertools.chain(written, chunks):
+                if environ[DISCONNECTED_KEY].is_set():
+                    return
+                if chunk:
+                    await_only(send({'type': 'http.response.body', 'body': chunk, 'more_body': True}))
+            await_only(send({'type': 'http.response.body', 'body': b''}))
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+
+def create_asgi_app(flask_app):
+    """
+    The create_asgi_app function builds the ASGI application serving a Flask app on async engines. The Flask app
+    must not have served a request yet.
+    :param flask_app: The configured Flask application
+    :return: The ASGI application
+    """
+    return AsgiApp(flask_app)
+
+
+app = create_asgi_app(create_app())
@@ -0,0 +1,7 @@
+"""
+Benchmarks for MinimalBoard.
+
+Run ``python -m benchmarks --help`` for the options. A run seeds a fresh SQLite database with synthetic data, drives
+the HTTP endpoints through the Flask test client or a local WSGI server and writes throughput, latency percentiles
+and SQL queries per request to a JSON file that ``python -m benchmarks compare`` can diff against another run.
+"""
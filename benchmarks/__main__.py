@@ -0,0 +1,78 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+from benchmarks.runner import SCENARIOS, compare, run, startup
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Benchmark the MinimalBoard API.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    run_parser = subparsers.add_parser('run', help='Seed a database and run the scenarios (default).')
+    run_parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    run_parser.add_argument('--requests', type=int, default=200, help='Requests per scenario.')
+    run_parser.add_argument('--concurrency', type=int, default=4, help='Concurrent clients.')
+    run_parser.add_argument('--server', action='store_true', help='Drive a local WSGI server over HTTP.')
+    run_parser.add_argument('--users', type=int, default=100)
+    run_parser.add_argument('--boards', type=int, default=20)
+    run_parser.add_argument('--lists', type=int, default=5, help='Board lists per board.')
+    run_parser.add_argument('--cards', type=int, default=20, help='Cards per board list.')
+    run_parser.add_argument('--density', type=float, default=0.2, help='Fraction of users that are board members.')
+    run_parser.add_argument('--assigned', type=float, default=0.5, help='Fraction of cards assigned to a user.')
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--config', type=json.loads, default={},
+                            help='JSON object of app config values, e.g. \'{"STORAGE_PROFILE": "production"}\'.')
+    run_parser.add_argument('--database', help='SQLite file to create (default: a temporary file).')
+    run_parser.add_argument('--output', help='Write the results to this JSON file.')
+
+    startup_parser = subparsers.add_parser('startup', help='Time the startup of a worker process.')
+    startup_parser.add_argument('--runs', type=int, default=10, help='Processes to start.')
+    startup_parser.add_argument('--users', type=int, default=100)
+    startup_parser.add_argument('--boards', type=int, default=20)
+    startup_parser.add_argument('--lists', type=int, default=5, help='Board lists per board.')
+    startup_parser.add_argument('--cards', type=int, default=20, help='Cards per board list.')
+    startup_parser.add_argument('--config', type=json.loads, default={}, help='JSON object of app config values.')
+    startup_parser.add_argument('--database', help='SQLite file to create (default: a temporary file).')
+    startup_parser.add_argument('--output', help='Write the results to this JSON file.')
+
+    compare_parser = subparsers.add_parser('compare', help='Compare two result files.')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.10, help='Tolerated relative change.')
+
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] not in (['run'], ['compare'], ['startup'], ['-h'], ['--help']):
+        argv = ['run'] + argv
+    args = parser.parse_args(argv)
+    if args.command == 'compare':
+        with open(args.baseline) as baseline, open(args.current) as current:
+            try:
+                lines, regressions = compare(json.load(baseline), json.load(current), args.threshold)
+            except ValueError as error:
+                parser.error(str(error))
+        print('\n'.join(lines))
+        return 1 if regressions else 0
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = args.database or os.path.join(directory, 'benchmark.db')
+        if args.command == 'startup':
+            results = startup(database, runs=args.runs, users=args.users, boards=args.boards, lists=args.lists,
+                              cards=args.cards, config=args.config)
+        else:
+            results = run(database, args.scenarios, requests=args.requests, concurrency=args.concurrency,
+                          server=args.server, users=args.users, boards=args.boards, lists=args.lists,
+                          cards=args.cards, density=args.density, assigned=args.assigned, seed=args.seed,
+                          config=args.config)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output + '\n')
+    print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,471 @@
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from benchmarks.seed import seed_database
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class QueryCounter(object):
+    """
+    The QueryCounter class counts the SQL statements executed by every engine of the process.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+        event.listen(Engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, *args):
+        with self._lock:
+            self.count += 1
+
+    def reset(self):
+        with self._lock:
+            count, self.count = self.count, 0
+        return count
+
+
+class TestClientDriver(object):
+    """
+    The TestClientDriver class sends requests through the Flask test client, one client per worker thread.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, url, body=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(url, method=method, json=body)
+        return response.status_code, response.get_data()
+
+    def close(self):
+        pass
+
+
+class ServerDriver(object):
+    """
+    The ServerDriver class serves the app with a threaded Werkzeug server on a local port and sends requests over
+    HTTP, one keep-alive connection per worker thread.
+    """
+
+    def __init__(self, app):
+        from werkzeug.serving import make_server
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.port = self.server.server_port
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        self._local = threading.local()
+
+    def request(self, method, url, body=None):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = HTTPConnection('127.0.0.1', self.port)
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        connection.request(method, url, body=None if body is None else json.dumps(body), headers=headers)
+        response = connection.getresponse()
+        return response.status, response.read()
+
+    def close(self):
+        self.server.shutdown()
+
+
+def _serial(data):
+    with data['lock']:
+        return next(data['serial'])
+
+
+def _user_get(rng, data):
+    return 'GET', f'/users/{rng.randint(1, data["users"])}', None
+
+
+def _user_create(rng, data):
+    serial = _serial(data)
+    return 'POST', '/users', {'name': f'Benchmark user {serial}', 'email': f'benchmark{serial}@example.com'}
+
+
+def _board_get(rng, data):
+    return 'GET', f'/boards/{rng.randint(1, data["boards"])}', None
+
+
+def _board_list_get(rng, data):
+    return 'GET', f'/boardlists/{rng.randint(1, data["board_lists"])}', None
+
+
+def _all_boards(rng, data):
+    return 'GET', '/all_boards', None
+
+
+def _all_boards_data(rng, data):
+    return 'GET', '/all_boards_data', None
+
+
+def _board_create(rng, data):
+    return 'POST', '/boards', {'name': f'Benchmark board {_serial(data)}', 'privacy': 'PUBLIC'}
+
+
+def _board_update(rng, data):
+    body = {'name': f'Benchmark board {_serial(data)}', 'privacy': rng.choice(['PUBLIC', 'PRIVATE'])}
+    return 'PUT', f'/boards/{rng.randint(1, data["boards"])}', body
+
+
+def _board_patch(rng, data):
+    user_ids = rng.sample(range(1, data['users'] + 1), min(3, data['users']))
+    return 'PATCH', f'/boards/{rng.randint(1, data["boards"])}', {'user_ids': user_ids}
+
+
+def _board_list_create(rng, data):
+    body = {'name': f'Benchmark list {_serial(data)}', 'board_id': rng.randint(1, data['boards'])}
+    return 'POST', '/boardlists', body
+
+
+def _board_list_update(rng, data):
+    return 'PUT', f'/boardlists/{rng.randint(1, data["board_lists"])}', {'name': f'Benchmark list {_serial(data)}'}
+
+
+def _board_list_delete(rng, data):
+    with data['lock']:
+        board_list_id = data['deletable'].pop() if data['deletable'] else None
+    if board_list_id is None:
+        return 'DELETE', '/boardlists/0', None
+    return 'DELETE', f'/boardlists/{board_list_id}', None
+
+
+def _card_get(rng, data):
+    return 'GET', f'/cards/{rng.randint(1, data["cards"])}', None
+
+
+def _card_create(rng, data):
+    board_list_id = rng.randint(1, data['board_lists'])
+    board_id = (board_list_id - 1) // (data['board_lists'] // data['boards']) + 1
+    members = data['members'][board_id]
+    body = {'name': 'Benchmark card', 'description': 'Created by the benchmark', 'board_list_id': board_list_id,
+            'user_id': rng.choice(members) if members else None}
+    return 'POST', '/cards', body
+
+
+def _card_update(rng, data):
+    return 'PUT', f'/cards/{rng.randint(1, data["cards"])}', {'name': f'Card {rng.random():.6f}'}
+
+
+def _card_delete(rng, data):
+    with data['lock']:
+        card_id = data['deletable'].pop() if data['deletable'] else None
+    if card_id is None:
+        return 'DELETE', '/cards/0', None
+    return 'DELETE', f'/cards/{card_id}', None
+
+
+# Scenarios in the order they run. Read scenarios come first so that writes do not change what they measure. The
+# delete scenarios remove the rows of the matching create scenario, and board_list_delete comes last since deleting
+# a list deletes its cards.
+SCENARIOS = {
+    'user_get': _user_get,
+    'board_get': _board_get,
+    'board_list_get': _board_list_get,
+    'card_get': _card_get,
+    'all_boards': _all_boards,
+    'all_boards_data': _all_boards_data,
+    'user_create': _user_create,
+    'board_create': _board_create,
+    'board_update': _board_update,
+    'board_patch': _board_patch,
+    'board_list_create': _board_list_create,
+    'board_list_update': _board_list_update,
+    'card_create': _card_create,
+    'card_update': _card_update,
+    'card_delete': _card_delete,
+    'board_list_delete': _board_list_delete,
+}
+
+
+def percentile(samples, fraction):
+    """
+    The percentile function returns the nearest-rank percentile of a list of samples.
+    :param samples: A sorted list of samples
+    :param fraction: The percentile as a fraction, e.g. 0.95
+    :return: The percentile, or None when there are no samples
+    """
+    if not samples:
+        return None
+    index = max(0, min(len(samples) - 1, int(round(fraction * len(samples) + 0.5)) - 1))
+    return samples[index]
+
+
+def run_scenario(driver, counter, scenario, data, requests, concurrency, seed):
+    """
+    The run_scenario function sends a number of requests of one scenario with the given concurrency.
+    :param driver: The driver that sends the requests
+    :param counter: The query counter
+    :param scenario: The function that builds the requests of the scenario
+    :param data: The description of the seeded database
+    :param requests: The number of requests to send
+    :param concurrency: The number of worker threads
+    :param seed: The seed of the random number generator of each worker
+    :return: A dictionary of throughput, latency percentiles in milliseconds, errors and SQL queries per request
+    """
+    latencies, errors = [], []
+    per_worker = [requests // concurrency + (1 if worker < requests % concurrency else 0)
+                  for worker in range(concurrency)]
+
+    def work(worker, count):
+        rng = random.Random(f'{seed}-{worker}')
+        for _ in range(count):
+            method, url, body = scenario(rng, data)
+            started = time.perf_counter()
+            status, _ = driver.request(method, url, body)
+            latencies.append(time.perf_counter() - started)
+            if status >= 400:
+                errors.append(status)
+
+    counter.reset()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(work, worker, count) for worker, count in enumerate(per_worker)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+    queries = counter.reset()
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'seconds': round(elapsed, 4),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+            'p50': round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+            'p95': round(percentile(latencies, 0.95) * 1000, 3) if latencies else None,
+            'p99': round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+            'max': round(latencies[-1] * 1000, 3) if latencies else None,
+        },
+        'queries_per_request': round(queries / len(latencies), 2) if latencies else None,
+    }
+
+
+def _deletable_rows(app, db, model, seeded, requests):
+    """
+    The _deletable_rows function picks the rows a delete scenario removes: the rows created by the matching create
+    scenario, or the last seeded rows if it did not run.
+    """
+    with app.app_context():
+        row_ids = [row_id for row_id, in db.session.query(model.id).filter(model.id > seeded)]
+    if not row_ids:
+        row_ids = list(range(max(1, seeded - requests + 1), seeded + 1))
+    return row_ids
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(database, scenarios, requests=200, concurrency=4, server=False, users=100, boards=20, lists=5, cards=20,
+        density=0.2, assigned=0.5, seed=0, config=None):
+    """
+    The run function creates and seeds a fresh database and runs the given scenarios against it.
+
+    :param database: The path of the SQLite file to create; it must not exist
+    :param scenarios: The names of the scenarios to run
+    :param requests: The number of requests per scenario
+    :param concurrency: The number of concurrent clients
+    :param server: Send requests over HTTP to a local WSGI server instead of the Flask test client
+    :param config: A dictionary of extra app config values
+    :return: The results as a JSON serializable dictionary
+    """
+    if os.path.exists(database):
+        raise FileExistsError(f'{database} already exists, benchmarks need a fresh database')
+    from app import create_app
+    from initdb import db
+    from models import BoardList, Card, create_schema
+
+    app = create_app(dict(config or {}, SQLALCHEMY_DATABASE_URI=f'sqlite:///{os.path.abspath(database)}'))
+    with app.app_context():
+        create_schema()
+        seeded = seed_database(db, users=users, boards=boards, lists=lists, cards=cards, density=density,
+                               assigned=assigned, seed=seed)
+    data = dict(seeded, lock=threading.Lock(), serial=itertools.count(1), deletable=[])
+    counter = QueryCounter()
+    driver = ServerDriver(app) if server else TestClientDriver(app)
+    results = {}
+    try:
+        for name in SCENARIOS:
+            if name not in scenarios:
+                continue
+            if name == 'card_delete':
+                data['deletable'] = _deletable_rows(app, db, Card, seeded['cards'], requests)
+            if name == 'board_list_delete':
+                data['deletable'] = _deletable_rows(app, db, BoardList, seeded['board_lists'], requests)
+            results[name] = run_scenario(driver, counter, SCENARIOS[name], data, requests, concurrency, seed)
+    finally:
+        driver.close()
+    seeded.pop('members')
+    return {
+        'meta': {
+            'revision': _git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'driver': 'server' if server else 'test_client',
+            'requests': requests,
+            'concurrency': concurrency,
+            'seed': seed,
+            'data': seeded,
+            'config': config or {},
+        },
+        'scenarios': results,
+    }
+
+
+# Run by the startup benchmark in a new interpreter for every sample. It prints the milliseconds spent importing the
+# app module, building the app with create_app and serving a first request.
+STARTUP_SCRIPT = """
+import time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app()
+created = time.perf_counter()
+application.test_client().get('/all_boards')
+served = time.perf_counter()
+print((imported - started) * 1000, (created - imported) * 1000, (served - created) * 1000)
+"""
+
+
+def startup(database, runs=10, users=100, boards=20, lists=5, cards=20, config=None):
+    """
+    The startup function measures how long a worker process takes to become ready: importing the app module,
+    building the app and serving its first request, each sample in a new Python process, as a forked or respawned
+    worker would. The database is created and seeded once beforehand.
+
+    :param database: The path of the SQLite file to create; it must not exist
+    :param runs: The number of processes to start
+    :param config: A dictionary of extra app config values, passed to the processes as MINIMALBOARD_* variables
+    :return: The results as a JSON serializable dictionary
+    """
+    if os.path.exists(database):
+        raise FileExistsError(f'{database} already exists, benchmarks need a fresh database')
+    from app import create_app
+    from initdb import db
+    from models import create_schema
+
+    uri = f'sqlite:///{os.path.abspath(database)}'
+    with create_app(dict(config or {}, SQLALCHEMY_DATABASE_URI=uri)).app_context():
+        create_schema()
+        seeded = seed_database(db, users=users, boards=boards, lists=lists, cards=cards)
+    environment = dict(os.environ, MINIMALBOARD_SQLALCHEMY_DATABASE_URI=uri)
+    for key, value in (config or {}).items():
+        environment[f'MINIMALBOARD_{key}'] = json.dumps(value)
+
+    samples = {'import_ms': [], 'create_app_ms': [], 'first_request_ms': []}
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', STARTUP_SCRIPT], cwd=ROOT, env=environment,
+                                         text=True, stderr=subprocess.DEVNULL)
+        for name, value in zip(samples, output.split()):
+            samples[name].append(float(value))
+    seeded.pop('members')
+    return {
+        'meta': {
+            'revision': _git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'runs': runs,
+            'data': seeded,
+            'config': config or {},
+        },
+        'startup': {
+            name: {
+                'min': round(min(values), 3),
+                'p50': round(percentile(sorted(values), 0.50), 3),
+                'max': round(max(values), 3),
+            }
+            for name, values in samples.items()
+        },
+    }
+
+
+def result_kind(results):
+    """
+    The result_kind function tells which benchmark wrote a result file.
+
+    :param results: The results of a run or startup benchmark
+    :return: 'run' or 'startup'
+    :raises ValueError: If the results are not those of a benchmark
+    """
+    for kind, key in (('run', 'scenarios'), ('startup', 'startup')):
+        if key in results:
+            return kind
+    raise ValueError('Not a benchmark result file: it has neither scenarios nor startup timings.')
+
+
+def compare(baseline, current, threshold=0.10):
+    """
+    The compare function diffs two result files of the same benchmark, scenario by scenario or startup phase by
+    startup phase.
+    A scenario regresses when its p95 latency grows or its throughput drops by more than threshold, or when it
+    issues more SQL queries per request. A startup phase regresses when its median time grows by more than threshold.
+
+    :param baseline: The results of the baseline run
+    :param current: The results of the run to check
+    :param threshold: The tolerated relative change
+    :return: A tuple of report lines and the names of the regressed scenarios or phases
+    :raises ValueError: If the files are not results of the same benchmark
+    """
+    kind = result_kind(current)
+    if result_kind(baseline) != kind:
+        raise ValueError(f'Cannot compare {result_kind(baseline)} results with {kind} results.')
+    if kind == 'startup':
+        return _compare_startup(baseline['startup'], current['startup'], threshold)
+    lines, regressions = [], []
+    for name, result in current['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if before is None:
+            lines.append(f'{name:<18} new scenario')
+            continue
+        p95_before, p95_after = before['latency_ms']['p95'], result['latency_ms']['p95']
+        rps_before, rps_after = before['throughput_rps'], result['throughput_rps']
+        p95_change = (p95_after - p95_before) / p95_before if p95_before else 0.0
+        rps_change = (rps_after - rps_before) / rps_before if rps_before else 0.0
+        regressed = (p95_change > threshold or rps_change < -threshold
+                     or result['queries_per_request'] > before['queries_per_request'])
+        if regressed:
+            regressions.append(name)
+        lines.append(f'{name:<18} p95 {p95_before:>9.3f} -> {p95_after:>9.3f} ms ({p95_change:+.1%})  '
+                     f'rps {rps_before:>9.2f} -> {rps_after:>9.2f} ({rps_change:+.1%})  '
+                     f'queries {before["queries_per_request"]} -> {result["queries_per_request"]}'
+                     f'{"  REGRESSION" if regressed else ""}')
+    return lines, regressions
+
+
+def _compare_startup(baseline, current, threshold):
+    lines, regressions = [], []
+    for name, result in current.items():
+        before = baseline.get(name)
+        if before is None:
+            lines.append(f'{name:<18} new phase')
+            continue
+        change = (result['p50'] - before['p50']) / before['p50'] if before['p50'] else 0.0
+        regressed = change > threshold
+        if regressed:
+            regressions.append(name)
+        lines.append(f'{name:<18} p50 {before["p50"]:>9.3f} -> {result["p50"]:>9.3f} ms ({change:+.1%})'
+                     f'{"  REGRESSION" if regressed else ""}')
+    return lines, regressions
@@ -0,0 +1,77 @@
+import random
+
+from sqlalchemy import insert
+
+from positions import sequential_keys
+
+CHUNK_SIZE = 10000
+
+
+def _insert(db, table, rows):
+    """
+    The _insert function bulk inserts rows into a table in chunks of CHUNK_SIZE.
+    :param db: The SQLAlchemy extension
+    :param table: The model or table to insert into
+    :param rows: An iterable of row dictionaries
+    """
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == CHUNK_SIZE:
+            db.session.execute(insert(table), chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(insert(table), chunk)
+
+
+def seed_database(db, users=100, boards=20, lists=5, cards=20, density=0.2, assigned=0.5, seed=0):
+    """
+    The seed_database function fills an empty database with synthetic users, boards, board lists and cards.
+    Ids are assigned explicitly from 1, so the same arguments always produce the same database.
+    Must be called inside an app context.
+
+    :param db: The SQLAlchemy extension
+    :param users: The number of users
+    :param boards: The number of boards
+    :param lists: The number of board lists per board
+    :param cards: The number of cards per board list
+    :param density: The fraction of users that are members of each board
+    :param assigned: The fraction of cards assigned to a member of their board
+    :param seed: The seed of the random number generator
+    :return: A dictionary with the number of rows created per table and the id ranges of the boards, lists and cards
+    """
+    from models import Board, BoardList, Card, User, board_users
+
+    rng = random.Random(seed)
+    user_ids = list(range(1, users + 1))
+    members = {board_id: sorted(rng.sample(user_ids, max(1, int(users * density)))) if users else []
+               for board_id in range(1, boards + 1)}
+
+    _insert(db, User, ({'id': user_id, 'name': f'User {user_id}', 'email': f'user{user_id}@example.com'}
+                       for user_id in user_ids))
+    _insert(db, Board, ({'id': board_id, 'name': f'Board {board_id}', 'privacy': 'PUBLIC',
+                         'url': f'http://localhost:5000/boards/{board_id}'} for board_id in members))
+    _insert(db, board_users, ({'board_id': board_id, 'user_id': user_id}
+                              for board_id, user_ids in members.items() for user_id in user_ids))
+    list_keys, card_keys = sequential_keys(lists), sequential_keys(cards)
+    _insert(db, BoardList, ({'id': (board_id - 1) * lists + position + 1, 'name': f'List {position + 1}',
+                             'board_id': board_id, 'position': list_keys[position]}
+                            for board_id in members for position in range(lists)))
+
+    def card_rows():
+        for board_list_id in range(1, boards * lists + 1):
+            board_members = members[(board_list_id - 1) // lists + 1]
+            for position in range(cards):
+                user_id = rng.choice(board_members) if board_members and rng.random() < assigned else None
+                yield {'id': (board_list_id - 1) * cards + position + 1, 'name': f'Card {position + 1}',
+                       'description': f'Synthetic card {position + 1} of list {board_list_id}',
+                       'board_list_id': board_list_id, 'position': card_keys[position], 'user_id': user_id}
+    _insert(db, Card, card_rows())
+    db.session.commit()
+    return {
+        'users': users,
+        'boards': boards,
+        'board_lists': boards * lists,
+        'cards': boards * lists * cards,
+        'members': {board_id: user_ids for board_id, user_ids in members.items()},
+    }
@@ -0,0 +1,82 @@
+"""
+Microbenchmark of request validation: the compiled schemas in utilities.py against equivalent
+flask_restful reqparse parsers. Run with ``python -m benchmarks.validation``.
+"""
+import argparse
+import json
+import timeit
+
+from flask import Flask
+from flask_restful import reqparse
+
+from schemas import Field, Schema
+
+CASES = {
+    'card': (
+        [('name', dict(type=str, required=True, help="Name is required.")),
+         ('description', dict(type=str, required=False)),
+         ('board_list_id', dict(type=int, required=True, help="Board List ID is required.")),
+         ('user_id', dict(type=int, required=False))],
+        {'name': 'Write the report', 'description': 'Quarterly numbers', 'board_list_id': 12, 'user_id': 3},
+    ),
+    'update_card': (
+        [('name', dict(type=str, required=False)),
+         ('description', dict(type=str, required=False)),
+         ('board_list_id', dict(type=int, required=False)),
+         ('user_id', dict(type=int, required=False))],
+        {'board_list_id': 14},
+    ),
+    'board': (
+        [('name', dict(type=str, required=True, help="Name is required.")),
+         ('privacy', dict(type=str, choices=['PUBLIC', 'PRIVATE'], default='PUBLIC'))],
+        {'name': 'Roadmap', 'privacy': 'PRIVATE'},
+    ),
+    'board_users': (
+        [('user_ids', dict(type=int, action='append', required=True, help="User IDs are required."))],
+        {'user_ids': list(range(1, 21))},
+    ),
+}
+
+
+def build(arguments):
+    """
+    The build function creates the reqparse parser and the schema for the same list of arguments.
+    :param arguments: A list of (name, reqparse keyword arguments) tuples
+    :return: A tuple of the parser and the schema
+    """
+    parser = reqparse.RequestParser()
+    fields = []
+    for name, options in arguments:
+        parser.add_argument(name, **options)
+        options = dict(options)
+        options['append'] = options.pop('action', 'store') == 'append'
+        fields.append(Field(name, **options))
+    return parser, Schema(*fields)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(prog='python -m benchmarks.validation')
+    arg_parser.add_argument('--number', type=int, default=20000, help='Parses per measurement.')
+    arg_parser.add_argument('--repeat', type=int, default=5, help='Measurements per case; the best one is kept.')
+    args = arg_parser.parse_args(argv)
+
+    app = Flask(__name__)
+    results = {}
+    for name, (arguments, payload) in CASES.items():
+        parser, schema = build(arguments)
+        with app.test_request_context(method='POST', data=json.dumps(payload), content_type='application/json'):
+            assert dict(parser.parse_args()) == schema.parse_args(), name
+            reqparse_time = min(timeit.repeat(parser.parse_args, number=args.number, repeat=args.repeat))
+            schema_time = min(timeit.repeat(schema.parse_args, number=args.number, repeat=args.repeat))
+        results[name] = {
+            'reqparse_us': round(reqparse_time / args.number * 1e6, 3),
+            'schema_us': round(schema_time / args.number * 1e6, 3),
+            'speedup': round(reqparse_time / schema_time, 2),
+        }
+        print(f'{name:<12} reqparse {results[name]["reqparse_us"]:>8.3f} us  '
+              f'schema {results[name]["schema_us"]:>8.3f} us  x{results[name]["speedup"]}')
+    return results
+
+
+if __name__ == '__main__':
+    main()
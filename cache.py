@@ -0,0 +1,103 @@
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+from werkzeug.local import LocalProxy
+
+BOARD_CACHE_SIZE = 256
+
+
+class BoardCache(object):
+    """
+    The BoardCache class is an in-process LRU cache of serialized board trees.
+    Snapshots are stored with the version of the board they were built from, the sequence number of the last change
+    in its change log, which the triggers of the database bump on every write to the board, its members, lists and
+    cards, whatever process or command makes it. Readers take the current version from the database before reading
+    the board and only use a snapshot of that version, so every worker notices the writes of the others and a
+    snapshot is never served once the board has changed. Every app has a cache of its own, since the board ids and
+    change logs of two apps with different databases have nothing in common.
+    """
+
+    def __init__(self, maxsize=BOARD_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._snapshots = OrderedDict()
+        self._listeners = []
+
+    def init_app(self, app):
+        """
+        The init_app function reads the cache size from the BOARD_CACHE_SIZE config value of the app and makes this
+        cache the one of the app.
+        :param app: The Flask application
+        """
+        self.maxsize = app.config.setdefault('BOARD_CACHE_SIZE', BOARD_CACHE_SIZE)
+        app.extensions['board_cache'] = self
+
+    def subscribe(self, listener):
+        """
+        The subscribe function registers a function that is called with the board ids of every bump, e.g. to wake up
+        requests waiting for changes to those boards.
+        :param listener: A function taking board ids as positional arguments
+        """
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def etag(self, board_id, version):
+        """
+        The etag function returns the entity tag of a board snapshot.
+        :param board_id: The id of the board
+        :param version: The version the snapshot was built from
+        :return: The entity tag, without quotes
+        """
+        return f'{board_id}-{version}'
+
+    def get(self, board_id, version):
+        """
+        The get function returns the cached snapshot of a board and marks it as recently used.
+        :param board_id: The id of the board
+        :param version: The current version of the board
+        :return: A tuple of the entity tag and the serialized body, or None if no snapshot of that version is cached
+        """
+        with self._lock:
+            snapshot = self._snapshots.get(board_id)
+            if snapshot is None or snapshot[0] != version:
+                return None
+            self._snapshots.move_to_end(board_id)
+            return snapshot[1:]
+
+    def put(self, board_id, version, body):
+        """
+        The put function stores the snapshot of a board, unless a snapshot of a later version is stored already.
+        The least recently used snapshot is evicted when the cache is full.
+        :param board_id: The id of the board
+        :param version: The version of the board read before the board itself
+        :param body: The serialized board tree
+        :return: A tuple of the entity tag and the serialized body
+        """
+        snapshot = (self.etag(board_id, version), body)
+        with self._lock:
+            stored = self._snapshots.get(board_id)
+            if self.maxsize <= 0 or (stored is not None and stored[0] > version):
+                return snapshot
+            self._snapshots[board_id] = (version,) + snapshot
+            self._snapshots.move_to_end(board_id)
+            while len(self._snapshots) > self.maxsize:
+                self._snapshots.popitem(last=False)
+            return snapshot
+
+    def bump(self, *board_ids):
+        """
+        The bump function drops the cached snapshots of the given boards, which are out of date, and tells the
+        subscribers about the change. It is called after every committed mutation of a board, its lists or its cards
+        in this process; the snapshots would not be served anyway, as the version of the boards has changed.
+        :param board_ids: The ids of the modified boards
+        """
+        with self._lock:
+            for board_id in board_ids:
+                self._snapshots.pop(board_id, None)
+        for listener in self._listeners:
+            listener(*board_ids)
+
+
+# The cache of the current app.
+board_cache = LocalProxy(lambda: current_app.extensions['board_cache'])
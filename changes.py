@@ -0,0 +1,86 @@
+import threading
+import time
+
+from flask import current_app
+from werkzeug.local import LocalProxy
+
+CHANGE_FEED_MAX_WAIT = 30.0
+CHANGE_FEED_POLL_INTERVAL = 1.0
+
+
+class ChangeFeed(object):
+    """
+    The ChangeFeed class lets requests wait for new changes to a board. Waiters are woken up as soon as a write in
+    this process bumps a board in the board cache, and otherwise poll the change log every CHANGE_FEED_POLL_INTERVAL
+    seconds, so changes committed by other processes are picked up as well. A request waits at most
+    CHANGE_FEED_MAX_WAIT seconds.
+    """
+
+    def __init__(self):
+        self.max_wait = CHANGE_FEED_MAX_WAIT
+        self.poll_interval = CHANGE_FEED_POLL_INTERVAL
+        self._condition = threading.Condition()
+        self._generation = 0
+
+    def init_app(self, app, cache):
+        """
+        The init_app function reads the waiting limits from the app config, subscribes to the bumps of cache and
+        makes this feed the one of the app.
+        :param app: The Flask application
+        :param cache: The board cache of the app
+        """
+        self.max_wait = app.config.setdefault('CHANGE_FEED_MAX_WAIT', CHANGE_FEED_MAX_WAIT)
+        self.poll_interval = app.config.setdefault('CHANGE_FEED_POLL_INTERVAL', CHANGE_FEED_POLL_INTERVAL)
+        cache.subscribe(self.notify)
+        app.extensions['change_feed'] = self
+
+    def notify(self, *board_ids):
+        """
+        The notify function wakes up every waiting request, which then checks the log of its own board.
+        :param board_ids: The ids of the changed boards
+        """
+        with self._condition:
+            self._generation += 1
+            self._condition.notify_all()
+
+    def poll(self, load, wait, release=None):
+        """
+        The poll function calls load until it returns a page with changes or wait seconds have passed.
+        :param load: A function returning a page of changes as a dictionary, or None when the client must resync
+        :param wait: The number of seconds to wait for, capped to CHANGE_FEED_MAX_WAIT
+        :param release: A function called before every wait to hand the database connections of the request back to
+                        the pool, so waiting requests do not hold connections the other requests need
+        :return: The last result of load
+        """
+        deadline = time.monotonic() + min(max(wait, 0), self.max_wait)
+        with self._condition:
+            generation = self._generation
+        page = load()
+        while page is not None and not page['changes']:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if release is not None:
+                release()
+            if not self._wait(generation, min(remaining, self.poll_interval)):
+                break
+            with self._condition:
+                generation = self._generation
+            page = load()
+        return page
+
+    def _wait(self, generation, timeout):
+        """
+        The _wait function blocks until a bump has happened since the given generation or timeout seconds have passed.
+        :param generation: The generation the waiting request has seen
+        :param timeout: The number of seconds to wait for at most
+        :return: Whether the request still waits for changes
+        """
+        with self._condition:
+            if self._generation == generation:
+                self._condition.wait(timeout)
+        return True
+
+
+# The change feed of the current app.
+change_feed = LocalProxy(lambda: current_app.extensions['change_feed'])
@@ -0,0 +1,132 @@
+import click
+from flask.cli import with_appcontext
+
+from counters import check_card_counts, repair_card_counts
+from initdb import db
+from models import create_schema
+from serializers import dumps
+from shards import each_shard, move_board, plan_rebalance
+from utilities import export_board_rows, import_board_rows, select_board_shard
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """
+    Create the missing tables and apply the pending schema migrations. Run it on a new database and after every
+    upgrade, before starting the app.
+    """
+    click.echo(f'Database schema is at version {create_schema()}.')
+
+
+@click.command('check-counters')
+@click.option('--repair', is_flag=True, help='Recompute the counters that are wrong.')
+@with_appcontext
+def check_counters_command(repair):
+    """
+    Compare the card counters of boards, lists and assigned users with the cards, and optionally repair them, on
+    every shard. Exits with status 1 when a counter is wrong and --repair was not given.
+    """
+    mismatches = {}
+    for shard in each_shard():
+        mismatches[shard] = check_card_counts(db.session.connection())
+        for counter, key, stored, actual in mismatches[shard]:
+            click.echo(f'{counter} {key}: stored {stored}, actual {actual}')
+    count = sum(len(shard_mismatches) for shard_mismatches in mismatches.values())
+    if not count:
+        click.echo('All card counters are consistent.')
+        return
+    if not repair:
+        click.echo(f'{count} card counters are wrong, run with --repair to fix them.')
+        raise SystemExit(1)
+    for shard in each_shard():
+        if mismatches[shard]:
+            repair_card_counts(db.session.connection())
+    db.session.commit()
+    click.echo(f'Repaired {count} card counters.')
+
+
+@click.command('export-board')
+@click.argument('board_id', type=int)
+@click.option('--output', '-o', type=click.File('wb'), default='-', help='The file to write to, by default stdout.')
+@with_appcontext
+def export_board_command(board_id, output):
+    """
+    Write a board with its members, lists and cards as newline delimited JSON, in the format read by import-board.
+    """
+    empty = True
+    select_board_shard(board_id)
+    for record in export_board_rows(board_id):
+        empty = False
+        output.write(dumps(record) + b'\n')
+    if empty:
+        raise click.ClickException(f'Board {board_id} does not exist.')
+
+
+@click.command('import-board')
+@click.argument('source', type=click.File('rb'))
+@click.option('--name', help='The name of the new board, by default the exported name.')
+@with_appcontext
+def import_board_command(source, name):
+    """
+    Create a new board from a file written by export-board, or - for stdin. Users are matched by email.
+    """
+    try:
+        result = import_board_rows(source, name=name)
+    except ValueError as error:
+        db.session.rollback()
+        raise click.ClickException(str(error))
+    db.session.commit()
+    click.echo(f"Imported board {result['board_id']} with {result['board_lists']} board lists and "
+               f"{result['cards']} cards, creating {result['users_created']} users.")
+
+
+@click.command('move-board')
+@click.argument('board_id', type=int)
+@click.argument('shard', type=int)
+@with_appcontext
+def move_board_command(board_id, shard):
+    """
+    Move a board with its lists, cards and change log to another shard. Lists and cards keep their ids.
+    """
+    try:
+        source = move_board(board_id, shard)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    if source == shard:
+        click.echo(f'Board {board_id} is already on shard {shard}.')
+    else:
+        click.echo(f'Moved board {board_id} from shard {source} to shard {shard}.')
+
+
+@click.command('rebalance-shards')
+@click.option('--max-moves', type=int, help='The most boards to move, by default as many as it takes.')
+@click.option('--dry-run', is_flag=True, help='Only print the moves.')
+@with_appcontext
+def rebalance_shards_command(max_moves, dry_run):
+    """
+    Move boards from the fullest shards to the emptiest ones, until moving another board would not even out the
+    number of cards and boards on each shard further.
+    """
+    moves = plan_rebalance(max_moves)
+    db.session.rollback()
+    for board_id, source, target in moves:
+        click.echo(f'Moving board {board_id} from shard {source} to shard {target}.')
+        if not dry_run:
+            move_board(board_id, target)
+    if not moves:
+        click.echo('The shards are balanced.')
+
+
+def init_app(app):
+    """
+    The init_app function registers the maintenance commands of the app with the flask command line, e.g.
+    flask --app app init-db.
+    :param app: The Flask application
+    """
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(check_counters_command)
+    app.cli.add_command(export_board_command)
+    app.cli.add_command(import_board_command)
+    app.cli.add_command(move_board_command)
+    app.cli.add_command(rebalance_shards_command)
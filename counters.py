@@ -0,0 +1,57 @@
+from sqlalchemy import text
+
+# Card counters kept by the triggers of migration 5: boards.card_count, board_list.card_count and the
+# board_user_card_counts table, which holds the number of cards assigned to each user on each board.
+
+ACTUAL_BOARD_LIST_COUNTS = (
+    'SELECT board_list.id, COUNT(card.id) FROM board_list '
+    'LEFT JOIN card ON card.board_list_id = board_list.id GROUP BY board_list.id'
+)
+ACTUAL_BOARD_COUNTS = (
+    'SELECT boards.id, COUNT(card.id) FROM boards '
+    'LEFT JOIN board_list ON board_list.board_id = boards.id '
+    'LEFT JOIN card ON card.board_list_id = board_list.id GROUP BY boards.id'
+)
+ACTUAL_USER_COUNTS = (
+    'SELECT board_list.board_id, card.user_id, COUNT(*) FROM card '
+    'JOIN board_list ON board_list.id = card.board_list_id '
+    'WHERE card.user_id IS NOT NULL GROUP BY board_list.board_id, card.user_id'
+)
+
+
+def check_card_counts(connection):
+    """
+    The check_card_counts function compares every stored card counter with a count of the cards themselves.
+    :param connection: A connection to the database
+    :return: A list of (counter, key, stored, actual) tuples, one per wrong counter
+    """
+    mismatches = []
+    for counter, table, actual_query in (('board_list', 'board_list', ACTUAL_BOARD_LIST_COUNTS),
+                                         ('board', 'boards', ACTUAL_BOARD_COUNTS)):
+        stored = dict(connection.execute(text(f'SELECT id, card_count FROM {table}')).all())
+        for key, actual in connection.execute(text(actual_query)):
+            if stored.get(key) != actual:
+                mismatches.append((counter, key, stored.get(key), actual))
+    stored = {(board_id, user_id): count for board_id, user_id, count in connection.execute(
+        text('SELECT board_id, user_id, card_count FROM board_user_card_counts'))}
+    actual = {(board_id, user_id): count for board_id, user_id, count in connection.execute(text(ACTUAL_USER_COUNTS))}
+    for key in sorted(stored.keys() | actual.keys()):
+        if stored.get(key, 0) != actual.get(key, 0):
+            mismatches.append(('board_user', key, stored.get(key, 0), actual.get(key, 0)))
+    return mismatches
+
+
+def repair_card_counts(connection):
+    """
+    The repair_card_counts function recomputes every card counter from the cards. The caller commits.
+    :param connection: A connection to the database
+    """
+    connection.execute(text(
+        'UPDATE board_list SET card_count = (SELECT COUNT(*) FROM card WHERE card.board_list_id = board_list.id)'
+    ))
+    connection.execute(text(
+        'UPDATE boards SET card_count = (SELECT COUNT(*) FROM card '
+        'JOIN board_list ON board_list.id = card.board_list_id WHERE board_list.board_id = boards.id)'
+    ))
+    connection.execute(text('DELETE FROM board_user_card_counts'))
+    connection.execute(text(f'INSERT INTO board_user_card_counts (board_id, user_id, card_count) {ACTUAL_USER_COUNTS}'))
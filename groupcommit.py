@@ -0,0 +1,126 @@
+import queue
+import threading
+import time
+
+from flask import current_app, g
+from werkzeug.local import LocalProxy
+
+GROUP_COMMIT_WINDOW_MS = 2
+GROUP_COMMIT_MAX_BATCH = 64
+
+
+class GroupCommitJob(object):
+    """
+    The GroupCommitJob class is one write queued to the group commit writer, with its outcome once it has run.
+    """
+    __slots__ = ('function', 'args', 'result', 'error', 'done')
+
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class GroupCommit(object):
+    """
+    The GroupCommit class runs writes from many requests on a single writer thread, which gathers the jobs that
+    arrive within GROUP_COMMIT_WINDOW_MS of the first one, up to GROUP_COMMIT_MAX_BATCH of them, into one
+    transaction. Every job runs in its own savepoint, so a job that aborts or fails to flush is rolled back alone
+    and only its caller gets the error. Callers are released once the transaction has committed, so a request that
+    returns has its write on disk exactly as with one commit per request; the cost of the commit is shared.
+    It is off unless GROUP_COMMIT is set, and with sharded storage, as a group is committed on a single database.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.window = GROUP_COMMIT_WINDOW_MS / 1000
+        self.max_batch = GROUP_COMMIT_MAX_BATCH
+        self.app = None
+        self.db = None
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def init_app(self, app, db):
+        """
+        The init_app function reads the group commit settings from the app config and makes this writer the one of the
+        app, whose jobs it runs against the database of the app.
+        :param app: The Flask application
+        :param db: The SQLAlchemy extension
+        """
+        self.enabled = app.config.setdefault('GROUP_COMMIT', False) and app.config.get('SHARDS', 1) == 1
+        self.window = app.config.setdefault('GROUP_COMMIT_WINDOW_MS', GROUP_COMMIT_WINDOW_MS) / 1000
+        self.max_batch = app.config.setdefault('GROUP_COMMIT_MAX_BATCH', GROUP_COMMIT_MAX_BATCH)
+        self.app = app
+        self.db = db
+        app.extensions['group_commit'] = self
+
+    def submit(self, function, *args):
+        """
+        The submit function runs a write on the writer thread and waits until its transaction has committed.
+        The function runs in an app context of its own with the writer's session, stages its changes in db.session
+        without committing, and must not rely on the request; anything it raises is raised again here.
+        :param function: The function performing the write
+        :param args: The arguments of the function
+        :return: The return value of the function
+        """
+        job = GroupCommitJob(function, args)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name='group-commit', daemon=True)
+                self._thread.start()
+        self._queue.put(job)
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _work(self):
+        while True:
+            jobs = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(jobs) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    jobs.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._run(jobs)
+            except Exception as error:
+                for job in jobs:
+                    if job.error is None:
+                        job.result, job.error = None, error
+            finally:
+                for job in jobs:
+                    job.done.set()
+
+    def _run(self, jobs):
+        session = self.db.session
+        with self.app.app_context():
+            connection = session.connection()
+            if connection.dialect.name == 'sqlite':
+                # pysqlite only opens a transaction before the first DML statement, and a SAVEPOINT outside of one
+                # would commit on release; open it explicitly, taking the write lock for the whole group.
+                connection.exec_driver_sql('BEGIN IMMEDIATE')
+            try:
+                for job in jobs:
+                    # Lookups are memoized per app context; they must not leak from one job to the next.
+                    g.pop('lookups', None)
+                    savepoint = session.begin_nested()
+                    try:
+                        job.result = job.function(*job.args)
+                        savepoint.commit()
+                    except Exception as error:
+                        savepoint.rollback()
+                        job.error = error
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+
+
+# The group commit writer of the current app.
+group_commit = LocalProxy(lambda: current_app.extensions['group_commit'])
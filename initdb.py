@@ -1,2 +1,201 @@
+import os
+
+from flask import current_app, g, has_app_context, has_request_context, request
 from flask_sqlalchemy import SQLAlchemy
-db = SQLAlchemy()
\ No newline at end of file
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.util import find_tables
+
+READ_ONLY_BIND = 'readonly'
+READ_METHODS = ('GET', 'HEAD')
+# Bind key of shard n in sharded mode. Shard 0 is the default bind, the main database, which also holds the tables
+# of the directory: the users and the shard each board is placed on.
+SHARD_BIND = 'shard{}'
+DIRECTORY_TABLES = frozenset(('users', 'board_shards'))
+
+# Pragmas run on every new SQLite connection whatever the profile. SQLite only enforces foreign keys, and so the
+# ON DELETE CASCADE that deletes the lists, cards and members of a board, when foreign_keys is on.
+BASE_PRAGMAS = {'foreign_keys': 'ON'}
+
+# Storage profiles selectable with the STORAGE_PROFILE config value. 'pragmas' are run on every new SQLite
+# connection, 'engine_options' are merged into SQLALCHEMY_ENGINE_OPTIONS and 'read_only_engine' adds a second,
+# read-only engine on the same file that GET handlers read from.
+STORAGE_PROFILES = {
+    'default': {
+        'pragmas': {},
+        'engine_options': {},
+        'read_only_engine': False,
+    },
+    'production': {
+        'pragmas': {
+            'busy_timeout': 5000,
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'cache_size': -64000,
+            'mmap_size': 268435456,
+            'temp_store': 'MEMORY',
+        },
+        'engine_options': {
+            'pool_size': 10,
+            'max_overflow': 10,
+            'pool_timeout': 30,
+        },
+        'read_only_engine': True,
+    },
+}
+
+
+def shard_bind(shard, read_only=False):
+    """
+    The shard_bind function returns the bind key of the engine of a shard.
+    :param shard: The number of the shard
+    :param read_only: Whether to return the key of the read-only engine of the shard
+    :return: The bind key, None for the read-write engine of shard 0
+    """
+    key = SHARD_BIND.format(shard) if shard else None
+    if read_only:
+        return READ_ONLY_BIND if key is None else f'{key}-{READ_ONLY_BIND}'
+    return key
+
+
+def shard_engines():
+    """
+    The shard_engines function returns the read-write engines of the shards of the current app, shard 0 first. It is
+    the default engine alone when the app is not sharded.
+    :return: A list of engines, indexed by shard number
+    """
+    return [db.engines[shard_bind(shard)] for shard in range(current_app.config.get('SHARDS', 1))]
+
+
+def _directory_only(mapper, clause):
+    """
+    The _directory_only function tells whether a statement only reads or writes tables of the directory.
+    """
+    if clause is not None:
+        tables = find_tables(clause, include_crud=True)
+        return bool(tables) and all(table.name in DIRECTORY_TABLES for table in tables)
+    return mapper is not None and inspect(mapper).local_table.name in DIRECTORY_TABLES
+
+
+class RoutingSession(Session):
+    """
+    The RoutingSession class sends the queries of GET and HEAD requests to the read-only engine when the storage
+    profile configures one, so reads never queue behind the write connection. Flushes always use a read-write engine.
+    With sharded storage, statements go to the shard selected for the current app context (see shards.py), but for
+    those that only touch directory tables, which go to shard 0.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            shard = g.get('shard', 0)
+            if shard and _directory_only(mapper, clause):
+                shard = 0
+            if not self._flushing and has_request_context() and request.method in READ_METHODS:
+                engine = self._db.engines.get(shard_bind(shard, read_only=True))
+                if engine is not None:
+                    return engine
+            if shard:
+                return self._db.engines[shard_bind(shard)]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+def _read_only_url(url):
+    """
+    The _read_only_url function turns the URL of an SQLite database file into a URL that opens the same file in
+    read-only mode.
+    :param url: The database URL
+    :return: The read-only database URL, or None if the URL is not an SQLite database file
+    """
+    url = make_url(url)
+    if not url.drivername.startswith('sqlite') or url.database in (None, '', ':memory:'):
+        return None
+    database = url.database if url.query.get('uri') else f'file:{url.database}'
+    return url.set(database=database).update_query_dict({'mode': 'ro', 'uri': 'true'})
+
+
+def _shard_url(url):
+    """
+    The _shard_url function derives the URL pattern of the shard databases from the URL of the main SQLite database
+    file, e.g. sqlite:///minimalboard-shard{shard}.db for sqlite:///minimalboard.db.
+    :param url: The database URL
+    :return: The URL pattern, with a {shard} placeholder
+    :raises ValueError: If the URL is not an SQLite database file
+    """
+    url = make_url(url)
+    if not url.drivername.startswith('sqlite') or url.database in (None, '', ':memory:'):
+        raise ValueError('SHARD_DATABASE_URI must be set when the database is not an SQLite file.')
+    root, extension = os.path.splitext(url.database)
+    return url.set(database=f'{root}-shard{{shard}}{extension}').render_as_string(hide_password=False)
+
+
+def configure_storage(app):
+    """
+    The configure_storage function applies the storage profile named by the STORAGE_PROFILE config value to the app,
+    its pragmas added to BASE_PRAGMAS. It must be called before db.init_app. STORAGE_PRAGMAS and STORAGE_READ_ONLY_ENGINE override the pragmas and the
+    read-only engine switch of the profile, and SQLALCHEMY_ENGINE_OPTIONS takes precedence over its engine options.
+    When SHARDS is above 1, a bind is added for every shard but shard 0, at the SHARD_DATABASE_URI pattern, with the
+    same engine options and read-only engine.
+    :param app: The Flask application
+    """
+    profile = STORAGE_PROFILES[app.config.setdefault('STORAGE_PROFILE', 'default')]
+    pragmas = dict(BASE_PRAGMAS)
+    pragmas.update(profile['pragmas'])
+    pragmas.update(app.config.setdefault('STORAGE_PRAGMAS', {}))
+    app.config['STORAGE_PRAGMAS'] = pragmas
+    engine_options = dict(profile['engine_options'])
+    engine_options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+    urls = {0: app.config['SQLALCHEMY_DATABASE_URI']}
+    if app.config.setdefault('SHARDS', 1) > 1:
+        pattern = app.config['SHARD_DATABASE_URI'] = app.config.get('SHARD_DATABASE_URI') or _shard_url(urls[0])
+        for shard in range(1, app.config['SHARDS']):
+            urls[shard] = pattern.format(shard=shard)
+            app.config.setdefault('SQLALCHEMY_BINDS', {})[shard_bind(shard)] = dict(engine_options, url=urls[shard])
+    if app.config.setdefault('STORAGE_READ_ONLY_ENGINE', profile['read_only_engine']):
+        for shard, url in urls.items():
+            read_only_url = _read_only_url(url)
+            if read_only_url is not None:
+                app.config.setdefault('SQLALCHEMY_BINDS', {})[shard_bind(shard, read_only=True)] = \
+                    dict(engine_options, url=read_only_url)
+
+
+def apply_pragmas(app):
+    """
+    The apply_pragmas function registers a connect listener on every SQLite engine of the app that runs the
+    configured pragmas on each new connection. journal_mode is a property of the database file, so it is only set
+    from the read-write engine.
+    It must be called after db.init_app.
+    :param app: The Flask application
+    """
+    pragmas = app.config.get('STORAGE_PRAGMAS', {})
+    if not pragmas:
+        return
+    with app.app_context():
+        engines = dict(db.engines)
+    for key, engine in engines.items():
+        set_pragmas_on_connect(engine, pragmas, read_only=key is not None and key.endswith(READ_ONLY_BIND))
+
+
+def set_pragmas_on_connect(engine, pragmas, read_only=False):
+    """
+    The set_pragmas_on_connect function registers a connect listener on an SQLite engine that runs the given
+    pragmas on each new connection. Engines of other databases are left alone.
+    :param engine: The engine
+    :param pragmas: A dictionary of pragma names and values
+    :param read_only: Whether the engine opens the database read-only, in which case journal_mode is skipped
+    """
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+    statements = [f'PRAGMA {name}={value}' for name, value in pragmas.items()
+                  if not read_only or name != 'journal_mode']
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+    event.listen(engine, 'connect', on_connect)
@@ -0,0 +1,215 @@
+import bisect
+import logging
+import threading
+import time
+
+from flask import Response, current_app, g, has_request_context, request
+from werkzeug.local import LocalProxy
+from sqlalchemy import event
+
+logger = logging.getLogger('minimalboard.slow')
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+SLOW_REQUEST_MS = 500
+SLOW_QUERY_MS = 100
+
+
+class Histogram(object):
+    """
+    The Histogram class is a thread safe Prometheus style histogram with one series per label value.
+    """
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, label, value):
+        """
+        The observe function records one value in the series of the given label.
+        :param label: The value of the 'resource' label
+        :param value: The observed value
+        """
+        with self._lock:
+            counts, total = self._series.get(label, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._series[label] = (counts, total + value)
+
+    def render(self):
+        """
+        The render function returns the histogram in the Prometheus text exposition format.
+        :return: A list of lines
+        """
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((label, list(counts), total) for label, (counts, total) in self._series.items())
+        for label, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{resource="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{resource="{label}"}} {total}')
+            lines.append(f'{self.name}_count{{resource="{label}"}} {cumulative}')
+        return lines
+
+
+class Instrumentation(object):
+    """
+    The Instrumentation class measures every request: the number of SQL statements, the time spent in them, the
+    time spent serializing the response and the wall time. The figures are collected in histograms per resource
+    method that /metrics exposes in the Prometheus text format and added to the response as a Server-Timing header,
+    and requests and statements slower than SLOW_REQUEST_MS and SLOW_QUERY_MS are logged to 'minimalboard.slow'.
+    Streamed responses are measured until their last chunk is sent, and get no Server-Timing header.
+    Set INSTRUMENTATION to False to turn it off. Every app has histograms of its own.
+    """
+
+    def __init__(self):
+        self.slow_request_ms = SLOW_REQUEST_MS
+        self.slow_query_ms = SLOW_QUERY_MS
+        self.request_duration = Histogram('minimalboard_request_duration_seconds', 'Wall time of a request.')
+        self.sql_duration = Histogram('minimalboard_request_sql_duration_seconds', 'SQL time of a request.')
+        self.sql_queries = Histogram('minimalboard_request_sql_queries', 'SQL statements per request.',
+                                     QUERY_COUNT_BUCKETS)
+        self.serialization_duration = Histogram('minimalboard_request_serialization_seconds',
+                                                'Response serialization time of a request.')
+
+    def init_app(self, app, db):
+        """
+        The init_app function hooks the instrumentation into the request cycle of the app and the engines of db, and
+        registers the /metrics endpoint. Serialization is only measured in representations wrapped with
+        timed_representation. It must be called after db.init_app.
+        :param app: The Flask application
+        :param db: The SQLAlchemy extension
+        """
+        if not app.config.setdefault('INSTRUMENTATION', True):
+            return
+        self.slow_request_ms = app.config.setdefault('SLOW_REQUEST_MS', SLOW_REQUEST_MS)
+        self.slow_query_ms = app.config.setdefault('SLOW_QUERY_MS', SLOW_QUERY_MS)
+        app.extensions['instrumentation'] = self
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics)
+        with app.app_context():
+            engines = list(db.engines.values())
+        for engine in engines:
+            self.instrument_engine(engine)
+
+    def instrument_engine(self, engine):
+        """
+        The instrument_engine function counts and times the statements run on an engine in the request running them.
+        :param engine: The engine, or the sync_engine of an async engine
+        """
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(engine, 'handle_error', self._handle_error)
+
+    def _before_request(self):
+        g.instrumentation = {'started': time.perf_counter(), 'queries': 0, 'sql': 0.0, 'serialization': 0.0}
+
+    def _after_request(self, response):
+        stats = g.get('instrumentation')
+        if stats is None:
+            return response
+        label = f'{request.endpoint}.{request.method.lower()}'
+        description = (request.method, request.full_path, label)
+        if response.is_streamed:
+            # The body of a streamed response is read from the database and serialized while it is sent, after this
+            # hook, so its figures are recorded once it has been sent and there is no header left to send them in.
+            response.response = self._timed_chunks(response.response, stats)
+            response.call_on_close(lambda: self._record(stats, *description))
+            return response
+        g.pop('instrumentation')
+        wall = self._record(stats, *description)
+        response.headers['Server-Timing'] = ', '.join([
+            f'db;dur={stats["sql"] * 1000:.2f};desc="{stats["queries"]} queries"',
+            f'serialize;dur={stats["serialization"] * 1000:.2f}',
+            f'total;dur={wall * 1000:.2f}',
+        ])
+        return response
+
+    def _record(self, stats, method, path, label):
+        """
+        The _record function adds the figures of a finished request to the histograms and logs it if it was slow.
+        :return: The wall time of the request, in seconds
+        """
+        wall = time.perf_counter() - stats['started']
+        self.request_duration.observe(label, wall)
+        self.sql_duration.observe(label, stats['sql'])
+        self.sql_queries.observe(label, stats['queries'])
+        self.serialization_duration.observe(label, stats['serialization'])
+        if wall * 1000 >= self.slow_request_ms:
+            logger.warning('Slow request %s %s (%s): %.1f ms, %d queries, %.1f ms SQL, %.1f ms serialization',
+                           method, path, label, wall * 1000, stats['queries'], stats['sql'] * 1000,
+                           stats['serialization'] * 1000)
+        return wall
+
+    def _timed_chunks(self, chunks, stats):
+        """
+        The _timed_chunks function counts the time spent producing the chunks of a streamed response, but for the
+        time spent in SQL statements meanwhile, as serialization time.
+        """
+        chunks = iter(chunks)
+        try:
+            while True:
+                started, sql = time.perf_counter(), stats['sql']
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    return
+                finally:
+                    stats['serialization'] += time.perf_counter() - started - (stats['sql'] - sql)
+                yield chunk
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        stats = g.get('instrumentation') if has_request_context() else None
+        if stats is not None:
+            stats['queries'] += 1
+            stats['sql'] += elapsed
+        if elapsed * 1000 >= self.slow_query_ms:
+            logger.warning('Slow statement: %.1f ms: %s', elapsed * 1000, statement)
+
+    def _handle_error(self, exception_context):
+        started = exception_context.connection.info.get('query_started') if exception_context.connection else None
+        if started:
+            started.pop()
+
+    def metrics(self):
+        """
+        The metrics function renders the request histograms in the Prometheus text exposition format.
+        :return: A text/plain response
+        """
+        lines = []
+        for histogram in (self.request_duration, self.sql_duration, self.sql_queries, self.serialization_duration):
+            lines.extend(histogram.render())
+        return Response('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def timed_representation(representation):
+    """
+    The timed_representation function wraps a Flask-RESTful representation so that the time it takes is counted as
+    serialization time of the request, in whichever app the request runs.
+    :param representation: The representation function
+    :return: The wrapped function
+    """
+    def timed(data, code, headers=None):
+        started = time.perf_counter()
+        response = representation(data, code, headers)
+        stats = g.get('instrumentation') if has_request_context() else None
+        if stats is not None:
+            stats['serialization'] += time.perf_counter() - started
+        return response
+    return timed
+
+
+# The instrumentation of the current app.
+instrumentation = LocalProxy(lambda: current_app.extensions['instrumentation'])
@@ -0,0 +1,447 @@
+from sqlalchemy import text
+
+from counters import repair_card_counts
+from positions import key_between
+
+# Schema migrations for existing databases, applied in order by upgrade. db.create_all only creates missing tables,
+# so every change to an existing table (indexes, columns, triggers) needs a step here as well as in models.py.
+# SQLite runs DDL outside of the transaction SQLAlchemy opens, so every step must be safe to run again if it was
+# interrupted before the schema version was recorded.
+MIGRATIONS = []
+
+
+def migration(version):
+    """
+    The migration decorator registers a function as the migration step that brings the schema to the given version.
+    :param version: The schema version reached after the step has run
+    :return: The decorator
+    """
+    def register(step):
+        MIGRATIONS.append((version, step))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return step
+    return register
+
+
+def schema_version(connection):
+    """
+    The schema_version function returns the version recorded in the user_version pragma of the database.
+    :param connection: A connection to the database
+    :return: The schema version, 0 for a database that was never migrated
+    """
+    return connection.execute(text('PRAGMA user_version')).scalar()
+
+
+def upgrade(engine):
+    """
+    The upgrade function applies every migration step newer than the schema version of the database and records
+    the new version after each step.
+    :param engine: The engine of the database to migrate
+    :return: The schema version of the database after the upgrade
+    """
+    with engine.connect() as connection:
+        version = schema_version(connection)
+        for step_version, step in MIGRATIONS:
+            if step_version <= version:
+                continue
+            step(connection)
+            connection.execute(text(f'PRAGMA user_version = {step_version}'))
+            connection.commit()
+            version = step_version
+    return version
+
+
+@migration(1)
+def add_lookup_indexes(connection):
+    """
+    Index the foreign keys used by board tree reads and cascades, and board names used by the duplicate name check.
+    """
+    connection.execute(text('CREATE INDEX IF NOT EXISTS ix_boards_name ON boards (name)'))
+    connection.execute(text('CREATE INDEX IF NOT EXISTS ix_board_list_board_id ON board_list (board_id)'))
+    connection.execute(text('CREATE INDEX IF NOT EXISTS ix_card_user_id ON card (user_id)'))
+    connection.execute(text('CREATE INDEX IF NOT EXISTS ix_card_board_list_id_id ON card (board_list_id, id)'))
+
+
+@migration(2)
+def add_card_search_index(connection):
+    """
+    Add the card_search FTS5 index over the name and description of cards. It is an external content table that
+    reads the text back from the card table, and triggers keep it in sync with every write to card, whichever code
+    path makes it. The rebuild fills it from the cards that already exist.
+    """
+    connection.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS card_search USING fts5("
+        "name, description, content='card', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+    ))
+    connection.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS card_search_insert AFTER INSERT ON card BEGIN "
+        "INSERT INTO card_search (rowid, name, description) VALUES (new.id, new.name, new.description); "
+        "END"
+    ))
+    connection.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS card_search_delete AFTER DELETE ON card BEGIN "
+        "INSERT INTO card_search (card_search, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); "
+        "END"
+    ))
+    connection.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS card_search_update AFTER UPDATE OF name, description ON card BEGIN "
+        "INSERT INTO card_search (card_search, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); "
+        "INSERT INTO card_search (rowid, name, description) VALUES (new.id, new.name, new.description); "
+        "END"
+    ))
+    connection.execute(text("INSERT INTO card_search (card_search) VALUES ('rebuild')"))
+
+
+@migration(3)
+def add_positions(connection):
+    """
+    Add the position column that orders board lists within their board and cards within their list, numbering the
+    existing rows in id order, and replace the parent id indexes with (parent id, position) indexes that serve the
+    ordered reads.
+    """
+    for table, parent in (('board_list', 'board_id'), ('card', 'board_list_id')):
+        columns = {row[1] for row in connection.execute(text(f'PRAGMA table_info({table})'))}
+        if 'position' not in columns:
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN position VARCHAR(64) NOT NULL DEFAULT ''"))
+        rows = connection.execute(text(f"SELECT id, {parent} FROM {table} WHERE position = '' ORDER BY {parent}, id"))
+        parameters, last_parent, position = [], None, None
+        for row_id, parent_id in rows.all():
+            position = key_between(position if parent_id == last_parent else None, None)
+            last_parent = parent_id
+            parameters.append({'id': row_id, 'position': position})
+        if parameters:
+            connection.execute(text(f'UPDATE {table} SET position = :position WHERE id = :id'), parameters)
+    connection.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_board_list_board_id_position ON board_list (board_id, position)'
+    ))
+    connection.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_card_board_list_id_position ON card (board_list_id, position)'
+    ))
+    connection.execute(text('DROP INDEX IF EXISTS ix_board_list_board_id'))
+    connection.execute(text('DROP INDEX IF EXISTS ix_card_board_list_id_id'))
+
+
+# Changes older than the last CHANGE_LOG_RETENTION of a board are pruned every CHANGE_LOG_PRUNE_INTERVAL changes.
+CHANGE_LOG_RETENTION = 1000
+CHANGE_LOG_PRUNE_INTERVAL = 100
+
+
+def _log_change(board_id, entity, entity_id, op):
+    """
+    The _log_change function returns the trigger statement that appends a change to board_changes, numbered with
+    the next sequence number of the board.
+    """
+    return (
+        f"INSERT INTO board_changes (board_id, seq, entity, entity_id, op) "
+        f"SELECT {board_id}, COALESCE(MAX(seq), 0) + 1, '{entity}', {entity_id}, '{op}' "
+        f"FROM board_changes WHERE board_id = {board_id}; "
+    )
+
+
+def _log_card_change(row, op):
+    return (
+        f"INSERT INTO board_changes (board_id, seq, entity, entity_id, op) "
+        f"SELECT board_list.board_id, "
+        f"COALESCE((SELECT MAX(seq) FROM board_changes WHERE board_id = board_list.board_id), 0) + 1, "
+        f"'card', {row}.id, '{op}' "
+        f"FROM board_list WHERE board_list.id = {row}.board_list_id; "
+    )
+
+
+@migration(4)
+def add_change_log(connection):
+    """
+    Add board_changes, the append-only log of the inserts, updates and deletes of every board, its members, lists
+    and cards, numbered with a sequence per board. Triggers write it, so every code path that changes the tables is
+    recorded in the same transaction as the change. Deleting a board drops its log but for the delete itself.
+    """
+    connection.execute(text(
+        'CREATE TABLE IF NOT EXISTS board_changes ('
+        'board_id INTEGER NOT NULL, seq INTEGER NOT NULL, entity VARCHAR(20) NOT NULL, '
+        'entity_id INTEGER NOT NULL, op VARCHAR(10) NOT NULL, PRIMARY KEY (board_id, seq))'
+    ))
+    triggers = {
+        'board_changes_prune': (
+            f'AFTER INSERT ON board_changes WHEN new.seq % {CHANGE_LOG_PRUNE_INTERVAL} = 0',
+            f'DELETE FROM board_changes WHERE board_id = new.board_id AND seq <= new.seq - {CHANGE_LOG_RETENTION}; '
+        ),
+        'boards_log_insert': ('AFTER INSERT ON boards', _log_change('new.id', 'board', 'new.id', 'insert')),
+        'boards_log_update': ('AFTER UPDATE ON boards', _log_change('new.id', 'board', 'new.id', 'update')),
+        'boards_log_delete': (
+            'AFTER DELETE ON boards',
+            _log_change('old.id', 'board', 'old.id', 'delete') +
+            'DELETE FROM board_changes WHERE board_id = old.id AND seq < '
+            '(SELECT MAX(seq) FROM board_changes WHERE board_id = old.id); '
+        ),
+        'board_users_log_insert': (
+            'AFTER INSERT ON board_users', _log_change('new.board_id', 'board', 'new.board_id', 'update')
+        ),
+        'board_users_log_delete': (
+            'AFTER DELETE ON board_users', _log_change('old.board_id', 'board', 'old.board_id', 'update')
+        ),
+        'board_list_log_insert': (
+            'AFTER INSERT ON board_list', _log_change('new.board_id', 'board_list', 'new.id', 'insert')
+        ),
+        'board_list_log_update': (
+            'AFTER UPDATE ON board_list', _log_change('new.board_id', 'board_list', 'new.id', 'update')
+        ),
+        'board_list_log_delete': (
+            'AFTER DELETE ON board_list', _log_change('old.board_id', 'board_list', 'old.id', 'delete')
+        ),
+        'card_log_insert': ('AFTER INSERT ON card', _log_card_change('new', 'insert')),
+        'card_log_update': ('AFTER UPDATE ON card', _log_card_change('new', 'update')),
+        'card_log_delete': ('AFTER DELETE ON card', _log_card_change('old', 'delete')),
+    }
+    for name, (event, body) in triggers.items():
+        connection.execute(text(f'CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body}END'))
+
+
+# Rows left behind by deletes made while foreign keys were not enforced, removed before the counters are filled, as
+# the foreign keys of board_user_card_counts refuse them, and again before the cascades are added. Children go first,
+# so the deletes pass the foreign keys when they are enforced.
+ORPHAN_DELETES = (
+    'DELETE FROM card WHERE board_list_id NOT IN '
+    '(SELECT id FROM board_list WHERE board_id IS NULL OR board_id IN (SELECT id FROM boards))',
+    'DELETE FROM board_list WHERE board_id IS NOT NULL AND board_id NOT IN (SELECT id FROM boards)',
+    'UPDATE card SET user_id = NULL WHERE user_id NOT IN (SELECT id FROM users)',
+    'DELETE FROM board_users WHERE board_id NOT IN (SELECT id FROM boards) OR user_id NOT IN (SELECT id FROM users)',
+    'DELETE FROM board_user_card_counts '
+    'WHERE board_id NOT IN (SELECT id FROM boards) OR user_id NOT IN (SELECT id FROM users)',
+)
+
+
+def _count_card(row, delta):
+    """
+    The _count_card function returns the trigger statements that add delta to the card counters of the list, the
+    board and the assigned user of a card row.
+    """
+    board_id = f'(SELECT board_id FROM board_list WHERE id = {row}.board_list_id)'
+    statements = (
+        f'UPDATE board_list SET card_count = card_count + {delta} WHERE id = {row}.board_list_id; '
+        f'UPDATE boards SET card_count = card_count + {delta} WHERE id = {board_id}; '
+    )
+    if delta > 0:
+        statements += (
+            f'INSERT INTO board_user_card_counts (board_id, user_id, card_count) '
+            f'SELECT board_id, {row}.user_id, {delta} FROM board_list '
+            f'WHERE id = {row}.board_list_id AND {row}.user_id IS NOT NULL '
+            f'ON CONFLICT (board_id, user_id) DO UPDATE SET card_count = card_count + {delta}; '
+        )
+    else:
+        statements += (
+            f'UPDATE board_user_card_counts SET card_count = card_count + {delta} '
+            f'WHERE board_id = {board_id} AND user_id = {row}.user_id; '
+            f'DELETE FROM board_user_card_counts '
+            f'WHERE board_id = {board_id} AND user_id = {row}.user_id AND card_count <= 0; '
+        )
+    return statements
+
+
+@migration(5)
+def add_card_counters(connection):
+    """
+    Add the card_count columns of boards and board lists and the board_user_card_counts table, kept up to date by
+    triggers on card in the same transaction as every insert, move, reassignment and delete, cascades included, and
+    fill them from the existing cards. The change log triggers on boards and board_list are narrowed to the columns
+    clients see, so counter updates are not logged as changes. Orphaned rows are deleted first.
+    """
+    for table in ('boards', 'board_list'):
+        columns = {row[1] for row in connection.execute(text(f'PRAGMA table_info({table})'))}
+        if 'card_count' not in columns:
+            connection.execute(text(f'ALTER TABLE {table} ADD COLUMN card_count INTEGER NOT NULL DEFAULT 0'))
+    connection.execute(text(
+        'CREATE TABLE IF NOT EXISTS board_user_card_counts ('
+        'board_id INTEGER NOT NULL REFERENCES boards (id), user_id INTEGER NOT NULL REFERENCES users (id), '
+        'card_count INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (board_id, user_id))'
+    ))
+    for statement in ORPHAN_DELETES:
+        connection.execute(text(statement))
+    connection.execute(text('DROP TRIGGER IF EXISTS boards_log_update'))
+    connection.execute(text('DROP TRIGGER IF EXISTS board_list_log_update'))
+    triggers = {
+        'boards_log_update': (
+            'AFTER UPDATE OF name, privacy, url ON boards', _log_change('new.id', 'board', 'new.id', 'update')
+        ),
+        'board_list_log_update': (
+            'AFTER UPDATE OF name, board_id, position ON board_list',
+            _log_change('new.board_id', 'board_list', 'new.id', 'update')
+        ),
+        'card_counts_insert': ('AFTER INSERT ON card', _count_card('new', 1)),
+        'card_counts_delete': ('AFTER DELETE ON card', _count_card('old', -1)),
+        'card_counts_update': (
+            'AFTER UPDATE OF board_list_id, user_id ON card '
+            'WHEN old.board_list_id IS NOT new.board_list_id OR old.user_id IS NOT new.user_id',
+            _count_card('old', -1) + _count_card('new', 1)
+        ),
+    }
+    for name, (event, body) in triggers.items():
+        connection.execute(text(f'CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body}END'))
+    repair_card_counts(connection)
+
+
+# Tables rebuilt by migration 6 with ON DELETE CASCADE foreign keys, in the order they are rebuilt. The column lists
+# are copied over by name, as ALTER TABLE ADD COLUMN in earlier migrations leaves old databases in another order.
+CASCADE_TABLES = {
+    'board_list': (
+        'CREATE TABLE board_list_new ('
+        'id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, board_id INTEGER, position VARCHAR(64) NOT NULL, '
+        'card_count INTEGER DEFAULT 0 NOT NULL, PRIMARY KEY (id), '
+        'CONSTRAINT uq_board_list_name_board_id UNIQUE (name, board_id), '
+        'FOREIGN KEY(board_id) REFERENCES boards (id) ON DELETE CASCADE)'
+    ),
+    'card': (
+        'CREATE TABLE card_new ('
+        'id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, description TEXT, board_list_id INTEGER NOT NULL, '
+        'position VARCHAR(64) NOT NULL, user_id INTEGER, PRIMARY KEY (id), '
+        'FOREIGN KEY(board_list_id) REFERENCES board_list (id) ON DELETE CASCADE, '
+        'FOREIGN KEY(user_id) REFERENCES users (id))'
+    ),
+    'board_users': (
+        'CREATE TABLE board_users_new ('
+        'board_id INTEGER NOT NULL, user_id INTEGER NOT NULL, PRIMARY KEY (board_id, user_id), '
+        'FOREIGN KEY(board_id) REFERENCES boards (id) ON DELETE CASCADE, '
+        'FOREIGN KEY(user_id) REFERENCES users (id) ON DELETE CASCADE)'
+    ),
+    'board_user_card_counts': (
+        'CREATE TABLE board_user_card_counts_new ('
+        'board_id INTEGER NOT NULL, user_id INTEGER NOT NULL, card_count INTEGER DEFAULT 0 NOT NULL, '
+        'PRIMARY KEY (board_id, user_id), '
+        'FOREIGN KEY(board_id) REFERENCES boards (id) ON DELETE CASCADE, '
+        'FOREIGN KEY(user_id) REFERENCES users (id) ON DELETE CASCADE)'
+    ),
+}
+
+def _cascades(connection, table):
+    """
+    The _cascades function tells whether every foreign key of a table to boards or board_list, and every foreign
+    key of board_users and board_user_card_counts, already deletes in cascade.
+    """
+    return all(
+        row[6] == 'CASCADE'
+        for row in connection.execute(text(f'PRAGMA foreign_key_list({table})'))
+        if row[2] in ('boards', 'board_list') or table in ('board_users', 'board_user_card_counts')
+    )
+
+
+@migration(6)
+def add_delete_cascades(connection):
+    """
+    Rebuild board_list, card, board_users and board_user_card_counts with ON DELETE CASCADE foreign keys, so deleting
+    a board or a board list is a single statement and the database removes the lists, cards, members and counters
+    under it. SQLite cannot change a foreign key in place, so each table is copied into a new one and renamed,
+    foreign key enforcement being off for the connection while it runs, and the indexes and triggers dropped with
+    the old tables are created again. A cascade deletes the cards of a list after the list itself, when the card
+    triggers can no longer find its board, so a trigger on board_list logs the card deletes and updates the board
+    and user counters before the list goes, unless the board is being deleted too.
+    """
+    connection.execute(text(
+        'CREATE TRIGGER IF NOT EXISTS board_list_delete_cards BEFORE DELETE ON board_list '
+        'WHEN EXISTS (SELECT 1 FROM boards WHERE id = old.board_id) BEGIN '
+        'INSERT INTO board_changes (board_id, seq, entity, entity_id, op) '
+        'SELECT old.board_id, (SELECT COALESCE(MAX(seq), 0) FROM board_changes WHERE board_id = old.board_id) '
+        "+ ROW_NUMBER() OVER (ORDER BY id), 'card', id, 'delete' FROM card WHERE board_list_id = old.id; "
+        'UPDATE boards SET card_count = card_count - old.card_count WHERE id = old.board_id; '
+        'UPDATE board_user_card_counts SET card_count = card_count - '
+        '(SELECT COUNT(*) FROM card WHERE board_list_id = old.id AND user_id = board_user_card_counts.user_id) '
+        'WHERE board_id = old.board_id; '
+        'DELETE FROM board_user_card_counts WHERE board_id = old.board_id AND card_count <= 0; '
+        'END'
+    ))
+    tables = [table for table in CASCADE_TABLES if not _cascades(connection, table)]
+    if not tables:
+        return
+    foreign_keys = connection.execute(text('PRAGMA foreign_keys')).scalar()
+    connection.execute(text('PRAGMA foreign_keys = OFF'))
+    try:
+        connection.exec_driver_sql('BEGIN')
+        for statement in ORPHAN_DELETES:
+            connection.execute(text(statement))
+        # Renaming a table checks every trigger of the schema, and fails on those naming a table that is being
+        # rebuilt, so all of them are dropped first and created again from their saved definitions.
+        triggers = connection.execute(text("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'")).all()
+        indexes = connection.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+            f"AND tbl_name IN ({', '.join(repr(table) for table in tables)})"
+        )).scalars().all()
+        for name, _ in triggers:
+            connection.execute(text(f'DROP TRIGGER {name}'))
+        for table in tables:
+            columns = ', '.join(row[1] for row in connection.execute(text(f'PRAGMA table_info({table})')))
+            connection.execute(text(CASCADE_TABLES[table]))
+            connection.execute(text(f'INSERT INTO {table}_new ({columns}) SELECT {columns} FROM {table}'))
+            connection.execute(text(f'DROP TABLE {table}'))
+            connection.execute(text(f'ALTER TABLE {table}_new RENAME TO {table}'))
+        for statement in indexes:
+            connection.execute(text(statement))
+        for _, statement in triggers:
+            connection.execute(text(statement))
+        violations = connection.execute(text('PRAGMA foreign_key_check')).all()
+        if violations:
+            raise RuntimeError(f'Foreign key violations after adding the delete cascades: {violations[:10]}')
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.execute(text(f'PRAGMA foreign_keys = {foreign_keys}'))
+
+
+@migration(7)
+def add_shard_tables(connection):
+    """
+    Add board_shards, the directory of the shard each board is stored on when the app is sharded, and
+    shard_sequences, the last id allocated to board lists and cards on a shard. Boards without a row in board_shards
+    are on shard 0, the main database, so an existing database becomes shard 0 as it is.
+    """
+    connection.execute(text(
+        'CREATE TABLE IF NOT EXISTS board_shards (board_id INTEGER NOT NULL, shard INTEGER NOT NULL, '
+        'PRIMARY KEY (board_id))'
+    ))
+    connection.execute(text(
+        'CREATE TABLE IF NOT EXISTS shard_sequences (name VARCHAR(64) NOT NULL, last_id INTEGER NOT NULL, '
+        'PRIMARY KEY (name))'
+    ))
+
+
+@migration(8)
+def add_rebalance_changes(connection):
+    """
+    Log a rebalance of positions as one change rather than one update per row, so renumbering a long list neither
+    floods the change log nor pushes its subscribers past its retention. While a list is renumbered it has a row in
+    position_rebalances: the update triggers of card and board_list skip the rows of that list, and the insert of the
+    row logs a card_positions change of the board list, or a board_list_positions change of the board.
+    """
+    connection.execute(text(
+        'CREATE TABLE IF NOT EXISTS position_rebalances (entity VARCHAR(20) NOT NULL, parent_id INTEGER NOT NULL, '
+        'PRIMARY KEY (entity, parent_id))'
+    ))
+    connection.execute(text('DROP TRIGGER IF EXISTS card_log_update'))
+    connection.execute(text('DROP TRIGGER IF EXISTS board_list_log_update'))
+    triggers = {
+        'card_log_update': (
+            'AFTER UPDATE ON card WHEN NOT EXISTS (SELECT 1 FROM position_rebalances '
+            "WHERE entity = 'card' AND parent_id = new.board_list_id)",
+            _log_card_change('new', 'update')
+        ),
+        'board_list_log_update': (
+            'AFTER UPDATE OF name, board_id, position ON board_list WHEN NOT EXISTS (SELECT 1 FROM position_rebalances '
+            "WHERE entity = 'board_list' AND parent_id = new.board_id)",
+            _log_change('new.board_id', 'board_list', 'new.id', 'update')
+        ),
+        'card_rebalance_log': (
+            "AFTER INSERT ON position_rebalances WHEN new.entity = 'card'",
+            "INSERT INTO board_changes (board_id, seq, entity, entity_id, op) "
+            "SELECT board_list.board_id, "
+            "COALESCE((SELECT MAX(seq) FROM board_changes WHERE board_id = board_list.board_id), 0) + 1, "
+            "'card_positions', board_list.id, 'update' "
+            "FROM board_list WHERE board_list.id = new.parent_id; "
+        ),
+        'board_list_rebalance_log': (
+            "AFTER INSERT ON position_rebalances WHEN new.entity = 'board_list'",
+            _log_change('new.parent_id', 'board_list_positions', 'new.parent_id', 'update')
+        ),
+    }
+    for name, (event, body) in triggers.items():
+        connection.execute(text(f'CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body}END'))
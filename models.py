@@ -1,9 +1,10 @@
-from initdb import db
-from sqlalchemy import UniqueConstraint
+from initdb import db, shard_engines
+from migrations import upgrade
+from sqlalchemy import Index, UniqueConstraint
 
 board_users = db.Table('board_users',
-    db.Column('board_id', db.Integer, db.ForeignKey('boards.id'), primary_key=True),
-    db.Column('user_id', db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    db.Column('board_id', db.Integer, db.ForeignKey('boards.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('user_id', db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
 )
 
 class User(db.Model):
@@ -22,11 +23,13 @@ class Board(db.Model):
     __tablename__ = 'boards'
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    name = db.Column(db.String(255), nullable=False)
+    name = db.Column(db.String(255), nullable=False, index=True)
     privacy = db.Column(db.String(20), default='PUBLIC')
     url = db.Column(db.String(100), unique=True)
-    users = db.relationship('User', secondary=board_users, backref=db.backref('boards', lazy='dynamic'))
-    board_lists = db.relationship('BoardList', backref='parent_board', cascade='all, delete')
+    card_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    users = db.relationship('User', secondary=board_users, backref=db.backref('boards', lazy='dynamic'),
+                            passive_deletes=True)
+    board_lists = db.relationship('BoardList', backref='parent_board', cascade='all, delete', passive_deletes=True)
 
     def __init__(self, name, privacy='PUBLIC'):
         self.name = name
@@ -39,27 +42,88 @@ class Board(db.Model):
 class BoardList(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    board_id = db.Column(db.Integer, db.ForeignKey('boards.id'))
-    board = db.relationship('Board', backref=db.backref('lists', lazy=True))
-    cards = db.relationship('Card', backref='parent_board_list', cascade='all, delete')
+    board_id = db.Column(db.Integer, db.ForeignKey('boards.id', ondelete='CASCADE'))
+    position = db.Column(db.String(64), nullable=False)
+    card_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    board = db.relationship('Board', backref=db.backref('lists', lazy=True, passive_deletes='all'))
+    cards = db.relationship('Card', backref='parent_board_list', cascade='all, delete', passive_deletes=True)
 
     __table_args__ = (
         UniqueConstraint('name', 'board_id', name='uq_board_list_name_board_id'),
+        Index('ix_board_list_board_id_position', 'board_id', 'position'),
     )
 
-    def __init__(self, name, board_id):
+    def __init__(self, name, board_id, position):
         self.name = name
         self.board_id = board_id
+        self.position = position
 
 class Card(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    board_list_id = db.Column(db.Integer, db.ForeignKey('board_list.id'), nullable=False)
-    board_list = db.relationship('BoardList', backref=db.backref('board_cards', lazy=True),overlaps='cards,parent_board_list')
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    board_list_id = db.Column(db.Integer, db.ForeignKey('board_list.id', ondelete='CASCADE'), nullable=False)
+    position = db.Column(db.String(64), nullable=False)
+    board_list = db.relationship('BoardList', backref=db.backref('board_cards', lazy=True, passive_deletes='all'),overlaps='cards,parent_board_list')
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
     user = db.relationship('User', backref=db.backref('cards', lazy=True))
-    
 
-# Initialize the database
-db.create_all()
\ No newline at end of file
+    __table_args__ = (
+        Index('ix_card_board_list_id_position', 'board_list_id', 'position'),
+    )
+
+
+# Append-only log of the changes to each board, its lists and its cards, written by the triggers of migration 4.
+board_changes = db.Table('board_changes',
+    db.Column('board_id', db.Integer, primary_key=True),
+    db.Column('seq', db.Integer, primary_key=True),
+    db.Column('entity', db.String(20), nullable=False),
+    db.Column('entity_id', db.Integer, nullable=False),
+    db.Column('op', db.String(10), nullable=False)
+)
+
+
+# The lists whose positions are being renumbered by utilities._rebalance_positions in the current transaction. The
+# change log triggers of migration 8 skip the updates of their rows and log the rebalance as a single change instead.
+position_rebalances = db.Table('position_rebalances',
+    db.Column('entity', db.String(20), primary_key=True),
+    db.Column('parent_id', db.Integer, primary_key=True)
+)
+
+
+# Number of cards assigned to each user on each board, kept by the triggers of migration 5.
+board_user_card_counts = db.Table('board_user_card_counts',
+    db.Column('board_id', db.Integer, db.ForeignKey('boards.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('user_id', db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('card_count', db.Integer, nullable=False, default=0, server_default='0')
+)
+
+
+# The shard each board is stored on in sharded mode, part of the directory kept in the main database. Boards without
+# a row are on shard 0. Rows are kept when a board is deleted, so its id is not handed out again.
+board_shards = db.Table('board_shards',
+    db.Column('board_id', db.Integer, primary_key=True),
+    db.Column('shard', db.Integer, nullable=False)
+)
+
+
+# The last board list and card id allocated on a shard in sharded mode, see shards.allocate_id.
+shard_sequences = db.Table('shard_sequences',
+    db.Column('name', db.String(64), primary_key=True),
+    db.Column('last_id', db.Integer, nullable=False)
+)
+
+
+def create_schema():
+    """
+    The create_schema function creates the tables that do not exist yet and applies the pending migrations, on every
+    shard when the app is sharded. Every shard gets the whole schema, so that the users a shard's rows refer to can be
+    copied into it and its foreign keys enforced.
+    It is run by the init-db command rather than on import, so starting the app never touches the schema.
+    Must be called inside an app context.
+    :return: The schema version of the database
+    """
+    for engine in shard_engines():
+        db.metadata.create_all(engine)
+        version = upgrade(engine)
+    return version
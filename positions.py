@@ -0,0 +1,212 @@
+import queue
+import threading
+
+from flask import current_app
+from werkzeug.local import LocalProxy
+
+# Fractional position keys. A key is a string made of an integer part, whose first character encodes its length,
+# and an optional fractional part; keys sort in plain byte order, which is how SQLite compares strings by default.
+# A key can always be generated between any two keys, so moving a row only ever writes the row itself.
+DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+FIRST_KEY = 'a0'
+SMALLEST_INTEGER = 'A' + '0' * 26
+POSITION_REBALANCE_LENGTH = 16
+
+
+def _integer_length(head):
+    if 'a' <= head <= 'z':
+        return ord(head) - ord('a') + 2
+    if 'A' <= head <= 'Z':
+        return ord('Z') - ord(head) + 2
+    raise ValueError(f'Invalid position key head: {head}')
+
+
+def _integer_part(key):
+    length = _integer_length(key[0])
+    if length > len(key):
+        raise ValueError(f'Invalid position key: {key}')
+    return key[:length]
+
+
+def _increment_integer(integer):
+    head, digits = integer[0], list(integer[1:])
+    for index in range(len(digits) - 1, -1, -1):
+        digit = DIGITS.index(digits[index]) + 1
+        if digit < len(DIGITS):
+            digits[index] = DIGITS[digit]
+            return head + ''.join(digits)
+        digits[index] = DIGITS[0]
+    if head == 'Z':
+        return 'a' + DIGITS[0]
+    if head == 'z':
+        return None
+    head = chr(ord(head) + 1)
+    if head > 'a':
+        digits.append(DIGITS[0])
+    else:
+        digits.pop()
+    return head + ''.join(digits)
+
+
+def _decrement_integer(integer):
+    head, digits = integer[0], list(integer[1:])
+    for index in range(len(digits) - 1, -1, -1):
+        digit = DIGITS.index(digits[index]) - 1
+        if digit >= 0:
+            digits[index] = DIGITS[digit]
+            return head + ''.join(digits)
+        digits[index] = DIGITS[-1]
+    if head == 'a':
+        return 'Z' + DIGITS[-1]
+    if head == 'A':
+        return None
+    head = chr(ord(head) - 1)
+    if head < 'Z':
+        digits.append(DIGITS[-1])
+    else:
+        digits.pop()
+    return head + ''.join(digits)
+
+
+def _midpoint(lower, upper):
+    """
+    The _midpoint function returns a fraction strictly between two fractional parts; upper None means 1.
+    """
+    if upper is not None:
+        prefix = 0
+        while (lower[prefix] if prefix < len(lower) else DIGITS[0]) == upper[prefix]:
+            prefix += 1
+        if prefix:
+            return upper[:prefix] + _midpoint(lower[prefix:], upper[prefix:])
+    lower_digit = DIGITS.index(lower[0]) if lower else 0
+    upper_digit = DIGITS.index(upper[0]) if upper is not None else len(DIGITS)
+    if upper_digit - lower_digit > 1:
+        return DIGITS[(lower_digit + upper_digit + 1) // 2]
+    if upper is not None and len(upper) > 1:
+        return upper[:1]
+    return DIGITS[lower_digit] + _midpoint(lower[1:], None)
+
+
+def key_between(lower, upper):
+    """
+    The key_between function generates a position key that sorts strictly between two keys.
+    :param lower: The key to sort after, or None for the start of the list
+    :param upper: The key to sort before, or None for the end of the list
+    :return: The new key, as short as possible
+    """
+    if lower is not None and upper is not None and lower >= upper:
+        raise ValueError(f'Position key {lower} is not below {upper}')
+    if lower is None:
+        if upper is None:
+            return FIRST_KEY
+        integer = _integer_part(upper)
+        fraction = upper[len(integer):]
+        if integer == SMALLEST_INTEGER:
+            return integer + _midpoint('', fraction)
+        if integer < upper:
+            return integer
+        decremented = _decrement_integer(integer)
+        if decremented is None:
+            raise ValueError('Cannot generate a position key below the smallest key')
+        return decremented
+    integer = _integer_part(lower)
+    fraction = lower[len(integer):]
+    if upper is None:
+        incremented = _increment_integer(integer)
+        return integer + _midpoint(fraction, None) if incremented is None else incremented
+    if integer == _integer_part(upper):
+        return integer + _midpoint(fraction, upper[len(integer):])
+    incremented = _increment_integer(integer)
+    if incremented is not None and incremented < upper:
+        return incremented
+    return integer + _midpoint(fraction, None)
+
+
+def sequential_keys(count, after=None):
+    """
+    The sequential_keys function generates keys for rows appended one after the other, e.g. 'a0', 'a1', ... 'az',
+    'b00'. Their length grows with the logarithm of the count.
+    :param count: The number of keys
+    :param after: The key of the last existing row, or None for an empty list
+    :return: A list of keys in ascending order
+    """
+    keys = []
+    for _ in range(count):
+        after = key_between(after, None)
+        keys.append(after)
+    return keys
+
+
+class PositionRebalancer(object):
+    """
+    The PositionRebalancer class rewrites the position keys of a list as short sequential keys, in a background
+    thread, once a move has produced a key longer than POSITION_REBALANCE_LENGTH. Moves between the same two rows
+    grow keys by about one character every six moves; rebalancing keeps them short without slowing the move down.
+    A rebalance keeps the order of the rows and is logged as a single change of the positions of the list, so it
+    costs subscribers of the change feed one entry and cached board snapshots one rebuild, whatever the length of
+    the list.
+    """
+
+    def __init__(self):
+        self.max_length = POSITION_REBALANCE_LENGTH
+        self.app = None
+        self.db = None
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def init_app(self, app, db):
+        """
+        The init_app function reads the length above which keys are rebalanced from the app config and makes this
+        rebalancer the one of the app, whose lists it rebalances.
+        :param app: The Flask application
+        :param db: The SQLAlchemy extension
+        """
+        self.max_length = app.config.setdefault('POSITION_REBALANCE_LENGTH', POSITION_REBALANCE_LENGTH)
+        self.app = app
+        self.db = db
+        app.extensions['position_rebalancer'] = self
+
+    def check(self, position, rebalance, parent_id):
+        """
+        The check function schedules a rebalance of a list when a key written to it is too long.
+        A list is only queued once until its rebalance has run.
+        :param position: The key that was written
+        :param rebalance: The function that rebalances the list, called with the parent id in an app context
+        :param parent_id: The id of the board or board list whose children are rebalanced
+        """
+        if self.app is None or len(position) <= self.max_length:
+            return
+        with self._lock:
+            if (rebalance, parent_id) in self._pending:
+                return
+            self._pending.add((rebalance, parent_id))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name='position-rebalancer', daemon=True)
+                self._thread.start()
+        self._queue.put((rebalance, parent_id))
+
+    def _work(self):
+        while True:
+            rebalance, parent_id = self._queue.get()
+            with self._lock:
+                self._pending.discard((rebalance, parent_id))
+            try:
+                with self.app.app_context():
+                    rebalance(parent_id)
+                    self.db.session.commit()
+            except Exception:
+                self.app.logger.exception('Rebalancing the positions of %s %s failed', rebalance.__name__, parent_id)
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        """
+        The join function waits until every scheduled rebalance has run.
+        """
+        self._queue.join()
+
+
+# The position rebalancer of the current app.
+position_rebalancer = LocalProxy(lambda: current_app.extensions['position_rebalancer'])
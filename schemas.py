@@ -0,0 +1,111 @@
+from flask import request
+from flask_restful import abort
+
+MISSING_MESSAGE = 'Missing required parameter in the JSON body or the post body or the query string'
+MISSING_ARGS_MESSAGE = 'Missing required parameter in the query string'
+
+
+class ValidationError(ValueError):
+    """
+    The ValidationError class is raised by Schema.validate with the same {argument: message} dictionary that
+    reqparse puts in the message of its 400 responses.
+    """
+
+    def __init__(self, messages):
+        super().__init__(messages)
+        self.messages = messages
+
+
+class Field(object):
+    """
+    The Field class declares one argument of a Schema. The options mean the same as the reqparse.Argument options of
+    the same name; append=True matches action='append'.
+    """
+    __slots__ = ('name', 'type', 'required', 'default', 'choices', 'help', 'append')
+
+    def __init__(self, name, type=str, required=False, default=None, choices=(), help=None, append=False):
+        self.name = name
+        self.type = type
+        self.required = required
+        self.default = default
+        self.choices = choices
+        self.help = help
+        self.append = append
+
+
+class Schema(object):
+    """
+    The Schema class is a declarative replacement for reqparse.RequestParser. The fields are compiled once into
+    plain tuples when the schema is created, and parse_args reads the parsed JSON body (or the query string for
+    location='args') a single time, instead of rebuilding a MultiDict of every request location for every argument.
+    Results, error messages and status codes are the same as reqparse's for the arguments used in this app.
+    """
+
+    def __init__(self, *fields, location='json'):
+        self.fields = fields
+        self.location = location
+        missing_message = MISSING_ARGS_MESSAGE if location == 'args' else MISSING_MESSAGE
+        self._compiled = tuple(
+            (field.name, field.type, field.required, field.default, frozenset(field.choices), field.help,
+             field.append, field.help or missing_message)
+            for field in fields
+        )
+
+    def validate(self, data):
+        """
+        The validate function converts and checks a mapping of raw values against the schema. A value that is a list
+        counts as several values of the argument, as with reqparse: all of them are kept for append fields and the
+        first one otherwise.
+        :param data: A dictionary of raw values
+        :return: A dictionary of converted values, with defaults for the arguments that are missing
+        """
+        result = {}
+        for name, convert, required, default, choices, help, append, missing_message in self._compiled:
+            value = data.get(name, data)
+            values = value if isinstance(value, list) else (value,)
+            if value is data or not values:
+                if required:
+                    raise ValidationError({name: missing_message})
+                result[name] = default() if callable(default) else default
+                continue
+            converted = []
+            for value in values:
+                if value is not None:
+                    try:
+                        value = convert(value)
+                    except Exception as error:
+                        raise ValidationError({name: help.format(error_msg=str(error)) if help else str(error)})
+                if choices and value not in choices:
+                    error = f'{value} is not a valid choice'
+                    raise ValidationError({name: help.format(error_msg=error) if help else error})
+                converted.append(value)
+            result[name] = converted if append else converted[0]
+        return result
+
+    def source(self):
+        """
+        The source function returns the raw values of the current request. For JSON payloads this is the parsed
+        body, with any argument the body does not set taken from the query string; a request without a JSON
+        content type gets the same 415 error reqparse gives it.
+        :return: A dictionary of raw values
+        """
+        if self.location == 'args':
+            return {key: values for key, values in request.args.lists()}
+        data = request.get_json()
+        data = data if isinstance(data, dict) else {}
+        if request.args:
+            for key, values in request.args.lists():
+                if key not in data:
+                    data[key] = values
+        return data
+
+    def parse_args(self):
+        """
+        The parse_args function validates the current request against the schema, aborting with a 400 error on
+        the first invalid argument.
+        :return: A dictionary of converted values
+        """
+        try:
+            return self.validate(self.source())
+        except ValidationError as error:
+            abort(400, message=error.messages)
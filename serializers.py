@@ -0,0 +1,101 @@
+import json
+
+from flask import current_app, make_response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class CardRow(object):
+    """
+    The CardRow class is the compact representation of a card in board trees and board lists, built straight from
+    an (id, name, description, user_id) result tuple.
+    """
+    __slots__ = ('id', 'name', 'description', 'user_id')
+
+    def __init__(self, id, name, description, user_id):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.user_id = user_id
+
+    def to_dict(self):
+        return {
+            'card_id': self.id,
+            'card_name': self.name,
+            'card_description': self.description,
+            'assigned_user': self.user_id or None
+        }
+
+
+class BoardListRow(object):
+    """
+    The BoardListRow class is the compact representation of a board list and its cards in board trees, built from
+    an (id, name) result tuple.
+    """
+    __slots__ = ('id', 'name', 'cards')
+
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+        self.cards = []
+
+    def to_dict(self):
+        return {
+            'board_list_id': self.id,
+            'board_list_name': self.name,
+            'cards': self.cards
+        }
+
+
+def _default(obj):
+    """
+    The _default function is the JSON encoder hook that turns row objects into dictionaries while encoding, so
+    responses never hold a second, dictionary copy of a board tree.
+    """
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def dumps(data, indent=False):
+    """
+    The dumps function encodes data as JSON, with orjson when it is installed and the standard library otherwise.
+    :param data: The data to encode, which may contain row objects
+    :param indent: Pretty print the output
+    :return: The encoded JSON as bytes
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(data, default=_default, option=option)
+    return json.dumps(data, default=_default, indent=4 if indent else None).encode('utf-8')
+
+
+def loads(data):
+    """
+    The loads function decodes JSON, with orjson when it is installed and the standard library otherwise.
+    :param data: The JSON document as bytes or str
+    :return: The decoded data
+    :raises ValueError: If data is not valid JSON
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def output_json(data, code, headers=None):
+    """
+    The output_json function is the application/json representation of the api. It replaces Flask-RESTful's, which
+    always encodes with the standard library, and keeps its behaviour of pretty printing in debug mode and ending
+    the body with a newline. When RESTFUL_JSON settings are configured the standard library is used with them.
+    """
+    settings = current_app.config.get('RESTFUL_JSON')
+    if settings:
+        body = (json.dumps(data, default=_default, **settings) + '\n').encode('utf-8')
+    else:
+        body = dumps(data, indent=current_app.debug) + b'\n'
+    response = make_response(body, code)
+    response.headers.extend(headers or {})
+    return response
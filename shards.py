@@ -0,0 +1,305 @@
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context
+from sqlalchemy import delete, event, insert, select, text
+from initdb import db, shard_bind
+from models import Board, BoardList, Card, User, board_changes, board_shards, board_users
+
+# Sharded storage, enabled by setting SHARDS above 1: boards, their members, lists, cards, counters and change log
+# are stored on one of SHARDS SQLite databases, picked by board id when the board is created. Shard 0 is the main
+# database, which also holds the directory: the users and board_shards, the shard of every board. Shards keep a copy
+# of the users their boards refer to. The shard of the current app context is kept in g.shard and used by
+# RoutingSession for every statement but those on directory tables.
+
+# Board lists and cards created on shard n get ids above n * SHARD_ID_SPAN, so they stay unique when a board is moved
+# to another shard, and the shard a row was created on can be read from its id.
+SHARD_ID_SPAN = 10 ** 12
+# Rows read and written per round trip when a board is moved.
+MOVE_CHUNK_SIZE = 1000
+
+
+def shard_count():
+    """
+    The shard_count function returns the number of shards of the current app, 1 when it is not sharded.
+    :return: The number of shards
+    """
+    return current_app.config.get('SHARDS', 1)
+
+
+def current_shard():
+    """
+    The current_shard function returns the shard selected for the current app context.
+    :return: The number of the shard, 0 when none was selected
+    """
+    return g.get('shard', 0)
+
+
+def use_shard(shard):
+    """
+    The use_shard function selects the shard the session reads and writes boards, lists and cards on for the rest of
+    the app context.
+    :param shard: The number of the shard
+    """
+    if not 0 <= shard < shard_count():
+        raise RuntimeError(f'Shard {shard} is not configured, SHARDS is {shard_count()}.')
+    g.shard = shard
+
+
+@contextmanager
+def on_shard(shard):
+    """
+    The on_shard function selects a shard for the duration of a with block, and the shard selected before after it.
+    :param shard: The number of the shard
+    """
+    previous = current_shard()
+    use_shard(shard)
+    try:
+        yield shard
+    finally:
+        g.shard = previous
+
+
+def each_shard():
+    """
+    The each_shard function selects every shard in turn, for scatter-gather reads, and the shard selected before
+    once done.
+    :return: A generator of shard numbers
+    """
+    for shard in range(shard_count()):
+        with on_shard(shard):
+            yield shard
+
+
+def directory_connection():
+    """
+    The directory_connection function returns the connection of the current session to the directory database.
+    :return: A connection
+    """
+    return db.session.connection(bind_arguments={'clause': board_shards})
+
+
+def board_shard(board_id):
+    """
+    The board_shard function looks the shard of a board up in the directory.
+    :param board_id: The id of the board
+    :return: The number of the shard, 0 when the board has no directory entry or the app is not sharded
+    """
+    if shard_count() == 1:
+        return 0
+    shard = directory_connection().scalar(select(board_shards.c.shard).where(board_shards.c.board_id == board_id))
+    return shard or 0
+
+
+def board_shards_of(board_ids):
+    """
+    The board_shards_of function looks the shards of several boards up in the directory with one query.
+    :param board_ids: The ids of the boards
+    :return: A dictionary of shard numbers by board id
+    """
+    shards = dict.fromkeys(board_ids, 0)
+    if shards and shard_count() > 1:
+        shards.update(directory_connection().execute(
+            select(board_shards.c.board_id, board_shards.c.shard).where(board_shards.c.board_id.in_(shards))
+        ).all())
+    return shards
+
+
+def find_shard(model, row_id):
+    """
+    The find_shard function finds the shard holding a board list or card, trying the shard its id was allocated on
+    first and then the others, as the board may have been moved since.
+    :param model: BoardList or Card
+    :param row_id: The id of the row
+    :return: The number of the shard, or None if no shard holds the row
+    """
+    if shard_count() == 1:
+        return 0
+    home = row_id // SHARD_ID_SPAN if row_id > 0 else 0
+    table = model.__table__
+    for shard in sorted(range(shard_count()), key=lambda shard: shard != home):
+        with on_shard(shard):
+            if db.session.connection().scalar(select(table.c.id).where(table.c.id == row_id)) is not None:
+                return shard
+    return None
+
+
+def place_board():
+    """
+    The place_board function allocates the id of a new board in the directory, places it on shard id % SHARDS and
+    selects that shard. The id is above every board id handed out before, including those of boards created before
+    the app was sharded. Nothing is done when the app is not sharded.
+    :return: The id of the new board, or None when the app is not sharded and the database allocates it
+    """
+    if shard_count() == 1:
+        return None
+    board_id, shard = directory_connection().execute(text(
+        'INSERT INTO board_shards (board_id, shard) '
+        'SELECT id, id % :shards FROM (SELECT MAX(COALESCE((SELECT MAX(board_id) FROM board_shards), 0), '
+        'COALESCE((SELECT MAX(id) FROM boards), 0)) + 1 AS id) '
+        'RETURNING board_id, shard'
+    ), {'shards': shard_count()}).one()
+    use_shard(shard)
+    return board_id
+
+
+def allocate_id(connection, table, count=1):
+    """
+    The allocate_id function allocates ids for new rows of a board list or card table from the id range of the
+    current shard, above the last id allocated and the highest id in use in the range. The shard_sequences row is
+    updated in the same statement, which takes the write lock of the shard before anything is read, so concurrent
+    requests never get the same id.
+    :param connection: The connection to the shard
+    :param table: The table
+    :param count: The number of ids
+    :return: The first of count consecutive ids
+    """
+    base = current_shard() * SHARD_ID_SPAN
+    last = connection.scalar(text(
+        'INSERT INTO shard_sequences (name, last_id) '
+        f'SELECT :name, COALESCE(MAX(id), :base) + :count FROM {table.name} WHERE id > :base AND id <= :top '
+        'ON CONFLICT (name) DO UPDATE SET last_id = MAX(last_id, excluded.last_id - :count) + :count '
+        'RETURNING last_id'
+    ), {'name': table.name, 'base': base, 'top': base + SHARD_ID_SPAN, 'count': count})
+    return last - count + 1
+
+
+def assign_ids(connection, table, rows):
+    """
+    The assign_ids function sets the ids of board list or card rows about to be bulk inserted when the app is
+    sharded, see allocate_id. Otherwise the database allocates them as usual.
+    :param connection: The connection to the shard
+    :param table: The table
+    :param rows: A list of dictionaries of column values
+    """
+    if rows and shard_count() > 1:
+        first = allocate_id(connection, table, len(rows))
+        for offset, row in enumerate(rows):
+            row['id'] = first + offset
+
+
+@event.listens_for(BoardList, 'before_insert')
+@event.listens_for(Card, 'before_insert')
+def _allocate_row_id(mapper, connection, target):
+    if target.id is None and has_app_context() and shard_count() > 1:
+        target.id = allocate_id(connection, mapper.local_table)
+
+
+def mirror_users(user_ids, connection=None):
+    """
+    The mirror_users function copies users from the directory into the current shard, unless it holds them already,
+    so that its members and cards can refer to them. Users never change once created, so the copies stay current.
+    :param user_ids: The ids of the users
+    :param connection: The connection to the shard, by default the one of the current session
+    """
+    if not user_ids or shard_count() == 1 or current_shard() == 0:
+        return
+    _copy_users(directory_connection(), connection or db.session.connection(), user_ids)
+
+
+def _copy_users(source, target, user_ids):
+    user_table = User.__table__
+    rows = source.execute(select(user_table).where(user_table.c.id.in_(list(user_ids)))).mappings().all()
+    if rows:
+        target.execute(insert(user_table).prefix_with('OR IGNORE'), [dict(row) for row in rows])
+
+
+def _copy_rows(source, target, query, table, **overrides):
+    for rows in source.execution_options(yield_per=MOVE_CHUNK_SIZE).execute(query).mappings().partitions():
+        target.execute(insert(table), [dict(row, **overrides) for row in rows])
+
+
+def move_board(board_id, shard):
+    """
+    The move_board function moves a board with its members, lists, cards and change log to another shard and points
+    its directory entry at it. Lists and cards keep their ids, and the counters are rebuilt by the triggers as the
+    cards are copied. The source shard is locked for writes while the board is copied, and the board is deleted from
+    it once the copy and the directory are committed; a request still writing to the board on the source shard at
+    that point fails.
+    :param board_id: The id of the board
+    :param shard: The number of the shard to move it to
+    :return: The number of the shard the board was on
+    :raises ValueError: If the board or the shard does not exist
+    """
+    if not 0 <= shard < shard_count():
+        raise ValueError(f'Shard {shard} is not configured, SHARDS is {shard_count()}.')
+    with db.engine.connect() as directory:
+        source_shard = directory.scalar(
+            select(board_shards.c.shard).where(board_shards.c.board_id == board_id)
+        ) or 0
+    if source_shard == shard:
+        return source_shard
+    board_table, board_list_table, card_table = Board.__table__, BoardList.__table__, Card.__table__
+    with db.engines[shard_bind(source_shard)].connect() as source, db.engines[shard_bind(shard)].connect() as target:
+        source.exec_driver_sql('BEGIN IMMEDIATE')
+        board = source.execute(select(board_table).where(board_table.c.id == board_id)).mappings().first()
+        if board is None:
+            raise ValueError(f'Board {board_id} does not exist.')
+        lists = select(board_list_table.c.id).where(board_list_table.c.board_id == board_id)
+        user_ids = set(source.scalars(select(board_users.c.user_id).where(board_users.c.board_id == board_id)))
+        user_ids.update(source.scalars(
+            select(card_table.c.user_id).distinct().where(card_table.c.board_list_id.in_(lists),
+                                                          card_table.c.user_id.isnot(None))
+        ))
+
+        target.exec_driver_sql('BEGIN IMMEDIATE')
+        # A copy left behind by a move that was interrupted before the directory was updated.
+        target.execute(delete(board_table).where(board_table.c.id == board_id))
+        with db.engine.connect() as directory:
+            _copy_users(directory, target, user_ids)
+        target.execute(insert(board_table), dict(board, card_count=0))
+        _copy_rows(source, target, select(board_users).where(board_users.c.board_id == board_id), board_users)
+        _copy_rows(source, target, select(board_list_table).where(board_list_table.c.board_id == board_id),
+                   board_list_table, card_count=0)
+        _copy_rows(source, target, select(card_table).where(card_table.c.board_list_id.in_(lists)), card_table)
+        # The triggers logged the copy as new changes; the board keeps its own log, and the seq clients follow.
+        target.execute(delete(board_changes).where(board_changes.c.board_id == board_id))
+        _copy_rows(source, target, select(board_changes).where(board_changes.c.board_id == board_id)
+                   .order_by(board_changes.c.seq), board_changes)
+
+        # The directory lives on shard 0, whose write lock one of the two connections may already hold.
+        placement = text('INSERT INTO board_shards (board_id, shard) VALUES (:board_id, :shard) '
+                         'ON CONFLICT (board_id) DO UPDATE SET shard = excluded.shard')
+        parameters = {'board_id': board_id, 'shard': shard}
+        if shard == 0:
+            target.execute(placement, parameters)
+        target.commit()
+        if source_shard == 0:
+            source.execute(placement, parameters)
+        elif shard != 0:
+            with db.engine.begin() as directory:
+                directory.execute(placement, parameters)
+        source.execute(delete(board_table).where(board_table.c.id == board_id))
+        source.execute(delete(board_changes).where(board_changes.c.board_id == board_id))
+        source.commit()
+    return source_shard
+
+
+def plan_rebalance(max_moves=None):
+    """
+    The plan_rebalance function plans board moves that even out the number of cards and boards on each shard. It
+    repeatedly moves the board that best closes the gap between the fullest and the emptiest shard, as long as a
+    move makes that gap smaller.
+    :param max_moves: The maximum number of moves, or None for no limit
+    :return: A list of (board_id, source shard, target shard) tuples, in the order to run them
+    """
+    board_table = Board.__table__
+    boards = {}
+    placements = dict(directory_connection().execute(select(board_shards.c.board_id, board_shards.c.shard)).all())
+    for shard in each_shard():
+        boards[shard] = {board_id: card_count + 1 for board_id, card_count in db.session.connection().execute(
+            select(board_table.c.id, board_table.c.card_count)) if placements.get(board_id, 0) == shard}
+    loads = {shard: sum(weights.values()) for shard, weights in boards.items()}
+    moves = []
+    while max_moves is None or len(moves) < max_moves:
+        fullest, emptiest = max(loads, key=loads.get), min(loads, key=loads.get)
+        gap = loads[fullest] - loads[emptiest]
+        candidates = [board_id for board_id, weight in boards[fullest].items() if weight < gap]
+        if not candidates:
+            break
+        board_id = min(candidates, key=lambda board_id: (abs(gap - 2 * boards[fullest][board_id]), board_id))
+        weight = boards[fullest].pop(board_id)
+        boards[emptiest][board_id] = weight
+        loads[fullest] -= weight
+        loads[emptiest] += weight
+        moves.append((board_id, fullest, emptiest))
+    return moves
@@ -0,0 +1,19 @@
+import pytest
+
+from app import create_app
+from models import create_schema
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """
+    The make_app fixture returns a function that builds the app on a fresh SQLite database file with the given config
+    values and creates its schema.
+    """
+    def make(**config):
+        config.setdefault('SQLALCHEMY_DATABASE_URI', f'sqlite:///{tmp_path / "minimalboard.db"}')
+        app = create_app(config)
+        with app.app_context():
+            create_schema()
+        return app
+    return make
@@ -0,0 +1,15 @@
+def test_apps_do_not_share_settings(make_app, tmp_path):
+    first = make_app(SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path / "first.db"}', GROUP_COMMIT=True)
+    second = make_app(SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path / "second.db"}')
+    assert first.config['GROUP_COMMIT'] is True
+    assert second.config['GROUP_COMMIT'] is False
+
+    first_client, second_client = first.test_client(), second.test_client()
+    for client, name in ((first_client, 'first'), (second_client, 'second')):
+        assert client.post('/boards', json={'name': name}).status_code == 201
+        assert client.post('/boardlists', json={'name': name, 'board_id': 1}).status_code == 201
+    # The card goes through the group commit writer of the first app, which writes to the database of that app.
+    assert first_client.post('/cards', json={'name': 'card', 'board_list_id': 1}).status_code == 201
+
+    assert [card['card_name'] for card in first_client.get('/boards/1').get_json()['board_lists'][0]['cards']] == ['card']
+    assert second_client.get('/boards/1').get_json()['board_lists'][0]['cards'] == []
@@ -0,0 +1,105 @@
+import asyncio
+import json
+import time
+
+from asgi import create_asgi_app, wsgi_environ
+
+
+async def call(app, method, path, body=None, query='', chunk_size=None, disconnect_after=None):
+    """
+    The call function sends a request to an ASGI app and returns its status, its body and the number of body messages.
+    The body is sent in chunks of chunk_size bytes, and the client disconnects after disconnect_after seconds.
+    """
+    headers = [(b'host', b'localhost')]
+    if body is not None:
+        headers.append((b'content-type', b'application/json'))
+        body = body if isinstance(body, bytes) else json.dumps(body).encode()
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(), 'headers': headers}
+    body = body or b''
+    size = chunk_size or max(len(body), 1)
+    requests = [{'type': 'http.request', 'body': body[start:start + size], 'more_body': start + size < len(body)}
+                for start in range(0, max(len(body), 1), size)]
+    messages = []
+
+    async def receive():
+        if requests:
+            return requests.pop(0)
+        if disconnect_after is None:
+            await asyncio.Event().wait()
+        await asyncio.sleep(disconnect_after)
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return messages[0]['status'], b''.join(message.get('body', b'') for message in messages[1:]), len(messages) - 1
+
+
+def test_routes_are_served_like_the_flask_app(make_app):
+    flask_app = make_app()
+    app = create_asgi_app(flask_app)
+    client = flask_app.test_client()
+
+    async def scenario():
+        assert (await call(app, 'POST', '/boards', {'name': 'board'}))[0] == 201
+        assert (await call(app, 'POST', '/boardlists', {'name': 'list', 'board_id': 1}))[0] == 201
+        operations = [{'op': 'create', 'name': name, 'board_list_id': 1} for name in ('a', 'b')]
+        assert (await call(app, 'POST', '/cards/batch', {'operations': operations}))[0] == 200
+        for path in ('/boards/1', '/boardlists/1', '/all_boards_data', '/boards/2'):
+            status, body, _ = await call(app, 'GET', path)
+            response = client.get(path)
+            assert (status, body) == (response.status_code, response.get_data())
+        status, body, messages = await call(app, 'GET', '/boards/1/export')
+        assert status == 200 and messages > 2 and body == client.get('/boards/1/export').get_data()
+
+        # The export is posted back in small chunks, without a length, and read as it arrives.
+        status, result, _ = await call(app, 'POST', '/boards/import', body, query='name=copy', chunk_size=16)
+        assert status == 201 and json.loads(result)['board_id'] == 2
+        assert client.get('/boards/2').get_json()['name'] == 'copy'
+
+    asyncio.run(scenario())
+    # The requests ran on the pool of the aiosqlite engine.
+    assert app.engines[None].sync_engine.dialect.driver == 'aiosqlite'
+    assert app.engines[None].sync_engine.pool.checkedin() > 0
+
+
+def test_waiting_change_feed_requests_hold_no_connection(make_app):
+    app = create_asgi_app(make_app(SQLALCHEMY_ENGINE_OPTIONS={'pool_size': 1, 'max_overflow': 0},
+                                   CHANGE_FEED_POLL_INTERVAL=10))
+
+    async def scenario():
+        assert (await call(app, 'POST', '/boards', {'name': 'board'}))[0] == 201
+        seq = json.loads((await call(app, 'GET', '/boards/1/changes', query='since=-1'))[1])['seq']
+        waiters = [asyncio.ensure_future(call(app, 'GET', '/boards/1/changes', query=f'since={seq}&wait=5'))
+                   for _ in range(20)]
+        await asyncio.sleep(0.2)
+        started = time.monotonic()
+        assert (await call(app, 'GET', '/all_boards'))[0] == 200
+        assert (await call(app, 'PUT', '/boards/1', {'name': 'renamed'}))[0] == 200
+        for status, body, _ in await asyncio.gather(*waiters):
+            assert status == 200
+            assert [change['op'] for change in json.loads(body)['changes']] == ['update']
+        assert time.monotonic() - started < 2
+
+    asyncio.run(scenario())
+
+
+def test_waiting_stops_when_the_client_disconnects(make_app):
+    app = create_asgi_app(make_app(CHANGE_FEED_POLL_INTERVAL=10))
+
+    async def scenario():
+        assert (await call(app, 'POST', '/boards', {'name': 'board'}))[0] == 201
+        started = time.monotonic()
+        await call(app, 'GET', '/boards/1/changes', query='since=0&wait=30', disconnect_after=0.1)
+        assert time.monotonic() - started < 2
+
+    asyncio.run(scenario())
+
+
+def test_repeated_cookie_headers_are_joined_with_semicolons():
+    scope = {'method': 'GET', 'path': '/', 'headers': [(b'cookie', b'a=1'), (b'cookie', b'b=2'),
+                                                        (b'accept', b'text/html'), (b'accept', b'*/*')]}
+    environ = wsgi_environ(scope, None)
+    assert environ['HTTP_COOKIE'] == 'a=1; b=2'
+    assert environ['HTTP_ACCEPT'] == 'text/html,*/*'
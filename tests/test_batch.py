@@ -0,0 +1,85 @@
+import pytest
+
+
+@pytest.fixture
+def client(make_app):
+    """
+    The client fixture returns a test client of an app with two boards: board 1 with lists 1 and 2 and cards 1 to 3,
+    user 1 as member, and board 2 with list 3 and card 4. User 2 is no member of either board.
+    """
+    client = make_app().test_client()
+    for name, email in (('Ada', 'ada@example.com'), ('Alan', 'alan@example.com')):
+        assert client.post('/users', json={'name': name, 'email': email}).status_code == 201
+    for name in ('first', 'second'):
+        assert client.post('/boards', json={'name': name}).status_code == 201
+    assert client.patch('/boards/1', json={'user_ids': [1]}).status_code == 200
+    for name, board_id in (('todo', 1), ('done', 1), ('other', 2)):
+        assert client.post('/boardlists', json={'name': name, 'board_id': board_id}).status_code == 201
+    for name, board_list_id in (('a', 1), ('b', 1), ('c', 2), ('d', 3)):
+        assert client.post('/cards', json={'name': name, 'board_list_id': board_list_id}).status_code == 201
+    return client
+
+
+def batch(client, *operations):
+    response = client.post('/cards/batch', json={'operations': list(operations)})
+    assert response.status_code == 200
+    return response.get_json()['results']
+
+
+def cards(client, board_id):
+    return {board_list['board_list_id']: [(card['card_id'], card['card_name'], card['assigned_user'])
+                                          for card in board_list['cards']]
+            for board_list in client.get(f'/boards/{board_id}').get_json()['board_lists']}
+
+
+def test_every_operation_gets_its_own_result(client):
+    results = batch(
+        client,
+        {'op': 'create', 'name': 'e', 'board_list_id': 2, 'user_id': 1},
+        {'op': 'create', 'board_list_id': 2},
+        {'op': 'create', 'name': 'f', 'board_list_id': 99},
+        {'op': 'update', 'card_id': 1, 'name': 'renamed'},
+        {'op': 'update', 'card_id': 99, 'name': 'missing'},
+        {'op': 'move', 'card_id': 2, 'board_list_id': 2},
+        {'op': 'update', 'card_id': 3, 'user_id': 2},
+        {'op': 'archive', 'card_id': 3},
+        {'op': 'update', 'card_id': 'three'},
+    )
+    assert [result['status'] for result in results] == [201, 400, 404, 200, 404, 200, 500, 400, 400]
+    assert results[0]['card_id'] == 5
+    assert results[1]['message'] == {'name': 'Name is required.'}
+    assert results[2]['message'] == 'Board List not found.'
+    assert results[4]['message'] == 'Card not found.'
+    assert results[6]['message'] == 'Add user to first board to access within card'
+
+    # The failed operations are skipped and the others written.
+    assert cards(client, 1) == {1: [(1, 'renamed', None)],
+                                2: [(3, 'c', None), (5, 'e', 1), (2, 'b', None)]}
+
+
+def test_operations_on_a_card_deleted_earlier_in_the_batch_fail(client):
+    results = batch(
+        client,
+        {'op': 'update', 'card_id': 2, 'name': 'gone anyway'},
+        {'op': 'delete', 'card_id': 2},
+        {'op': 'delete', 'card_id': 1},
+        {'op': 'update', 'card_id': 1, 'name': 'too late'},
+        {'op': 'move', 'card_id': 1, 'board_list_id': 2},
+    )
+    assert [result['status'] for result in results] == [200, 200, 200, 404, 404]
+    assert cards(client, 1) == {1: [], 2: [(3, 'c', None)]}
+
+
+def test_cards_do_not_move_to_another_board(client):
+    results = batch(
+        client,
+        {'op': 'move', 'card_id': 1, 'board_list_id': 3},
+        {'op': 'update', 'card_id': 4, 'board_list_id': 1, 'name': 'moved'},
+        {'op': 'move', 'card_id': 1, 'board_list_id': 2},
+        {'op': 'move', 'card_id': 1, 'board_list_id': 3},
+    )
+    assert [result['status'] for result in results] == [500, 500, 200, 500]
+    assert all(result['message'] == 'Cannot assign card to board list that is not in the same board'
+               for result in results if result['status'] == 500)
+    assert cards(client, 1) == {1: [(2, 'b', None)], 2: [(3, 'c', None), (1, 'a', None)]}
+    assert cards(client, 2) == {3: [(4, 'd', None)]}
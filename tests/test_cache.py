@@ -0,0 +1,31 @@
+import sqlite3
+
+
+def test_board_changed_by_another_process_is_not_served_from_cache(make_app, tmp_path):
+    app = make_app()
+    client = app.test_client()
+    assert client.post('/boards', json={'name': 'board'}).status_code == 201
+    response = client.get('/boards/1')
+    etag = response.headers['ETag']
+    assert response.get_json()['name'] == 'board'
+    assert client.get('/boards/1', headers={'If-None-Match': etag}).status_code == 304
+
+    with sqlite3.connect(tmp_path / 'minimalboard.db') as connection:
+        connection.execute("UPDATE boards SET name = 'renamed' WHERE id = 1")
+
+    response = client.get('/boards/1', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['name'] == 'renamed'
+    assert response.headers['ETag'] != etag
+
+
+def test_apps_do_not_share_snapshots(make_app, tmp_path):
+    alpha = make_app(SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path / "alpha.db"}')
+    beta = make_app(SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path / "beta.db"}')
+    alpha_client, beta_client = alpha.test_client(), beta.test_client()
+    assert alpha_client.post('/boards', json={'name': 'alpha'}).status_code == 201
+    assert beta_client.post('/boards', json={'name': 'beta'}).status_code == 201
+
+    assert beta_client.get('/boards/1').get_json()['name'] == 'beta'
+    assert alpha_client.get('/boards/1').get_json()['name'] == 'alpha'
+    assert beta_client.get('/boards/1').get_json()['name'] == 'beta'
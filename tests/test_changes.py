@@ -0,0 +1,59 @@
+import sqlite3
+import threading
+import time
+
+from initdb import db
+from utilities import rebalance_board_list_positions, rebalance_card_positions
+
+
+def test_waiting_requests_release_their_connections(make_app):
+    app = make_app(SQLALCHEMY_ENGINE_OPTIONS={'pool_size': 2, 'max_overflow': 0, 'pool_timeout': 2},
+                   CHANGE_FEED_MAX_WAIT=6, CHANGE_FEED_POLL_INTERVAL=0.2)
+    client = app.test_client()
+    assert client.post('/boards', json={'name': 'board'}).status_code == 201
+    seq = client.get('/boards/1/changes?since=-1').get_json()['seq']
+
+    responses = []
+    waiters = [threading.Thread(target=lambda: responses.append(client.get(f'/boards/1/changes?since={seq}&wait=4')))
+               for _ in range(2)]
+    for waiter in waiters:
+        waiter.start()
+    time.sleep(0.5)
+    assert client.get('/all_boards').status_code == 200
+    assert client.put('/boards/1', json={'name': 'renamed'}).status_code == 200
+    for waiter in waiters:
+        waiter.join()
+
+    assert [response.status_code for response in responses] == [200, 200]
+    assert all(response.get_json()['changes'] for response in responses)
+
+
+def test_rebalance_is_logged_as_one_change(make_app, tmp_path):
+    app = make_app(POSITION_REBALANCE_LENGTH=1000)
+    client = app.test_client()
+    assert client.post('/boards', json={'name': 'board'}).status_code == 201
+    assert client.post('/boardlists', json={'name': 'list', 'board_id': 1}).status_code == 201
+    with sqlite3.connect(tmp_path / 'minimalboard.db') as connection:
+        connection.executemany('INSERT INTO card (name, board_list_id, position) VALUES (?, 1, ?)',
+                               [(f'card {index}', f'a{index:05d}') for index in range(1200)])
+    seq = client.get('/boards/1/changes?since=-1').get_json()['seq']
+
+    with app.app_context():
+        rebalance_card_positions(1)
+        rebalance_board_list_positions(1)
+        db.session.commit()
+    response = client.get(f'/boards/1/changes?since={seq}')
+    assert response.status_code == 200
+    changes = response.get_json()['changes']
+    assert [(change['type'], change['id']) for change in changes] == [('card_positions', 1),
+                                                                       ('board_list_positions', 1)]
+    assert [card['card_id'] for card in changes[0]['data']['cards']] == list(range(1, 1201))
+    assert changes[0]['data']['cards'][0]['position'] == 'a0'
+    assert changes[1]['data'] == {'id': 1, 'board_lists': [{'board_list_id': 1, 'position': 'a0'}]}
+
+    # Updates outside of a rebalance are logged as before.
+    seq = response.get_json()['seq']
+    assert client.put('/cards/5', json={'name': 'renamed'}).status_code == 200
+    changes = client.get(f'/boards/1/changes?since={seq}').get_json()['changes']
+    assert [(change['type'], change['id'], change['data']['card_name']) for change in changes] == \
+        [('card', 5, 'renamed')]
@@ -0,0 +1,82 @@
+import json
+
+
+def board_contents(client, board_id):
+    board = client.get(f'/boards/{board_id}').get_json()
+    return board['name'], [(board_list['board_list_name'],
+                            [(card['card_name'], card['card_description'], card['assigned_user'])
+                             for card in board_list['cards']])
+                           for board_list in board['board_lists']]
+
+
+def test_exported_board_is_imported_with_new_ids(make_app, tmp_path):
+    source = make_app().test_client()
+    for name, email in (('Ada', 'ada@example.com'), ('Alan', 'alan@example.com'), ('Grace', 'grace@example.com')):
+        assert source.post('/users', json={'name': name, 'email': email}).status_code == 201
+    assert source.post('/boards', json={'name': 'roadmap'}).status_code == 201
+    assert source.patch('/boards/1', json={'user_ids': [1, 2]}).status_code == 200
+    for name in ('todo', 'done'):
+        assert source.post('/boardlists', json={'name': name, 'board_id': 1}).status_code == 201
+    for name, board_list_id in (('a', 1), ('b', 1), ('c', 2)):
+        assert source.post('/cards', json={'name': name, 'board_list_id': board_list_id}).status_code == 201
+    assert source.put('/cards/1', json={'description': 'first', 'user_id': 2}).status_code == 200
+    assert source.put('/cards/2', json={'before': 1}).status_code == 200
+    export = source.get('/boards/1/export').get_data()
+    assert [json.loads(line)['type'] for line in export.splitlines()] == \
+        ['board', 'user', 'user', 'board_list', 'board_list', 'card', 'card', 'card']
+
+    target = make_app(SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path / "target.db"}').test_client()
+    for name, email in (('Linus', 'linus@example.com'), ('Alan Turing', 'alan@example.com')):
+        assert target.post('/users', json={'name': name, 'email': email}).status_code == 201
+    assert target.post('/boards', json={'name': 'other'}).status_code == 201
+    assert target.post('/boardlists', json={'name': 'other', 'board_id': 1}).status_code == 201
+    assert target.post('/cards', json={'name': 'other', 'board_list_id': 1}).status_code == 201
+
+    response = target.post('/boards/import?name=copy', data=export, content_type='application/x-ndjson')
+    assert response.status_code == 201
+    assert response.get_json() == {'board_id': 2, 'users_created': 1, 'board_lists': 2, 'cards': 3,
+                                   'message': 'Board imported successfully'}
+
+    # Alan is matched by email, Ada is created, and Grace, who has no part in the board, is not exported.
+    assert target.get('/users/2').get_json()['name'] == 'Alan Turing'
+    assert target.get('/users/3').get_json()['email'] == 'ada@example.com'
+    assert target.get('/users/4').status_code == 404
+    assert board_contents(target, 2) == ('copy', [('todo', [('b', None, None), ('a', 'first', 2)]),
+                                                  ('done', [('c', None, None)])])
+    assert [board_list['board_list_id'] for board_list in target.get('/boards/2').get_json()['board_lists']] == [2, 3]
+    assert target.get('/boards/2').get_json()['users_assigned'] == [2, 3]
+    assert board_contents(target, 1) == ('other', [('other', [('other', None, None)])])
+
+    # Without ?name= the board keeps its exported name.
+    response = target.post('/boards/import', data=export, content_type='application/x-ndjson')
+    assert response.status_code == 201 and response.get_json()['users_created'] == 0
+    assert board_contents(target, 3) == board_contents(source, 1)
+
+
+def test_failed_import_writes_nothing(make_app):
+    client = make_app().test_client()
+    assert client.post('/users', json={'name': 'Ada', 'email': 'ada@example.com'}).status_code == 201
+    assert client.post('/boards', json={'name': 'roadmap'}).status_code == 201
+    assert client.patch('/boards/1', json={'user_ids': [1]}).status_code == 200
+    assert client.post('/boardlists', json={'name': 'todo', 'board_id': 1}).status_code == 201
+    assert client.post('/cards', json={'name': 'a', 'board_list_id': 1}).status_code == 201
+    export = client.get('/boards/1/export').get_data().decode()
+    new_user = json.dumps({'type': 'user', 'id': 7, 'name': 'Alan', 'email': 'alan@example.com', 'member': True})
+    export = export.replace('\n', f'\n{new_user}\n', 1)
+
+    for body, message in ((export + '{"type": "card"\n', 'Line 6 is not valid JSON.'),
+                          (export + '{"type": "card", "id": 9, "board_list_id": 1}\n', 'Line 6: name is required.'),
+                          (export + '{"type": "board_list", "id": 2, "name": "late"}\n',
+                           'Line 6: board_list records must come before card records.')):
+        response = client.post('/boards/import?name=copy', data=body, content_type='application/x-ndjson')
+        assert (response.status_code, response.get_json()['message']) == (400, message)
+
+    response = client.post('/boards/import', data=export, content_type='application/x-ndjson')
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'Board with name roadmap already exists. Please choose a different name.'
+
+    # The board, the user and the list written before the bad line are rolled back.
+    assert [board['id'] for board in client.get('/all_boards').get_json()['boards']] == [1]
+    assert client.get('/users/2').status_code == 404
+    assert client.get('/boardlists/2').status_code == 404
+    assert client.post('/boards/import?name=copy', data=export, content_type='application/x-ndjson').status_code == 201
@@ -0,0 +1,23 @@
+def metric(client, name, resource):
+    for line in client.get('/metrics').get_data(as_text=True).splitlines():
+        if line.startswith(f'{name}{{resource="{resource}"}} '):
+            return float(line.split()[-1])
+    return 0.0
+
+
+def test_streamed_responses_are_measured_once_sent(make_app):
+    client = make_app().test_client()
+    assert client.post('/boards', json={'name': 'board'}).status_code == 201
+    assert client.post('/boardlists', json={'name': 'list', 'board_id': 1}).status_code == 201
+    assert client.post('/cards', json={'name': 'card', 'board_list_id': 1}).status_code == 201
+
+    count = metric(client, 'minimalboard_request_sql_queries_count', 'boardexportresource.get')
+    queries = metric(client, 'minimalboard_request_sql_queries_sum', 'boardexportresource.get')
+    response = client.get('/boards/1/export')
+    assert 'Server-Timing' not in response.headers
+    assert len(response.get_data().splitlines()) == 3
+    response.close()
+
+    assert metric(client, 'minimalboard_request_sql_queries_count', 'boardexportresource.get') == count + 1
+    # The board, its members, lists and cards are read while the body is sent.
+    assert metric(client, 'minimalboard_request_sql_queries_sum', 'boardexportresource.get') >= queries + 4
@@ -0,0 +1,83 @@
+import sqlite3
+
+from migrations import MIGRATIONS
+
+# The schema of the first release, before any migration, as db.create_all made it.
+BASELINE_SCHEMA = (
+    'CREATE TABLE users (id INTEGER NOT NULL, name VARCHAR(255) NOT NULL, email VARCHAR(255) NOT NULL, '
+    'PRIMARY KEY (id), UNIQUE (email))',
+    'CREATE TABLE boards (id INTEGER NOT NULL, name VARCHAR(255) NOT NULL, privacy VARCHAR(20), url VARCHAR(100), '
+    'PRIMARY KEY (id), UNIQUE (url))',
+    'CREATE TABLE board_users (board_id INTEGER NOT NULL, user_id INTEGER NOT NULL, PRIMARY KEY (board_id, user_id), '
+    'FOREIGN KEY(board_id) REFERENCES boards (id), FOREIGN KEY(user_id) REFERENCES users (id))',
+    'CREATE TABLE board_list (id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, board_id INTEGER, PRIMARY KEY (id), '
+    'CONSTRAINT uq_board_list_name_board_id UNIQUE (name, board_id), FOREIGN KEY(board_id) REFERENCES boards (id))',
+    'CREATE TABLE card (id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, description TEXT, '
+    'board_list_id INTEGER NOT NULL, user_id INTEGER, PRIMARY KEY (id), '
+    'FOREIGN KEY(board_list_id) REFERENCES board_list (id), FOREIGN KEY(user_id) REFERENCES users (id))',
+)
+
+
+def schema(path):
+    with sqlite3.connect(path) as connection:
+        triggers = dict(connection.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'"))
+        cascades = {(table, row[2]): row[6] for table in ('board_list', 'card', 'board_users', 'board_user_card_counts')
+                    for row in connection.execute(f'PRAGMA foreign_key_list({table})')}
+        version = connection.execute('PRAGMA user_version').fetchone()[0]
+    return triggers, cascades, version
+
+
+def test_baseline_database_is_migrated_with_delete_cascades(make_app, tmp_path):
+    with sqlite3.connect(tmp_path / 'minimalboard.db') as connection:
+        for statement in BASELINE_SCHEMA:
+            connection.execute(statement)
+        connection.executemany('INSERT INTO users (id, name, email) VALUES (?, ?, ?)',
+                               [(1, 'Ada', 'ada@example.com'), (2, 'Alan', 'alan@example.com')])
+        connection.execute("INSERT INTO boards (id, name, privacy) VALUES (1, 'kept', 'PUBLIC')")
+        # Members, lists and cards left behind by deletes made while foreign keys were not enforced.
+        connection.executemany('INSERT INTO board_users (board_id, user_id) VALUES (?, ?)',
+                               [(1, 1), (1, 2), (1, 9), (7, 1)])
+        connection.executemany('INSERT INTO board_list (id, name, board_id) VALUES (?, ?, ?)',
+                               [(1, 'todo', 1), (2, 'done', 1), (3, 'orphan', 7)])
+        connection.executemany('INSERT INTO card (id, name, description, board_list_id, user_id) VALUES (?, ?, ?, ?, ?)',
+                               [(1, 'alpha task', 'first', 1, 1), (2, 'beta task', None, 2, 2),
+                                (3, 'alpha orphan', None, 3, 1), (4, 'alpha lost', None, 42, None),
+                                (5, 'gamma task', 'alpha in description', 1, 9)])
+
+    app = make_app()
+    client = app.test_client()
+    triggers, cascades, version = schema(tmp_path / 'minimalboard.db')
+    make_app(SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path / "fresh.db"}')
+    fresh_triggers, fresh_cascades, _ = schema(tmp_path / 'fresh.db')
+
+    assert version == MIGRATIONS[-1][0]
+    assert triggers == fresh_triggers
+    assert cascades == fresh_cascades
+    assert cascades[('board_list', 'boards')] == cascades[('card', 'board_list')] == 'CASCADE'
+    assert cascades[('board_users', 'boards')] == cascades[('board_users', 'users')] == 'CASCADE'
+    assert cascades[('card', 'users')] == 'NO ACTION'
+
+    # The orphans are gone, and the card of a deleted user is unassigned.
+    with sqlite3.connect(tmp_path / 'minimalboard.db') as connection:
+        assert connection.execute('SELECT id, board_list_id, user_id FROM card ORDER BY id').fetchall() == \
+            [(1, 1, 1), (2, 2, 2), (5, 1, None)]
+        assert connection.execute('SELECT id FROM board_list ORDER BY id').fetchall() == [(1,), (2,)]
+        assert connection.execute('SELECT board_id, user_id FROM board_users ORDER BY user_id').fetchall() == \
+            [(1, 1), (1, 2)]
+        assert connection.execute('PRAGMA foreign_key_check').fetchall() == []
+
+    results = client.get('/search?q=alpha&user_id=1').get_json()['results']
+    assert sorted(result['card_id'] for result in results) == [1, 5]
+    stats = client.get('/boards/1/stats').get_json()
+    assert stats['card_count'] == 3
+    assert {board_list['board_list_id']: board_list['card_count'] for board_list in stats['board_lists']} == \
+        {1: 2, 2: 1}
+    assert {user['user_id']: user['card_count'] for user in stats['users']} == {1: 1, 2: 1}
+
+    # Deleting the board is one statement; the database deletes its lists, cards, members and counters.
+    assert client.delete('/boards/1').status_code == 200
+    with sqlite3.connect(tmp_path / 'minimalboard.db') as connection:
+        for table in ('board_list', 'card', 'board_users', 'board_user_card_counts'):
+            assert connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] == 0
+        assert connection.execute("SELECT COUNT(*) FROM card_search WHERE card_search MATCH 'alpha'").fetchone()[0] \
+            == 0
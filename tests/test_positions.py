@@ -0,0 +1,90 @@
+import random
+import sqlite3
+
+from positions import FIRST_KEY, _integer_part, key_between
+
+
+def fraction(key):
+    return key[len(_integer_part(key)):]
+
+
+def test_keys_sort_between_their_neighbours():
+    generator = random.Random(12)
+    keys = []
+    for _ in range(3000):
+        index = generator.randint(0, len(keys))
+        lower = keys[index - 1] if index > 0 else None
+        upper = keys[index] if index < len(keys) else None
+        key = key_between(lower, upper)
+        assert (lower is None or lower < key) and (upper is None or key < upper)
+        assert not fraction(key).endswith('0')
+        keys.insert(index, key)
+    assert keys == sorted(set(keys))
+
+
+def test_keys_stay_short_when_inserted_at_either_end():
+    first = last = FIRST_KEY
+    for _ in range(5000):
+        key = key_between(last, None)
+        assert key > last and not fraction(key).endswith('0')
+        last = key
+        key = key_between(None, first)
+        assert key < first and not fraction(key).endswith('0')
+        first = key
+    assert len(first) <= 4 and len(last) <= 4
+
+
+def test_keys_between_keys_with_any_fractions():
+    generator = random.Random(7)
+    for _ in range(500):
+        lower, upper = sorted(key_between(None, None) + ''.join(generator.choice('0123456789abcxyz')
+                                                                for _ in range(generator.randint(0, 4))) + 'V'
+                              for _ in range(2))
+        if lower == upper:
+            continue
+        key = key_between(lower, upper)
+        assert lower < key < upper
+
+
+def card_ids(client, board_list_id):
+    return [card['card_id'] for card in client.get(f'/boardlists/{board_list_id}').get_json()['cards']]
+
+
+def test_cards_are_placed_before_and_after_cards_of_other_lists(make_app):
+    client = make_app().test_client()
+    assert client.post('/boards', json={'name': 'board'}).status_code == 201
+    for name in ('first', 'second'):
+        assert client.post('/boardlists', json={'name': name, 'board_id': 1}).status_code == 201
+    for board_list_id, count in ((1, 3), (2, 2)):
+        for index in range(count):
+            assert client.post('/cards', json={'name': f'card {index}', 'board_list_id': board_list_id}).status_code \
+                == 201
+    assert (card_ids(client, 1), card_ids(client, 2)) == ([1, 2, 3], [4, 5])
+
+    assert client.put('/cards/2', json={'before': 5}).status_code == 200
+    assert (card_ids(client, 1), card_ids(client, 2)) == ([1, 3], [4, 2, 5])
+    assert client.put('/cards/4', json={'after': 1}).status_code == 200
+    assert (card_ids(client, 1), card_ids(client, 2)) == ([1, 4, 3], [2, 5])
+    assert client.put('/cards/3', json={'before': 2, 'board_list_id': 2}).status_code == 200
+    assert (card_ids(client, 1), card_ids(client, 2)) == ([1, 4], [3, 2, 5])
+
+    assert client.put('/cards/1', json={'after': 5, 'board_list_id': 1}).status_code == 400
+    assert client.put('/cards/1', json={'before': 2, 'after': 5}).status_code == 400
+    assert (card_ids(client, 1), card_ids(client, 2)) == ([1, 4], [3, 2, 5])
+
+
+def test_duplicate_keys_are_rebalanced_before_placing(make_app, tmp_path):
+    client = make_app().test_client()
+    assert client.post('/boards', json={'name': 'board'}).status_code == 201
+    assert client.post('/boardlists', json={'name': 'list', 'board_id': 1}).status_code == 201
+    for index in range(3):
+        assert client.post('/cards', json={'name': f'card {index}', 'board_list_id': 1}).status_code == 201
+    # Two cards end up with the same key, as concurrent moves can leave them.
+    with sqlite3.connect(tmp_path / 'minimalboard.db') as connection:
+        connection.execute("UPDATE card SET position = (SELECT position FROM card WHERE id = 1) WHERE id = 2")
+
+    assert client.put('/cards/3', json={'after': 1}).status_code == 200
+    assert card_ids(client, 1) == [1, 3, 2]
+    with sqlite3.connect(tmp_path / 'minimalboard.db') as connection:
+        positions = [row[0] for row in connection.execute('SELECT position FROM card ORDER BY position')]
+    assert positions == sorted(set(positions)) and len(positions) == 3
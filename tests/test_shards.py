@@ -0,0 +1,113 @@
+import sqlite3
+
+import pytest
+
+from initdb import db
+from shards import SHARD_ID_SPAN, move_board, plan_rebalance
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app(SHARDS=2)
+
+
+def rows(path, query):
+    with sqlite3.connect(path) as connection:
+        return connection.execute(query).fetchall()
+
+
+def create_board(client, name, cards):
+    """
+    The create_board function creates a board with one list holding the given number of cards.
+    :return: The id of the board and the id of its list
+    """
+    assert client.post('/boards', json={'name': name}).status_code == 201
+    board_id = max(board['id'] for board in client.get('/all_boards').get_json()['boards'])
+    response = client.post('/boardlists', json={'name': 'list', 'board_id': board_id})
+    assert response.status_code == 201
+    board_list_id = response.get_json()['board_list_id']
+    for index in range(cards):
+        assert client.post('/cards', json={'name': f'card {index}', 'board_list_id': board_list_id}).status_code == 201
+    return board_id, board_list_id
+
+
+def test_boards_are_stored_on_the_shard_of_their_id(app, tmp_path):
+    client = app.test_client()
+    assert create_board(client, 'odd', 2) == (1, SHARD_ID_SPAN + 1)
+    assert create_board(client, 'even', 1) == (2, 1)
+
+    main, shard = tmp_path / 'minimalboard.db', tmp_path / 'minimalboard-shard1.db'
+    assert rows(main, 'SELECT board_id, shard FROM board_shards ORDER BY board_id') == [(1, 1), (2, 0)]
+    assert rows(main, 'SELECT id FROM boards') == [(2,)]
+    assert rows(shard, 'SELECT id FROM boards') == [(1,)]
+    assert rows(shard, 'SELECT id FROM card ORDER BY id') == [(SHARD_ID_SPAN + 1,), (SHARD_ID_SPAN + 2,)]
+    assert rows(main, 'SELECT id FROM card') == [(1,)]
+
+    assert [board['id'] for board in client.get('/all_boards').get_json()['boards']] == [1, 2]
+    board = client.get('/boards/1').get_json()
+    assert [card['card_id'] for card in board['board_lists'][0]['cards']] == [SHARD_ID_SPAN + 1, SHARD_ID_SPAN + 2]
+    assert client.put(f'/cards/{SHARD_ID_SPAN + 2}', json={'before': SHARD_ID_SPAN + 1}).status_code == 200
+    assert client.get(f'/boardlists/{SHARD_ID_SPAN + 1}').get_json()['cards'][0]['card_id'] == SHARD_ID_SPAN + 2
+
+
+def test_ids_are_allocated_from_the_range_of_the_shard(app, tmp_path):
+    client = app.test_client()
+    _, board_list_id = create_board(client, 'odd', 1)
+    operations = [{'op': 'create', 'name': f'card {index}', 'board_list_id': board_list_id} for index in range(3)]
+    results = client.post('/cards/batch', json={'operations': operations}).get_json()['results']
+    assert [result['card_id'] for result in results] == [SHARD_ID_SPAN + 2, SHARD_ID_SPAN + 3, SHARD_ID_SPAN + 4]
+    # A deleted card's id is not handed out again.
+    assert client.delete(f'/cards/{SHARD_ID_SPAN + 4}').status_code == 200
+    assert client.post('/cards', json={'name': 'next', 'board_list_id': board_list_id}).status_code == 201
+    assert rows(tmp_path / 'minimalboard-shard1.db', 'SELECT MAX(id) FROM card') == [(SHARD_ID_SPAN + 5,)]
+
+
+def test_batches_spanning_shards_are_refused(app):
+    client = app.test_client()
+    create_board(client, 'odd', 1)
+    _, even_list = create_board(client, 'even', 1)
+    response = client.post('/cards/batch', json={'operations': [
+        {'op': 'update', 'card_id': SHARD_ID_SPAN + 1, 'name': 'odd'},
+        {'op': 'create', 'name': 'even', 'board_list_id': even_list},
+    ]})
+    assert response.status_code == 400
+    assert response.get_json()['message'] == \
+        'The batch spans shards. Send the operations of each board in a batch of its own.'
+
+    # Ids that no shard holds are reported per operation, whichever shard the batch runs on.
+    response = client.post('/cards/batch', json={'operations': [
+        {'op': 'update', 'card_id': 999, 'name': 'missing'},
+        {'op': 'update', 'card_id': 1, 'name': 'even'},
+    ]})
+    assert [result['status'] for result in response.get_json()['results']] == [404, 200]
+
+
+def test_boards_move_between_shards(app, tmp_path):
+    client = app.test_client()
+    board_id, board_list_id = create_board(client, 'odd', 2)
+    seq = client.get(f'/boards/{board_id}/changes?since=-1').get_json()['seq']
+    board = client.get(f'/boards/{board_id}').get_json()
+
+    with app.app_context():
+        assert move_board(board_id, 0) == 1
+        db.session.remove()
+    assert rows(tmp_path / 'minimalboard.db', 'SELECT shard FROM board_shards WHERE board_id = 1') == [(0,)]
+    assert rows(tmp_path / 'minimalboard-shard1.db', 'SELECT COUNT(*) FROM boards') == [(0,)]
+    assert rows(tmp_path / 'minimalboard.db', 'SELECT card_count FROM boards WHERE id = 1') == [(2,)]
+    assert client.get(f'/boards/{board_id}').get_json() == board
+    assert client.get(f'/boards/{board_id}/changes?since={seq}').get_json()['changes'] == []
+
+    # Rows created after the move get ids of the new shard, and the moved ones keep theirs.
+    assert client.post('/cards', json={'name': 'new', 'board_list_id': board_list_id}).status_code == 201
+    cards = client.get(f'/boardlists/{board_list_id}').get_json()['cards']
+    assert [card['card_id'] for card in cards] == [SHARD_ID_SPAN + 1, SHARD_ID_SPAN + 2, 1]
+
+
+def test_rebalance_plans_the_move_that_evens_out_the_shards(app):
+    client = app.test_client()
+    for name, cards in (('first', 5), ('second', 0), ('third', 3), ('fourth', 0)):
+        create_board(client, name, cards)
+    with app.app_context():
+        # Shard 1 holds boards 1 and 3, weighing 6 and 4, and shard 0 boards 2 and 4, weighing 1 each.
+        assert plan_rebalance() == [(3, 1, 0)]
+        assert plan_rebalance(max_moves=0) == []
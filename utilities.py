@@ -1,29 +1,161 @@
-from flask_restful import reqparse,abort
+import re
+from urllib.parse import urlencode
+
+from flask import Response, g, request, stream_with_context
+from flask_restful import abort
+from sqlalchemy import bindparam, delete, exc, exists, func, insert, or_, select, text, tuple_, update
 from models import *
+from positions import key_between, sequential_keys
+from schemas import Field, Schema
+from serializers import BoardListRow, CardRow, dumps, loads
+from shards import (assign_ids, board_shard, board_shards_of, directory_connection, each_shard, find_shard,
+                    mirror_users, on_shard, place_board, shard_count, use_shard)
+
+MAX_PAGE_LIMIT = 500
+BOARD_BATCH_SIZE = 100
+MAX_CARD_BATCH_SIZE = 500
+CARD_BATCH_OPERATIONS = ('create', 'update', 'move', 'delete')
+SEARCH_PAGE_SIZE = 20
+MAX_CHANGES_PAGE = 500
+MAX_SEARCH_LIMIT = 100
+# Weights of the name and description columns of card_search in the bm25 ranking of search results.
+SEARCH_COLUMN_WEIGHTS = (10.0, 1.0)
+# Rows fetched per round trip by a board export, and records written per bulk insert by a board import.
+EXPORT_CHUNK_SIZE = 1000
+IMPORT_CHUNK_SIZE = 1000
+# The record types of a board export, in the order they appear in it.
+EXPORT_RECORD_TYPES = ('board', 'user', 'board_list', 'card')
+
+user_parser = Schema(
+    Field('name', type=str, required=True, help="Name is required."),
+    Field('email', type=str, required=True, help="Email is required."),
+)
+
+board_parser = Schema(
+    Field('name', type=str, required=True, help="Name is required."),
+    Field('privacy', type=str, choices=['PUBLIC', 'PRIVATE'], default='PUBLIC'),
+)
+
+board_users_parser = Schema(
+    Field('user_ids', type=int, append=True, required=True, help="User IDs are required."),
+)
+
+board_list_parser = Schema(
+    Field('name', type=str, required=True, help="Name is required."),
+    Field('board_id', type=int, required=True, help="Board ID is required."),
+)
+
+update_board_list_parser = Schema(
+    Field('name', type=str, required=True),
+)
+
+card_parser = Schema(
+    Field('name', type=str, required=True, help="Name is required."),
+    Field('description', type=str, required=False),
+    Field('board_list_id', type=int, required=True, help="Board List ID is required."),
+    Field('user_id', type=int, required=False),
+)
+
+update_card_parser = Schema(
+    Field('name', type=str, required=False),
+    Field('description', type=str, required=False),
+    Field('board_list_id', type=int, required=False),
+    Field('user_id', type=int, required=False),
+    Field('before', type=int, required=False),
+    Field('after', type=int, required=False),
+)
+
+board_page_parser = Schema(
+    Field('after', type=int),
+    Field('limit', type=int),
+    Field('format', type=str, choices=['json', 'ndjson'], default='json'),
+    location='args',
+)
+
+changes_parser = Schema(
+    Field('since', type=int, default=0),
+    Field('wait', type=float, default=0),
+    Field('limit', type=int, default=MAX_CHANGES_PAGE),
+    location='args',
+)
+
+import_parser = Schema(
+    Field('name', type=str),
+    location='args',
+)
+
+search_parser = Schema(
+    Field('q', type=str, required=True, help="Search query is required."),
+    Field('user_id', type=int, required=True, help="User ID is required."),
+    Field('board_id', type=int),
+    Field('limit', type=int, default=SEARCH_PAGE_SIZE),
+    Field('offset', type=int, default=0),
+    location='args',
+)
+
+def _request_lookup(key, load):
+    """
+    The _request_lookup function memoizes a lookup for the rest of the current request (app context), so the same
+    user, board, board list, card or membership is only read from the database once per request.
+
+    :param key: A hashable key identifying the lookup
+    :param load: A function that performs the lookup
+    :return: The result of load, from the request cache if it ran before
+    """
+    lookups = g.setdefault('lookups', {})
+    if key not in lookups:
+        lookups[key] = load()
+    return lookups[key]
+
+
+def _get_or_404(model, object_id, message):
+    """
+    The _get_or_404 function returns the object of the given model with the given primary key, looked up at most
+    once per request, and aborts with a 404 error carrying message if it does not exist.
+
+    :param model: The model class
+    :param object_id: The primary key of the object
+    :param message: The error message to return when the object does not exist
+    :return: The model object
+    """
+    obj = _request_lookup((model.__name__, object_id), lambda: db.session.get(model, object_id))
+    if not obj:
+        abort(404, message=message)
+    return obj
+
 
-user_parser = reqparse.RequestParser()
-user_parser.add_argument('name', type=str, required=True, help="Name is required.")
-user_parser.add_argument('email', type=str, required=True, help="Email is required.")
+def select_board_shard(board_id):
+    """
+    The select_board_shard function selects the shard of a board for the rest of the request, looking it up in the
+    directory at most once per request. It does nothing when the app is not sharded.
 
-board_parser = reqparse.RequestParser()
-board_parser.add_argument('name', type=str, required=True, help="Name is required.")
-board_parser.add_argument('privacy', type=str, choices=['PUBLIC', 'PRIVATE'], default='PUBLIC')
+    :param board_id: The id of the board
+    :return: The number of the shard
+    """
+    if shard_count() == 1:
+        return 0
+    shard = _request_lookup(('board_shard', board_id), lambda: board_shard(board_id))
+    use_shard(shard)
+    return shard
 
-board_list_parser = reqparse.RequestParser()
-board_list_parser.add_argument('name', type=str, required=True, help="Name is required.")
-board_list_parser.add_argument('board_id', type=int, required=True, help="Board ID is required.")
 
-card_parser = reqparse.RequestParser()
-card_parser.add_argument('name', type=str, required=True, help="Name is required.")
-card_parser.add_argument('description', type=str, required=False)
-card_parser.add_argument('board_list_id', type=int, required=True, help="Board List ID is required.")
-card_parser.add_argument('user_id', type=int, required=False)
+def select_row_shard(model, row_id):
+    """
+    The select_row_shard function selects the shard holding a board list or card for the rest of the request,
+    searching the shards for it at most once per request. The selection is left alone when no shard holds the row.
+    It does nothing when the app is not sharded.
+
+    :param model: BoardList or Card
+    :param row_id: The id of the row
+    :return: The number of the shard, or None when no shard holds the row
+    """
+    if shard_count() == 1:
+        return 0
+    shard = _request_lookup(('shard', model.__name__, row_id), lambda: find_shard(model, row_id))
+    if shard is not None:
+        use_shard(shard)
+    return shard
 
-update_card_parser = reqparse.RequestParser()
-update_card_parser.add_argument('name', type=str, required=False)
-update_card_parser.add_argument('description', type=str, required=False)
-update_card_parser.add_argument('board_list_id', type=int, required=False)
-update_card_parser.add_argument('user_id', type=int, required=False)
 
 def get_user(user_id):
     """
@@ -33,10 +165,7 @@ def get_user(user_id):
     :param user_id: Get the user from the database
     :return: A user object
     """
-    user = User.query.get(user_id)
-    if not user:
-        abort(404, message="User not found.")
-    return user
+    return _get_or_404(User, user_id, "User not found.")
 
 
 def get_board(board_id):
@@ -47,10 +176,8 @@ def get_board(board_id):
     :param board_id: Get the board from the database
     :return: A board object
     """
-    board = Board.query.get(board_id)
-    if not board:
-        abort(404, message="Board not found.")
-    return board
+    select_board_shard(board_id)
+    return _get_or_404(Board, board_id, "Board not found.")
 
 
 def get_board_list(board_list_id):
@@ -61,10 +188,8 @@ def get_board_list(board_list_id):
     :param board_list_id: Get the board list from the database
     :return: A board list object, which is a row from the boardlist table
     """
-    board_list = BoardList.query.get(board_list_id)
-    if not board_list:
-        abort(404, message="Board List not found.")
-    return board_list
+    select_row_shard(BoardList, board_list_id)
+    return _get_or_404(BoardList, board_list_id, "Board List not found.")
 
 
 def get_card(card_id):
@@ -75,7 +200,1036 @@ def get_card(card_id):
     :param card_id: Get the card from the database
     :return: A card object from the database
     """
-    card = Card.query.get(card_id)
-    if not card:
-        abort(404, message="Card not found.")
-    return card
+    select_row_shard(Card, card_id)
+    return _get_or_404(Card, card_id, "Card not found.")
+
+
+def is_board_member(board_id, user_id):
+    """
+    The is_board_member function checks whether a user is assigned to a board with a single EXISTS query on the
+    board_users primary key, instead of loading every member of the board.
+
+    :param board_id: The id of the board
+    :param user_id: The id of the user
+    :return: True if the user is a member of the board
+    """
+    def load():
+        query = exists().where(board_users.c.board_id == board_id, board_users.c.user_id == user_id)
+        return db.session.query(query).scalar()
+    return _request_lookup(('board_users', board_id, user_id), load)
+
+
+def board_name_exists(name, connection=None):
+    """
+    The board_name_exists function checks whether a board with the given name exists, on every shard when the app
+    is sharded.
+
+    :param name: The name of the board
+    :param connection: The connection to read from, by default the one of the current session on each shard
+    :return: True if a board has that name
+    """
+    query = select(exists().where(Board.__table__.c.name == name))
+    if connection is not None:
+        return connection.scalar(query)
+    return any([db.session.connection().scalar(query) for _ in each_shard()])
+
+
+def add_board_member(board_id, user_id):
+    """
+    The add_board_member function assigns a user to a board, unless they already are a member.
+    The row is inserted into board_users directly, so the members of the board are never loaded. The insert ignores
+    a row another request added since the check, so concurrent requests adding the same member both succeed. The
+    board's shard must be selected; the user is copied into it first.
+
+    :param board_id: The id of the board
+    :param user_id: The id of the user
+    :return: True if the user was added, False if they were already a member
+    """
+    if is_board_member(board_id, user_id):
+        return False
+    mirror_users([user_id])
+    added = db.session.execute(
+        board_users.insert().prefix_with('OR IGNORE').values(board_id=board_id, user_id=user_id)
+    ).rowcount
+    g.lookups[('board_users', board_id, user_id)] = True
+    return added == 1
+
+
+def _board_shards(board_ids):
+    """
+    The _board_shards function returns the shard of each of the given boards, reading the directory once for those
+    whose shard was not looked up earlier in the request.
+    """
+    lookups = g.setdefault('lookups', {})
+    missing = [board_id for board_id in board_ids if ('board_shard', board_id) not in lookups]
+    for board_id, shard in board_shards_of(missing).items():
+        lookups[('board_shard', board_id)] = shard
+    return {board_id: lookups[('board_shard', board_id)] for board_id in board_ids}
+
+
+def load_board_trees(board_ids, connection=None):
+    """
+    The load_board_trees function loads the users, board lists and cards of the given boards in a fixed number of
+    queries (one each for user assignments, board lists and cards), however many boards, lists or cards there are.
+    Rows are fetched as plain column tuples on the session's connection, bypassing ORM result processing, and are
+    grouped in Python into slotted BoardListRow and CardRow objects.
+
+    :param board_ids: The ids of the boards to load
+    :param connection: The connection to read from, by default the one of the current session, or of each shard
+                       holding some of the boards when the app is sharded
+    :return: A dictionary keyed by board id, each value holding the board's user ids and its board lists with cards,
+             lists and cards in position order
+    """
+    trees = {board_id: {'users': [], 'board_lists': []} for board_id in board_ids}
+    if not trees:
+        return trees
+    if connection is None and shard_count() > 1:
+        shards = {}
+        for board_id, shard in _board_shards(trees).items():
+            shards.setdefault(shard, []).append(board_id)
+        for shard, shard_board_ids in shards.items():
+            with on_shard(shard):
+                trees.update(load_board_trees(shard_board_ids, db.session.connection()))
+        return trees
+
+    connection = connection or db.session.connection()
+    board_list_table, card_table = BoardList.__table__, Card.__table__
+
+    user_rows = connection.execute(
+        select(board_users.c.board_id, board_users.c.user_id)
+        .where(board_users.c.board_id.in_(trees))
+        .order_by(board_users.c.board_id, board_users.c.user_id)
+    )
+    for board_id, user_id in user_rows:
+        trees[board_id]['users'].append(user_id)
+
+    board_lists = {}
+    list_rows = connection.execute(
+        select(board_list_table.c.id, board_list_table.c.name, board_list_table.c.board_id)
+        .where(board_list_table.c.board_id.in_(trees))
+        .order_by(board_list_table.c.board_id, board_list_table.c.position, board_list_table.c.id)
+    )
+    for board_list_id, name, board_id in list_rows:
+        board_list = board_lists[board_list_id] = BoardListRow(board_list_id, name)
+        trees[board_id]['board_lists'].append(board_list)
+
+    card_rows = connection.execute(
+        select(card_table.c.board_list_id, card_table.c.id, card_table.c.name, card_table.c.description,
+               card_table.c.user_id)
+        .join(board_list_table, card_table.c.board_list_id == board_list_table.c.id)
+        .where(board_list_table.c.board_id.in_(trees))
+        .order_by(card_table.c.board_list_id, card_table.c.position, card_table.c.id)
+    )
+    for board_list_id, *card in card_rows:
+        board_lists[board_list_id].cards.append(CardRow(*card))
+    return trees
+
+
+def load_board_list_cards(board_list_id, connection=None):
+    """
+    The load_board_list_cards function loads the cards of a board list as CardRow objects, in position order, with a
+    single query.
+
+    :param board_list_id: The id of the board list
+    :param connection: The connection to read from, by default the one of the current session
+    :return: A list of card rows
+    """
+    card_table = Card.__table__
+    connection = connection or db.session.connection()
+    card_rows = connection.execute(
+        select(card_table.c.id, card_table.c.name, card_table.c.description, card_table.c.user_id)
+        .where(card_table.c.board_list_id == board_list_id)
+        .order_by(card_table.c.position, card_table.c.id)
+    )
+    return [CardRow(*card) for card in card_rows]
+
+
+def _sibling_position(table, parent_column, parent_id, exclude_id, sibling_id, after, connection):
+    """
+    The _sibling_position function returns the bounds of a gap next to a sibling: the sibling's key and the key of
+    the row right after (or before) it in the same list, ignoring the row being moved.
+    """
+    sibling = connection.execute(
+        select(table.c.position).where(table.c.id == sibling_id, parent_column == parent_id)
+    ).scalar()
+    if sibling is None:
+        return None
+    neighbours = select(table.c.position).where(parent_column == parent_id)
+    if exclude_id is not None:
+        neighbours = neighbours.where(table.c.id != exclude_id)
+    if after:
+        neighbour = connection.execute(
+            neighbours.where(tuple_(table.c.position, table.c.id) > tuple_(sibling, sibling_id))
+            .order_by(table.c.position, table.c.id).limit(1)
+        ).scalar()
+        return sibling, neighbour
+    neighbour = connection.execute(
+        neighbours.where(tuple_(table.c.position, table.c.id) < tuple_(sibling, sibling_id))
+        .order_by(table.c.position.desc(), table.c.id.desc()).limit(1)
+    ).scalar()
+    return neighbour, sibling
+
+
+def _rebalance_positions(table, parent_column, parent_id, connection):
+    rows = connection.execute(
+        select(table.c.id).where(parent_column == parent_id).order_by(table.c.position, table.c.id)
+    ).all()
+    if rows:
+        parameters = [{'row_id': row_id, 'new_position': position}
+                      for (row_id,), position in zip(rows, sequential_keys(len(rows)))]
+        # The rebalance is logged once, when the list is marked, and the updates of its rows are not logged.
+        marker = (position_rebalances.c.entity == table.name) & (position_rebalances.c.parent_id == parent_id)
+        connection.execute(insert(position_rebalances).values(entity=table.name, parent_id=parent_id))
+        connection.execute(
+            table.update().where(table.c.id == bindparam('row_id')).values(position=bindparam('new_position')),
+            parameters
+        )
+        connection.execute(delete(position_rebalances).where(marker))
+
+
+def _position(table, parent_column, parent_id, exclude_id, before_id, after_id, connection):
+    connection = connection or db.session.connection()
+    for _ in range(2):
+        if after_id is not None or before_id is not None:
+            bounds = _sibling_position(table, parent_column, parent_id, exclude_id, after_id or before_id,
+                                       after_id is not None, connection)
+            if bounds is None:
+                return None
+            lower, upper = bounds
+        else:
+            last = select(func.max(table.c.position)).where(parent_column == parent_id)
+            if exclude_id is not None:
+                last = last.where(table.c.id != exclude_id)
+            lower, upper = connection.execute(last).scalar(), None
+        if lower is None or upper is None or lower < upper:
+            return key_between(lower, upper)
+        # Two rows share a key, e.g. after concurrent moves; renumber the list to open a gap between them.
+        _rebalance_positions(table, parent_column, parent_id, connection)
+    raise ValueError(f'No position left between {lower} and {upper}')
+
+
+def card_position(board_list_id, card_id=None, before_id=None, after_id=None, connection=None):
+    """
+    The card_position function generates the position key that places a card in a board list: right before or right
+    after a sibling card, or at the end of the list when no sibling is given. Only the keys of the sibling and its
+    neighbour are read, through the (board_list_id, position) index.
+
+    :param board_list_id: The id of the board list
+    :param card_id: The id of the card being moved, which is ignored as a neighbour, or None for a new card
+    :param before_id: The id of the card to place it before
+    :param after_id: The id of the card to place it after
+    :param connection: The connection to use, by default the one of the current session
+    :return: The position key, or None when the sibling is not in the board list
+    """
+    card_table = Card.__table__
+    return _position(card_table, card_table.c.board_list_id, board_list_id, card_id, before_id, after_id,
+                     connection)
+
+
+def board_list_position(board_id, connection=None):
+    """
+    The board_list_position function generates the position key that appends a board list to a board.
+
+    :param board_id: The id of the board
+    :param connection: The connection to use, by default the one of the current session
+    :return: The position key
+    """
+    board_list_table = BoardList.__table__
+    return _position(board_list_table, board_list_table.c.board_id, board_id, None, None, None, connection)
+
+
+def last_card_positions(board_list_ids, connection=None):
+    """
+    The last_card_positions function reads the key of the last card of each of the given board lists in one query.
+
+    :param board_list_ids: The ids of the board lists
+    :param connection: The connection to read from, by default the one of the current session
+    :return: A dictionary of the last key by board list id, without the board lists that have no cards
+    """
+    if not board_list_ids:
+        return {}
+    card_table = Card.__table__
+    rows = (connection or db.session.connection()).execute(
+        select(card_table.c.board_list_id, func.max(card_table.c.position))
+        .where(card_table.c.board_list_id.in_(board_list_ids))
+        .group_by(card_table.c.board_list_id)
+    )
+    return dict(rows.all())
+
+
+def rebalance_card_positions(board_list_id, connection=None):
+    """
+    The rebalance_card_positions function renumbers the cards of a board list with short sequential keys, keeping
+    their order.
+
+    :param board_list_id: The id of the board list
+    :param connection: The connection to use, by default the one of the current session on the board list's shard
+    """
+    card_table = Card.__table__
+    if connection is None:
+        select_row_shard(BoardList, board_list_id)
+    _rebalance_positions(card_table, card_table.c.board_list_id, board_list_id,
+                         connection or db.session.connection())
+
+
+def rebalance_board_list_positions(board_id, connection=None):
+    """
+    The rebalance_board_list_positions function renumbers the board lists of a board with short sequential keys,
+    keeping their order.
+
+    :param board_id: The id of the board
+    :param connection: The connection to use, by default the one of the current session on the board's shard
+    """
+    board_list_table = BoardList.__table__
+    if connection is None:
+        select_board_shard(board_id)
+    _rebalance_positions(board_list_table, board_list_table.c.board_id, board_id,
+                         connection or db.session.connection())
+
+
+def load_board_changes(board_id, since, limit=MAX_CHANGES_PAGE, connection=None):
+    """
+    The load_board_changes function reads the changes made to a board after a sequence number from the change log,
+    with the current state of every inserted or updated board, board list and card. Several changes to the same
+    row are sent once, as its latest change, and a row that no longer exists is sent as deleted. A rebalance of
+    positions is a single change, of type card_positions for the cards of a board list and board_list_positions for
+    the lists of a board, with the current position of each of them.
+    Once a board is deleted its log only holds the delete, which is returned whatever since is.
+
+    :param board_id: The id of the board
+    :param since: The sequence number of the last change the client has seen, 0 for none, or -1 for no changes but
+                  only the current sequence number
+    :param limit: The maximum number of log entries to read
+    :param connection: The connection to read from, by default the one of the current session
+    :return: A dictionary with the changes, the sequence number to pass as since next time and whether more changes
+             are waiting, or None when the changes after since were pruned from the log and the client must reload
+             the board
+    """
+    connection = connection or db.session.connection()
+    first, last = connection.execute(
+        select(func.min(board_changes.c.seq), func.max(board_changes.c.seq))
+        .where(board_changes.c.board_id == board_id)
+    ).one()
+    if last is None or since < 0:
+        return {'seq': last or 0, 'more': False, 'changes': []}
+    if first == last:
+        entity, op = connection.execute(
+            select(board_changes.c.entity, board_changes.c.op)
+            .where(board_changes.c.board_id == board_id, board_changes.c.seq == last)
+        ).one()
+        if (entity, op) == ('board', 'delete'):
+            return {'seq': last, 'more': False,
+                    'changes': [{'seq': last, 'type': 'board', 'op': 'delete', 'id': board_id, 'data': None}]}
+    if since < first - 1 or since > last:
+        return None
+
+    rows = connection.execute(
+        select(board_changes.c.seq, board_changes.c.entity, board_changes.c.entity_id, board_changes.c.op)
+        .where(board_changes.c.board_id == board_id, board_changes.c.seq > since)
+        .order_by(board_changes.c.seq).limit(limit)
+    ).all()
+    latest = {}
+    for seq, entity, entity_id, op in rows:
+        latest.pop((entity, entity_id), None)
+        latest[(entity, entity_id)] = (seq, op)
+
+    ids = {'board': set(), 'board_list': set(), 'card': set(), 'card_positions': set(), 'board_list_positions': set()}
+    for (entity, entity_id), (_, op) in latest.items():
+        if op != 'delete':
+            ids[entity].add(entity_id)
+    data = {}
+    if ids['board']:
+        board_table = Board.__table__
+        for row_id, name, privacy, url in connection.execute(
+                select(board_table.c.id, board_table.c.name, board_table.c.privacy, board_table.c.url)
+                .where(board_table.c.id.in_(ids['board']))):
+            data[('board', row_id)] = {'id': row_id, 'name': name, 'privacy': privacy, 'url': url,
+                                       'users_assigned': []}
+        for row_board_id, user_id in connection.execute(
+                select(board_users.c.board_id, board_users.c.user_id)
+                .where(board_users.c.board_id.in_(ids['board'])).order_by(board_users.c.user_id)):
+            if ('board', row_board_id) in data:
+                data[('board', row_board_id)]['users_assigned'].append(user_id)
+    if ids['board_list']:
+        board_list_table = BoardList.__table__
+        for row_id, name, position in connection.execute(
+                select(board_list_table.c.id, board_list_table.c.name, board_list_table.c.position)
+                .where(board_list_table.c.id.in_(ids['board_list']))):
+            data[('board_list', row_id)] = {'board_list_id': row_id, 'board_list_name': name, 'position': position}
+    if ids['card']:
+        card_table = Card.__table__
+        for row_id, name, description, user_id, board_list_id, position in connection.execute(
+                select(card_table.c.id, card_table.c.name, card_table.c.description, card_table.c.user_id,
+                       card_table.c.board_list_id, card_table.c.position)
+                .where(card_table.c.id.in_(ids['card']))):
+            data[('card', row_id)] = dict(CardRow(row_id, name, description, user_id).to_dict(),
+                                          board_list_id=board_list_id, position=position)
+
+    if ids['card_positions']:
+        board_list_table, card_table = BoardList.__table__, Card.__table__
+        for (row_id,) in connection.execute(
+                select(board_list_table.c.id).where(board_list_table.c.id.in_(ids['card_positions']))):
+            data[('card_positions', row_id)] = {'board_list_id': row_id, 'cards': []}
+        for board_list_id, card_id, position in connection.execute(
+                select(card_table.c.board_list_id, card_table.c.id, card_table.c.position)
+                .where(card_table.c.board_list_id.in_(ids['card_positions']))
+                .order_by(card_table.c.board_list_id, card_table.c.position)):
+            data[('card_positions', board_list_id)]['cards'].append({'card_id': card_id, 'position': position})
+    if ids['board_list_positions']:
+        board_table, board_list_table = Board.__table__, BoardList.__table__
+        for (row_id,) in connection.execute(
+                select(board_table.c.id).where(board_table.c.id.in_(ids['board_list_positions']))):
+            data[('board_list_positions', row_id)] = {'id': row_id, 'board_lists': []}
+        for row_board_id, board_list_id, position in connection.execute(
+                select(board_list_table.c.board_id, board_list_table.c.id, board_list_table.c.position)
+                .where(board_list_table.c.board_id.in_(ids['board_list_positions']))
+                .order_by(board_list_table.c.board_id, board_list_table.c.position)):
+            data[('board_list_positions', row_board_id)]['board_lists'].append(
+                {'board_list_id': board_list_id, 'position': position})
+
+    changes = []
+    for (entity, entity_id), (seq, op) in latest.items():
+        row = data.get((entity, entity_id))
+        changes.append({'seq': seq, 'type': entity, 'op': op if row is not None else 'delete', 'id': entity_id,
+                        'data': row})
+    return {'seq': rows[-1].seq if rows else since, 'more': len(rows) == limit, 'changes': changes}
+
+
+def load_board_stats(board_id, connection=None):
+    """
+    The load_board_stats function reads the card counts of a board, of each of its lists and of each user cards are
+    assigned to on it. The counts are kept up to date by triggers, so this reads one board row, the board's lists
+    and its user counters by index and never scans cards.
+
+    :param board_id: The id of the board
+    :param connection: The connection to read from, by default the one of the current session
+    :return: A dictionary of counts, or None if the board does not exist
+    """
+    connection = connection or db.session.connection()
+    board_table, board_list_table = Board.__table__, BoardList.__table__
+    card_count = connection.execute(select(board_table.c.card_count).where(board_table.c.id == board_id)).scalar()
+    if card_count is None:
+        return None
+    board_lists = [{'board_list_id': board_list_id, 'board_list_name': name, 'card_count': count}
+                   for board_list_id, name, count in connection.execute(
+                       select(board_list_table.c.id, board_list_table.c.name, board_list_table.c.card_count)
+                       .where(board_list_table.c.board_id == board_id)
+                       .order_by(board_list_table.c.position, board_list_table.c.id))]
+    users = [{'user_id': user_id, 'card_count': count} for user_id, count in connection.execute(
+        select(board_user_card_counts.c.user_id, board_user_card_counts.c.card_count)
+        .where(board_user_card_counts.c.board_id == board_id)
+        .order_by(board_user_card_counts.c.user_id))]
+    return {
+        'board_id': board_id,
+        'card_count': card_count,
+        'unassigned_count': card_count - sum(user['card_count'] for user in users),
+        'board_lists': board_lists,
+        'users': users
+    }
+
+
+def parse_board_page_args():
+    """
+    The parse_board_page_args function reads the keyset pagination arguments (after, limit and format) of the board
+    listing endpoints from the query string. A limit above MAX_PAGE_LIMIT is capped to it.
+
+    :return: A dictionary with the after cursor, the page limit and whether the client asked for NDJSON streaming
+    """
+    args = board_page_parser.parse_args()
+    if args['limit'] is not None:
+        if args['limit'] < 1:
+            abort(400, message="Limit must be a positive integer.")
+        args['limit'] = min(args['limit'], MAX_PAGE_LIMIT)
+    args['stream'] = args['format'] == 'ndjson' or request.accept_mimetypes.best == 'application/x-ndjson'
+    return args
+
+
+def load_board_page(after, size, connection=None):
+    """
+    The load_board_page function reads up to size boards with an id greater than after, in id order, as plain
+    (id, name, privacy, url) rows.
+
+    :param after: Only boards with an id greater than this are returned, or None to start at the first board
+    :param size: The maximum number of boards to return
+    :param connection: The connection to read from, by default the one of the current session, or of every shard
+                       when the app is sharded, in which case the pages of the shards are merged
+    :return: A list of board rows
+    """
+    board_table = Board.__table__
+    query = select(board_table.c.id, board_table.c.name, board_table.c.privacy, board_table.c.url) \
+        .order_by(board_table.c.id).limit(size)
+    if after is not None:
+        query = query.where(board_table.c.id > after)
+    if connection is None and shard_count() > 1:
+        pages = {shard: db.session.connection().execute(query).all() for shard in each_shard()}
+        # A board is listed from the shard the directory places it on, not from a copy left by a move.
+        shards = _board_shards([board.id for page in pages.values() for board in page])
+        boards = [board for shard, page in pages.items() for board in page if shards[board.id] == shard]
+        return sorted(boards, key=lambda board: board.id)[:size]
+    return (connection or db.session.connection()).execute(query).all()
+
+
+def iter_board_batches(after=None, limit=None, batch_size=BOARD_BATCH_SIZE):
+    """
+    The iter_board_batches function walks the boards table in id order using keyset pagination and yields the boards
+    in batches of at most batch_size rows. Rows are plain (id, name, privacy, url) tuples so that the session does
+    not keep every board object alive while a large listing is being produced.
+
+    :param after: Only boards with an id greater than this are returned
+    :param limit: The maximum number of boards to return in total, or None for all of them
+    :param batch_size: The number of boards fetched per query
+    :return: A generator of lists of board rows
+    """
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = batch_size if remaining is None else min(batch_size, remaining)
+        boards = load_board_page(after, size)
+        if not boards:
+            return
+        yield boards
+        if len(boards) < size:
+            return
+        after = boards[-1].id
+        if remaining is not None:
+            remaining -= len(boards)
+
+
+def next_page_link(items, args, cursor):
+    """
+    The next_page_link function builds the Link header pointing at the next page of a paginated listing.
+    No link is returned when the client did not ask for a limit or when the page came back short, as there is
+    nothing left to fetch in that case.
+
+    :param items: The items returned in the current page
+    :param args: The parsed pagination arguments
+    :param cursor: The id of the last item in the page
+    :return: A dictionary of headers to add to the response
+    """
+    if args['limit'] is None or len(items) < args['limit']:
+        return {}
+    return {'Link': f'<{request.base_url}?after={cursor}&limit={args["limit"]}>; rel="next"'}
+
+
+def ndjson_response(rows):
+    """
+    The ndjson_response function streams the given rows as newline delimited JSON, one row per line.
+    The rows are produced lazily inside the request context, so a listing is never held in memory as a whole.
+
+    :param rows: An iterable of JSON serializable objects
+    :return: A streaming response with the application/x-ndjson mimetype
+    """
+    def generate():
+        for row in rows:
+            yield dumps(row) + b'\n'
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def match_expression(query):
+    """
+    The match_expression function turns free text typed by a user into an FTS5 MATCH expression. Every word is
+    quoted, so characters that are FTS5 syntax are searched for literally instead of failing the query, and matched
+    as a prefix; a card matches when it contains all of the words.
+
+    :param query: The search text
+    :return: The MATCH expression, or None when the text has no words
+    """
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return None
+    return ' '.join('"' + term + '"*' for term in terms)
+
+
+def parse_search_args():
+    """
+    The parse_search_args function reads the arguments of a card search from the query string, aborting with a 400
+    error when the query has no words or the page is invalid. A limit above MAX_SEARCH_LIMIT is capped to it.
+
+    :return: A dictionary with the MATCH expression, the user, the optional board and the page limit and offset
+    """
+    args = search_parser.parse_args()
+    args['match'] = match_expression(args['q'])
+    if args['match'] is None:
+        abort(400, message={'q': "Search query is required."})
+    if args['limit'] < 1:
+        abort(400, message="Limit must be a positive integer.")
+    if args['offset'] < 0:
+        abort(400, message="Offset must not be negative.")
+    args['limit'] = min(args['limit'], MAX_SEARCH_LIMIT)
+    return args
+
+
+def _search_rows(match, user_id, board_id, limit, offset, connection):
+    """
+    The _search_rows function runs the search query of search_cards on one database, returning (rank, card id,
+    name, description, user id, board list id, board id) rows.
+    """
+    weights = ', '.join(str(weight) for weight in SEARCH_COLUMN_WEIGHTS)
+    query = text(
+        f'SELECT bm25(card_search, {weights}) AS rank, card.id, card.name, card.description, card.user_id, '
+        'card.board_list_id, board_list.board_id '
+        'FROM card_search '
+        'JOIN card ON card.id = card_search.rowid '
+        'JOIN board_list ON board_list.id = card.board_list_id '
+        'JOIN board_users ON board_users.board_id = board_list.board_id AND board_users.user_id = :user_id '
+        'WHERE card_search MATCH :match' + (' AND board_list.board_id = :board_id' if board_id is not None else '') +
+        ' ORDER BY rank, card.id LIMIT :limit OFFSET :offset'
+    )
+    parameters = {'match': match, 'user_id': user_id, 'board_id': board_id, 'limit': limit, 'offset': offset}
+    return connection.execute(query, parameters).all()
+
+
+def search_cards(match, user_id, board_id=None, limit=SEARCH_PAGE_SIZE, offset=0, connection=None):
+    """
+    The search_cards function runs a full text search over the name and description of cards, through the
+    card_search FTS5 index. Only cards on boards the user is a member of are returned, best match first, a match in
+    the name counting more than one in the description.
+    When the app is sharded and no board is given, every shard is searched for its first offset + limit matches and
+    these are merged by rank. Each shard ranks against its own index, so the order across shards is approximate.
+
+    :param match: An FTS5 MATCH expression, see match_expression
+    :param user_id: The id of the user searching
+    :param board_id: Only search the cards of this board, whose shard must be selected
+    :param limit: The maximum number of cards to return
+    :param offset: The number of matching cards to skip
+    :param connection: The connection to read from, by default the one of the current session
+    :return: A list of dictionaries
+    """
+    if connection is None and board_id is None and shard_count() > 1:
+        rows = []
+        for _ in each_shard():
+            rows.extend(_search_rows(match, user_id, None, offset + limit, 0, db.session.connection()))
+        rows = sorted(rows, key=lambda row: (row.rank, row.id))[offset:offset + limit]
+    else:
+        rows = _search_rows(match, user_id, board_id, limit, offset, connection or db.session.connection())
+    return [{
+        'card_id': card_id,
+        'card_name': name,
+        'card_description': description,
+        'assigned_user': user_id or None,
+        'board_list_id': board_list_id,
+        'board_id': board_id
+    } for _, card_id, name, description, user_id, board_list_id, board_id in rows]
+
+
+def next_search_link(results, args):
+    """
+    The next_search_link function builds the Link header pointing at the next page of search results, or returns no
+    header when the page came back short.
+
+    :param results: The results returned in the current page
+    :param args: The parsed search arguments
+    :return: A dictionary of headers to add to the response
+    """
+    if len(results) < args['limit']:
+        return {}
+    query = {key: args[key] for key in ('q', 'user_id', 'board_id') if args[key] is not None}
+    query.update(limit=args['limit'], offset=args['offset'] + len(results))
+    return {'Link': f'<{request.base_url}?{urlencode(query)}>; rel="next"'}
+
+
+def parse_card_batch():
+    """
+    The parse_card_batch function reads the list of card operations from the JSON body of a batch request.
+    It aborts with a 400 error if the list is missing, empty or longer than MAX_CARD_BATCH_SIZE.
+
+    :return: A list of operation dictionaries
+    """
+    data = request.get_json(silent=True)
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        abort(400, message="Operations are required.")
+    if len(operations) > MAX_CARD_BATCH_SIZE:
+        abort(400, message=f"A batch can hold at most {MAX_CARD_BATCH_SIZE} operations.")
+    return operations
+
+
+def _batch_int(operation, key):
+    """
+    The _batch_int function converts an integer field of a batch operation the same way reqparse's type=int does.
+
+    :param operation: The operation dictionary
+    :param key: The name of the field
+    :return: The integer value, or None when the field is missing or not an integer
+    """
+    try:
+        value = operation.get(key)
+        return None if value is None else int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def load_card_batch_context(operations):
+    """
+    The load_card_batch_context function loads everything needed to validate a batch of card operations with one
+    query per table: the current board list of every referenced card, the board of every referenced board list,
+    the referenced users that exist, which of them are members of the boards involved and the key of the last card
+    of every referenced board list.
+    When the app is sharded, the batch is applied on the shard of the first existing card or board list it names,
+    and is refused with a 400 when it names cards or board lists of another shard.
+
+    :param operations: The list of operation dictionaries
+    :return: A dictionary of lookups keyed by 'cards', 'board_lists', 'users', 'members' and 'positions'
+    """
+    card_ids, board_list_ids, user_ids, named = set(), set(), set(), []
+    for operation in operations:
+        if not isinstance(operation, dict):
+            continue
+        for key, ids in (('card_id', card_ids), ('board_list_id', board_list_ids), ('user_id', user_ids)):
+            value = _batch_int(operation, key)
+            if value:
+                ids.add(value)
+                if key != 'user_id':
+                    named.append((Card if key == 'card_id' else BoardList, value))
+    for model, row_id in named:
+        if select_row_shard(model, row_id) is not None:
+            break
+
+    cards = {}
+    if card_ids:
+        cards = dict(db.session.query(Card.id, Card.board_list_id).filter(Card.id.in_(card_ids)))
+    board_list_ids.update(cards.values())
+
+    board_lists = {}
+    if board_list_ids:
+        rows = db.session.query(BoardList.id, BoardList.board_id, Board.name) \
+            .join(Board, BoardList.board_id == Board.id) \
+            .filter(BoardList.id.in_(board_list_ids))
+        board_lists = {board_list_id: (board_id, board_name) for board_list_id, board_id, board_name in rows}
+    _reject_other_shards({Card: card_ids - cards.keys(), BoardList: board_list_ids - board_lists.keys()})
+
+    users, members = set(), set()
+    user_ids.discard(-1)
+    if user_ids:
+        users = {user_id for user_id, in db.session.query(User.id).filter(User.id.in_(user_ids))}
+        board_ids = {board_id for board_id, _ in board_lists.values()}
+        if users and board_ids:
+            rows = db.session.query(board_users.c.board_id, board_users.c.user_id) \
+                .filter(board_users.c.board_id.in_(board_ids), board_users.c.user_id.in_(users))
+            members = set(rows)
+    positions = last_card_positions(list(board_lists))
+    return {'cards': cards, 'board_lists': board_lists, 'users': users, 'members': members, 'positions': positions}
+
+
+def _reject_other_shards(missing):
+    """
+    The _reject_other_shards function aborts with a 400 when a card or board list that a batch names, and that the
+    selected shard does not hold, is on another shard: a batch is applied in a single transaction on one shard.
+    Only ids missing from the selected shard are looked for, so batches of a single board cost nothing more.
+
+    :param missing: A dictionary of the ids of BoardList and Card missing from the selected shard
+    """
+    if shard_count() == 1 or not any(missing.values()):
+        return
+    selected = g.get('shard', 0)
+    for shard in range(shard_count()):
+        if shard == selected:
+            continue
+        with on_shard(shard):
+            found = any(ids and db.session.connection().scalar(
+                select(model.__table__.c.id).where(model.__table__.c.id.in_(ids)).limit(1)) is not None
+                for model, ids in missing.items())
+        if found:
+            abort(400, message="The batch spans shards. Send the operations of each board in a batch of its own.")
+
+
+def _append_position(context, board_list_id):
+    position = context['positions'][board_list_id] = key_between(context['positions'].get(board_list_id), None)
+    return position
+
+
+def validate_card_operation(operation, context):
+    """
+    The validate_card_operation function checks a single batch operation against the preloaded batch context,
+    applying the same rules and messages as the single card endpoints. The context is updated as operations are
+    validated, so later operations in the batch see the moves and deletes of earlier ones.
+
+    :param operation: The operation dictionary
+    :param context: The lookups returned by load_card_batch_context
+    :return: A tuple of the column values to write, the id of the affected board and an error tuple of message and
+             status; either the error or the other two are None
+    """
+    if not isinstance(operation, dict) or operation.get('op') not in CARD_BATCH_OPERATIONS:
+        return None, None, ({'op': f"Operation must be one of {', '.join(CARD_BATCH_OPERATIONS)}."}, 400)
+    op = operation['op']
+    values = {}
+    for key in ('card_id', 'board_list_id', 'user_id'):
+        if operation.get(key) is not None and _batch_int(operation, key) is None:
+            return None, None, ({key: f"invalid literal for int() with base 10: {operation[key]!r}"}, 400)
+
+    if op == 'create':
+        if not operation.get('name'):
+            return None, None, ({'name': "Name is required."}, 400)
+        if operation.get('board_list_id') is None:
+            return None, None, ({'board_list_id': "Board List ID is required."}, 400)
+        values['name'] = str(operation['name'])
+        values['description'] = None if operation.get('description') is None else str(operation['description'])
+        board_list_id = _batch_int(operation, 'board_list_id')
+        if board_list_id not in context['board_lists']:
+            return None, None, ("Board List not found.", 404)
+        values['board_list_id'] = board_list_id
+        values['position'] = _append_position(context, board_list_id)
+        board_id, board_name = context['board_lists'][board_list_id]
+    else:
+        if operation.get('card_id') is None:
+            return None, None, ({'card_id': "Card ID is required."}, 400)
+        card_id = _batch_int(operation, 'card_id')
+        if card_id not in context['cards']:
+            return None, None, ("Card not found.", 404)
+        values['id'] = card_id
+        board_id, board_name = context['board_lists'][context['cards'][card_id]]
+        if op == 'delete':
+            del context['cards'][card_id]
+            return values, board_id, None
+        if op == 'move' and operation.get('board_list_id') is None:
+            return None, None, ({'board_list_id': "Board List ID is required."}, 400)
+        if op == 'update':
+            if operation.get('name'):
+                values['name'] = str(operation['name'])
+            if operation.get('description'):
+                values['description'] = str(operation['description'])
+        board_list_id = _batch_int(operation, 'board_list_id')
+        if board_list_id:
+            if board_list_id not in context['board_lists']:
+                return None, None, ("Board List not found.", 404)
+            if context['board_lists'][board_list_id][0] != board_id:
+                return None, None, ('Cannot assign card to board list that is not in the same board', 500)
+            values['board_list_id'] = board_list_id
+            if board_list_id != context['cards'][card_id]:
+                values['position'] = _append_position(context, board_list_id)
+
+    user_id = _batch_int(operation, 'user_id') if op != 'move' else None
+    if user_id == -1 and op == 'update':
+        values['user_id'] = None
+    elif user_id:
+        if user_id not in context['users']:
+            return None, None, ("User not found.", 404)
+        if (board_id, user_id) not in context['members']:
+            return None, None, (f'Add user to {board_name} board to access within card', 500)
+        values['user_id'] = user_id
+    if 'board_list_id' in values and op != 'create':
+        context['cards'][values['id']] = values['board_list_id']
+    return values, board_id, None
+
+
+def export_board_rows(board_id, connection=None):
+    """
+    The export_board_rows function produces the records of a board export, in the order an import needs them: the
+    board, the users that are members of it or assigned to its cards, its board lists and their cards, with lists and
+    cards in position order. Each record is a dictionary whose 'type' is one of EXPORT_RECORD_TYPES and whose ids
+    are the ids of this database. Rows are read from streaming cursors EXPORT_CHUNK_SIZE at a time, so memory use
+    does not depend on the size of the board.
+
+    :param board_id: The id of the board
+    :param connection: The connection to read from, by default the one of the current session
+    :return: A generator of export records
+    """
+    connection = (connection or db.session.connection()).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    board_table, user_table = Board.__table__, User.__table__
+    board_list_table, card_table = BoardList.__table__, Card.__table__
+
+    for board in connection.execute(
+        select(board_table.c.id, board_table.c.name, board_table.c.privacy).where(board_table.c.id == board_id)
+    ):
+        yield {'type': 'board', 'id': board.id, 'name': board.name, 'privacy': board.privacy}
+
+    member = exists().where(board_users.c.board_id == board_id, board_users.c.user_id == user_table.c.id)
+    assigned = select(card_table.c.user_id) \
+        .join(board_list_table, card_table.c.board_list_id == board_list_table.c.id) \
+        .where(board_list_table.c.board_id == board_id)
+    for user in connection.execute(
+        select(user_table.c.id, user_table.c.name, user_table.c.email, member.label('member'))
+        .where(or_(member, user_table.c.id.in_(assigned)))
+        .order_by(user_table.c.id)
+    ):
+        yield {'type': 'user', 'id': user.id, 'name': user.name, 'email': user.email, 'member': bool(user.member)}
+
+    for board_list in connection.execute(
+        select(board_list_table.c.id, board_list_table.c.name, board_list_table.c.position)
+        .where(board_list_table.c.board_id == board_id)
+        .order_by(board_list_table.c.position, board_list_table.c.id)
+    ):
+        yield {'type': 'board_list', 'id': board_list.id, 'name': board_list.name, 'position': board_list.position}
+
+    for card in connection.execute(
+        select(card_table.c.id, card_table.c.board_list_id, card_table.c.name, card_table.c.description,
+               card_table.c.position, card_table.c.user_id)
+        .join(board_list_table, card_table.c.board_list_id == board_list_table.c.id)
+        .where(board_list_table.c.board_id == board_id)
+        .order_by(card_table.c.board_list_id, card_table.c.position, card_table.c.id)
+    ):
+        yield {'type': 'card', 'id': card.id, 'board_list_id': card.board_list_id, 'name': card.name,
+               'description': card.description, 'position': card.position, 'user_id': card.user_id}
+
+
+def _import_value(record, key, number, type=str, required=True):
+    """
+    The _import_value function reads one field of an import record.
+
+    :param record: The record dictionary
+    :param key: The name of the field
+    :param number: The line number of the record, for error messages
+    :param type: The type to convert the value to
+    :param required: Whether a missing or empty value is an error
+    :return: The converted value, or None when the field is missing and not required
+    :raises ValueError: If the field is required and missing, or cannot be converted
+    """
+    value = record.get(key)
+    if value is None or value == '':
+        if required:
+            raise ValueError(f"Line {number}: {key} is required.")
+        return None
+    if isinstance(value, (dict, list)) or (type is int and isinstance(value, (bool, float))):
+        raise ValueError(f"Line {number}: {key} must be a {type.__name__}.")
+    try:
+        return type(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Line {number}: {key} must be a {type.__name__}.")
+
+
+def import_board_rows(lines, name=None, connection=None):
+    """
+    The import_board_rows function creates a new board from the NDJSON lines of a board export. The records must
+    come in the order export_board_rows writes them. Users are matched by email and created when they do not exist,
+    and every id is remapped to the id of the new row. Records are written with bulk inserts of at most
+    IMPORT_CHUNK_SIZE rows as the lines are read, so memory use depends on the number of users and board lists but
+    not on the number of cards. The caller commits, or rolls back when a ValueError is raised.
+    When the app is sharded the board is placed on a shard like a board created through the API, users are written
+    to the directory and copied into the shard, and the lists and cards get ids from the shard's range.
+
+    :param lines: An iterable of NDJSON lines, as bytes or str
+    :param name: The name of the new board, by default the name of the exported board
+    :param connection: The connection to write everything to, by default the ones of the current session
+    :return: A dictionary with the id of the new board and the number of users created, board lists and cards
+    :raises ValueError: If a line is not a valid record, or a board with the same name already exists
+    """
+    given = connection
+    connection = connection or db.session.connection()
+    directory = given or directory_connection()
+    user_table, board_list_table, card_table = User.__table__, BoardList.__table__, Card.__table__
+    user_ids, board_list_ids, card_positions, list_position = {}, {}, {}, None
+    pending = {record_type: [] for record_type in EXPORT_RECORD_TYPES[1:]}
+    result = {'board_id': None, 'users_created': 0, 'board_lists': 0, 'cards': 0}
+
+    def write_users(records):
+        emails = {record['email'] for _, record in records}
+        existing = dict(directory.execute(
+            select(user_table.c.email, user_table.c.id).where(user_table.c.email.in_(emails))
+        ).all())
+        created = {}
+        for _, record in records:
+            if record['email'] not in existing:
+                created.setdefault(record['email'], record['name'])
+        if created:
+            new_ids = directory.scalars(
+                insert(user_table).returning(user_table.c.id, sort_by_parameter_order=True),
+                [{'name': user_name, 'email': email} for email, user_name in created.items()]
+            ).all()
+            existing.update(zip(created, new_ids))
+            result['users_created'] += len(created)
+        members = set()
+        for export_id, record in records:
+            user_ids[export_id] = existing[record['email']]
+            if record['member']:
+                members.add(existing[record['email']])
+        if given is None:
+            mirror_users({existing[record['email']] for _, record in records}, connection)
+        if members:
+            connection.execute(insert(board_users), [{'board_id': result['board_id'], 'user_id': user_id}
+                                                     for user_id in members])
+
+    def write_board_lists(records):
+        assign_ids(connection, board_list_table, [values for _, values in records])
+        new_ids = connection.scalars(
+            insert(board_list_table).returning(board_list_table.c.id, sort_by_parameter_order=True),
+            [values for _, values in records]
+        ).all()
+        board_list_ids.update(zip((export_id for export_id, _ in records), new_ids))
+        result['board_lists'] += len(records)
+
+    def write_cards(records):
+        assign_ids(connection, card_table, [values for _, values in records])
+        connection.execute(insert(card_table), [values for _, values in records])
+        result['cards'] += len(records)
+
+    writers = {'user': write_users, 'board_list': write_board_lists, 'card': write_cards}
+
+    def flush(record_type):
+        if pending[record_type]:
+            try:
+                writers[record_type](pending[record_type])
+            except exc.IntegrityError as error:
+                raise ValueError(f"Could not import the {record_type} records: {error.orig}.")
+            pending[record_type] = []
+
+    stage = None
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = loads(line)
+        except ValueError:
+            raise ValueError(f"Line {number} is not valid JSON.")
+        record_type = record.get('type') if isinstance(record, dict) else None
+        if record_type not in EXPORT_RECORD_TYPES:
+            raise ValueError(f"Line {number}: type must be one of {', '.join(EXPORT_RECORD_TYPES)}.")
+        if stage is None and record_type != 'board':
+            raise ValueError(f"Line {number}: the export must start with the board.")
+        if stage is not None and EXPORT_RECORD_TYPES.index(record_type) < EXPORT_RECORD_TYPES.index(stage):
+            raise ValueError(f"Line {number}: {record_type} records must come before {stage} records.")
+        if record_type == 'board' and stage is not None:
+            raise ValueError(f"Line {number}: an export holds a single board.")
+        if record_type != stage and stage in pending:
+            flush(stage)
+        stage = record_type
+
+        if record_type == 'board':
+            board_name = name or _import_value(record, 'name', number)
+            privacy = _import_value(record, 'privacy', number, required=False) or 'PUBLIC'
+            if privacy not in ('PUBLIC', 'PRIVATE'):
+                raise ValueError(f"Line {number}: privacy must be PUBLIC or PRIVATE.")
+            if board_name_exists(board_name, given):
+                raise ValueError(f"Board with name {board_name} already exists. Please choose a different name.")
+            values = {'name': board_name, 'privacy': privacy}
+            board_id = None if given is not None else place_board()
+            if board_id is not None:
+                values['id'] = board_id
+                connection = db.session.connection()
+            board_id = result['board_id'] = connection.scalar(
+                insert(Board.__table__).returning(Board.__table__.c.id), values
+            )
+            connection.execute(update(Board.__table__).where(Board.__table__.c.id == board_id)
+                               .values(url=f'http://localhost:5000/boards/{board_id}'))
+            continue
+
+        export_id = _import_value(record, 'id', number, type=int)
+        if record_type == 'user':
+            values = {'name': _import_value(record, 'name', number), 'email': _import_value(record, 'email', number),
+                      'member': bool(record.get('member', True))}
+        elif record_type == 'board_list':
+            list_position = _import_value(record, 'position', number, required=False) or \
+                key_between(list_position, None)
+            values = {'name': _import_value(record, 'name', number), 'board_id': result['board_id'],
+                      'position': list_position}
+        else:
+            board_list_id = board_list_ids.get(_import_value(record, 'board_list_id', number, type=int))
+            if board_list_id is None:
+                raise ValueError(f"Line {number}: the board list of the card is not in the export.")
+            user_id = _import_value(record, 'user_id', number, type=int, required=False)
+            if user_id is not None and user_id not in user_ids:
+                raise ValueError(f"Line {number}: the user of the card is not in the export.")
+            position = _import_value(record, 'position', number, required=False) or \
+                key_between(card_positions.get(board_list_id), None)
+            card_positions[board_list_id] = position
+            values = {'name': _import_value(record, 'name', number),
+                      'description': _import_value(record, 'description', number, required=False),
+                      'board_list_id': board_list_id, 'position': position,
+                      'user_id': None if user_id is None else user_ids[user_id]}
+        pending[record_type].append((export_id, values))
+        if len(pending[record_type]) >= IMPORT_CHUNK_SIZE:
+            flush(record_type)
+
+    if stage is None:
+        raise ValueError("The export holds no board.")
+    if stage in pending:
+        flush(stage)
+    return result